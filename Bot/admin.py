@@ -1,3 +1,16 @@
 from django.contrib import admin
 
 # Register your models here.
+from .models import RecoveryLeg, RecoverySequence
+
+
+class RecoveryLegInline(admin.TabularInline):
+    model = RecoveryLeg
+    extra = 0
+
+
+@admin.register(RecoverySequence)
+class RecoverySequenceAdmin(admin.ModelAdmin):
+    list_display = ("order_id", "pair", "side", "status", "created", "updated")
+    list_filter = ("status", "pair")
+    inlines = [RecoveryLegInline]
@@ -0,0 +1,149 @@
+import logging
+from collections import namedtuple
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .recorder import load_ticks
+from .strategy import BUY, legs_from_settings, order_tp_sl
+
+LOGGER = logging.getLogger()
+
+# Bybit taker fee, charged on entry and exit of every market order
+TAKER_FEE = 0.0006
+
+# First window scanned for a crossing; windows double up to the end of the series, so a crossing
+# close to the start costs a few thousand comparisons and a far one O(n) vectorized work
+FIRST_WINDOW = 4096
+
+# One market order of a sequence (the parent or a recovery leg) with its TP/SL bracket.
+# exit_index is -1 while the position is still open at the end of the data.
+Fill = namedtuple("Fill", ["side", "units", "entry_index", "entry_price", "exit_index", "exit_price", "tp", "sl"])
+
+
+# Historical prices as a float64 array: CSV or Parquet with a Price (ticks) or close (klines) column,
+# or a symbol directory written by the TickRecorder
+def load_prices(path, symbol=None):
+    path = Path(path)
+    if path.is_dir():
+        return np.ascontiguousarray(load_ticks(path)[1])
+    data = pd.read_parquet(path) if path.suffix == ".parquet" else pd.read_csv(path)
+    if symbol is not None and "Symbol" in data.columns:
+        data = data[data["Symbol"] == symbol]
+    column = next(c for c in ("Price", "price", "close", "Close") if c in data.columns)
+    return np.ascontiguousarray(data[column].to_numpy(dtype=np.float64))
+
+
+# Index of the first price at or after start that is <= level (below=True) or >= level, -1 if none
+def first_cross(prices, start, level, below):
+    size = FIRST_WINDOW
+    while start < len(prices):
+        window = prices[start:start + size]
+        hits = window <= level if below else window >= level
+        i = int(hits.argmax())
+        if hits[i]:
+            return start + i
+        start += size
+        size *= 2
+    return -1
+
+
+# Index of the first price at or after start that hits the TP or the SL of a position, -1 if none
+def first_exit(prices, start, side, tp, sl):
+    size = FIRST_WINDOW
+    while start < len(prices):
+        window = prices[start:start + size]
+        hits = (window >= tp) | (window <= sl) if side == BUY else (window <= tp) | (window >= sl)
+        i = int(hits.argmax())
+        if hits[i]:
+            return start + i
+        start += size
+        size *= 2
+    return -1
+
+
+def open_fill(prices, index, side, units, tp, sl):
+    exit_index = first_exit(prices, index + 1, side, tp, sl)
+    # Market exits fill at the tick that crossed the level
+    exit_price = float(prices[exit_index]) if exit_index >= 0 else float("nan")
+    return Fill(side, units, index, float(prices[index]), exit_index, exit_price, tp, sl)
+
+
+# Replays one sequence from start: the parent is a market order filled at prices[start], then each leg
+# fires on the first tick crossing its UnitPrice (Sell legs on price <= UnitPrice, Buy legs on
+# price >= UnitPrice), in order, exactly like RecoveryEngine.on_tick. Every order keeps its own TP/SL.
+# Like the engine the next leg stays armed once every position is closed; stop_when_flat drops the
+# pending legs then instead, as a trader cancelling them would.
+def run_sequence(prices, start, side, settings, stop_when_flat=False):
+    unit_price = float(prices[start])
+    tp, sl = order_tp_sl(side, unit_price, settings.tp_sl_ticks, settings.tick_price, settings.zone_divider)
+    fills = [open_fill(prices, start, side, settings.start_units, tp, sl)]
+    index = start
+    for leg in legs_from_settings(settings, side, unit_price):
+        trigger = first_cross(prices, index + 1, leg["UnitPrice"], below=leg["Side"] != BUY)
+        if trigger < 0:
+            break
+        exits = [fill.exit_index for fill in fills]
+        if stop_when_flat and -1 not in exits and max(exits) < trigger:
+            break
+        fills.append(open_fill(prices, trigger, leg["Side"], leg["Units"], leg["TP"], leg["SL"]))
+        index = trigger
+    return fills
+
+
+# Mark-to-market PnL, gross exposure (notional of the open positions) and drawdown of a sequence
+def sequence_stats(prices, start, side, fills, fee=TAKER_FEE):
+    exits = [fill.exit_index for fill in fills]
+    end = len(prices) - 1 if -1 in exits else max(exits)
+    span = prices[start:end + 1]
+    equity = np.zeros(len(span))
+    exposure = np.zeros(len(span))
+    for fill in fills:
+        sign = 1.0 if fill.side == BUY else -1.0
+        a = fill.entry_index - start
+        b = (fill.exit_index if fill.exit_index >= 0 else end) - start
+        equity[a:] -= fee * fill.units * fill.entry_price
+        equity[a:b + 1] += sign * fill.units * (span[a:b + 1] - fill.entry_price)
+        exposure[a:b] += fill.units * span[a:b]
+        if fill.exit_index >= 0:
+            equity[b + 1:] += sign * fill.units * (fill.exit_price - fill.entry_price)
+            equity[b:] -= fee * fill.units * fill.exit_price
+        else:
+            exposure[b] += fill.units * span[b]
+    drawdown = np.maximum.accumulate(np.maximum(equity, 0.0)) - equity
+    return {"Start": start, "End": end, "Side": side, "UnitPrice": float(prices[start]),
+            "Legs": len(fills) - 1, "Open": int(-1 in exits),
+            "PnL": round(float(equity[-1]), 6), "MaxExposure": round(float(exposure.max()), 6),
+            "MaxDrawdown": round(float(drawdown.max()), 6)}
+
+
+# Runs sequences back to back over the whole series: a new parent order is placed on the tick after
+# the previous sequence ended. Returns one row per sequence.
+def run_backtest(prices, settings, side=None, fee=TAKER_FEE, max_sequences=None, stop_when_flat=False):
+    prices = np.ascontiguousarray(prices, dtype=np.float64)
+    side = side or settings.side
+    rows = []
+    start = 0
+    while start < len(prices) - 1 and (max_sequences is None or len(rows) < max_sequences):
+        fills = run_sequence(prices, start, side, settings, stop_when_flat)
+        stats = sequence_stats(prices, start, side, fills, fee)
+        rows.append(stats)
+        if stats["Open"]:
+            break
+        start = stats["End"] + 1
+    return pd.DataFrame(rows, columns=["Start", "End", "Side", "UnitPrice", "Legs", "Open", "PnL", "MaxExposure", "MaxDrawdown"])
+
+
+# Totals over the sequences of run_backtest
+def summarize(results):
+    if results.empty:
+        return {"Sequences": 0, "PnL": 0.0, "WinRate": 0.0, "MaxExposure": 0.0, "MaxDrawdown": 0.0}
+    equity = results["PnL"].cumsum().to_numpy()
+    drawdown = np.maximum.accumulate(np.maximum(equity, 0.0)) - equity
+    return {"Sequences": len(results),
+            "PnL": round(float(results["PnL"].sum()), 6),
+            "WinRate": round(float((results["PnL"] > 0).mean()), 4),
+            "MaxExposure": round(float(results["MaxExposure"].max()), 6),
+            # Worst of the drawdowns within a sequence and across consecutive sequences
+            "MaxDrawdown": round(float(max(results["MaxDrawdown"].max(), drawdown.max())), 6)}
@@ -0,0 +1,50 @@
+import asyncio
+import logging
+import time
+
+LOGGER = logging.getLogger()
+
+
+# Wallet balance kept by the engine, refreshed from REST at most once per ttl seconds.
+# Concurrent readers of an expired balance share one in-flight fetch (single-flight), and the
+# wallet websocket topic pushes fresh values in between, so page loads rarely reach the exchange.
+# Must be used from the runtime loop.
+class BalanceCache:
+    def __init__(self, fetch, ttl=5.0):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.value = None
+        self.updated = None
+        self._inflight = None
+
+    def set(self, value, updated=None):
+        self.value = float(value)
+        self.updated = updated or time.time()
+
+    def fresh(self):
+        return self.updated is not None and time.time() - self.updated < self.ttl
+
+    def snapshot(self):
+        if self.updated is None:
+            return None
+        return {"balance": self.value, "updated": self.updated, "age": round(time.time() - self.updated, 3)}
+
+    async def get(self):
+        if self.fresh():
+            return self.snapshot()
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._refresh())
+        try:
+            await asyncio.shield(self._inflight)
+        except Exception as e:
+            if self.updated is None:
+                raise
+            # Serve the last known balance rather than failing the page
+            LOGGER.warning(f'Balance refresh failed, serving a {time.time() - self.updated:.0f}s old value: {e}')
+        return self.snapshot()
+
+    async def _refresh(self):
+        try:
+            self.set(await self.fetch())
+        finally:
+            self._inflight = None
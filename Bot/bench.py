@@ -0,0 +1,199 @@
+import contextlib
+import os
+import platform
+import random
+import time
+from unittest import mock
+from urllib.parse import urlencode
+
+from django.test import RequestFactory
+
+from . import views
+from .ipc import EngineClient
+from .paper import PaperExchange, paper_engine
+from .prices import PriceTick
+from .strategy import build_legs, get_tp_sl
+from .triggers import TriggerIndex
+
+SYMBOL = "SOLUSDT"
+PRICE = 40.0
+TICK_PRICE = 0.01
+
+# POST data of every trades() action, keyed by the action name used in the results
+TRADES_ACTIONS = {
+    "get": None,
+    "placeorder": {"placeorder": "", "Pair": SYMBOL, "Side": "Buy", "StartUnits": "1", "UnitPrice": str(PRICE), "TPSLTicks": "200",
+                   "ZoneDivider": "2", "TickPrice": str(TICK_PRICE), "Leverage": "10"},
+    "gettrades": {"gettrades": "", "Pair": SYMBOL},
+    "getorders": {"getorders": "", "Pair": SYMBOL},
+    "getpositions": {"getpositions": "", "Pair": SYMBOL},
+    "cancelorders": {"cancelorders": "", "Pair": SYMBOL},
+    "flattenall": {"flattenall": ""},
+}
+
+# Result fields where a higher value is better; for every other compared field lower is better
+HIGHER_IS_BETTER = {"per_second"}
+COMPARED = HIGHER_IS_BETTER | {"us_per_call", "ms_per_request"}
+
+
+def rate(count, seconds):
+    return {"count": count, "seconds": round(seconds, 6), "per_second": round(count / seconds, 1) if seconds else None}
+
+
+# Random walk of n prices around start, in whole ticks
+def walk(n, start=PRICE, tick=TICK_PRICE, seed=1):
+    generator = random.Random(seed)
+    prices, price = [], start
+    for _ in range(n):
+        price = round(max(tick, price + generator.choice((-1, 1)) * tick), 2)
+        prices.append(price)
+    return prices
+
+
+# Stream messages as pybit delivers them
+def book_messages(prices):
+    exchange = PaperExchange()
+    messages = []
+    exchange.subscribe("orderbook", messages.append)
+    for price in prices:
+        exchange.step(SYMBOL, price)
+    return messages
+
+
+def trade_messages(prices):
+    return [{"topic": f'trade.{SYMBOL}', "data": [{"symbol": SYMBOL, "price": str(price), "side": "Buy", "size": 1}]} for price in prices]
+
+
+def kline_messages(prices):
+    return [{"topic": f'candle.1.{SYMBOL}', "data": [{"close": price, "confirm": False}]} for price in prices]
+
+
+# Messages per second through a stream handler of the engine, from the websocket thread's call to
+# the end of the processing on the runtime loop
+def bench_stream(engine, handler, messages):
+    started = time.perf_counter()
+    for msg in messages:
+        handler(msg)
+    # The loop runs the handed over callbacks in order, so once this one ran every message is processed
+    engine.runtime.spawn(noop()).result()
+    return rate(len(messages), time.perf_counter() - started)
+
+
+async def noop():
+    pass
+
+
+# Trigger decisions per second of the RecoveryEngine with `armed` filled sequences.
+# The first legs sit a recovery zone (1.0) or more away on both sides, out of reach of the walk,
+# so every tick is a decision over all armed legs that fires nothing
+def bench_triggers(engine, armed, ticks):
+    recovery = engine.recovery
+    for i in range(armed):
+        side = "Buy" if i % 2 else "Sell"
+        offset = (1 + i % 50) * TICK_PRICE
+        unit_price = PRICE - offset if side == "Buy" else PRICE + offset
+        legs = build_legs(side, round(unit_price, 2), 1.0, 200, TICK_PRICE, 2, (1.5, 1.0, 1.5))
+        recovery.arm({"order_id": f'bench-{i}', "Pair": SYMBOL, "side": side, "order_status": "Filled"}, legs)
+    prices = [PRICE + (price - PRICE) / 100 for price in walk(ticks)]
+    started = time.perf_counter()
+    for seq, price in enumerate(prices):
+        recovery.on_tick(PriceTick(SYMBOL, price, 0.0, seq))
+    result = rate(ticks, time.perf_counter() - started)
+    result["armed"] = len(recovery.triggers)
+    recovery.disarm(SYMBOL)
+    return result
+
+
+# The same on a bare TriggerIndex: armed levels, every one crossed level re-armed
+def bench_trigger_index(armed, ticks):
+    index = TriggerIndex()
+    generator = random.Random(2)
+    for i in range(armed):
+        index.add(SYMBOL, "below" if i % 2 else "above", PRICE + generator.uniform(-5, 5), i)
+    prices = walk(ticks)
+    started = time.perf_counter()
+    crossed = 0
+    for price in prices:
+        fired = index.pop_crossed(SYMBOL, price)
+        crossed += len(fired)
+        for payload in fired:
+            index.add(SYMBOL, "below" if payload % 2 else "above", price + (-5 if payload % 2 else 5), payload)
+    result = rate(ticks, time.perf_counter() - started)
+    result.update(armed=len(index), crossed=crossed)
+    return result
+
+
+def bench_call(func, calls, *args):
+    started = time.perf_counter()
+    for _ in range(calls):
+        func(*args)
+    seconds = time.perf_counter() - started
+    return {"count": calls, "seconds": round(seconds, 6), "us_per_call": round(seconds / calls * 1e6, 3)}
+
+
+# Requests per second of the trades() view for one action, against the engine over IPC
+def bench_view(action, data, requests):
+    factory = RequestFactory()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        started = time.perf_counter()
+        for _ in range(requests):
+            # Url-encoded like the trades.html forms: the view reads request.body after request.POST
+            request = factory.get("/trades") if data is None else factory.post("/trades", urlencode(data),
+                                                                               content_type="application/x-www-form-urlencoded")
+            response = views.trades(request)
+            if response.status_code != 200:
+                raise RuntimeError(f'trades() {action} returned {response.status_code}')
+        seconds = time.perf_counter() - started
+    result = rate(requests, seconds)
+    result["ms_per_request"] = round(seconds / requests * 1000, 3)
+    return result
+
+
+# Run every benchmark offline against the paper exchange:
+# {"meta": {...}, "results": {"stream.orderbook25": {"count", "seconds", "per_second"}, ...}}
+# scale multiplies the default message and call counts (e.g. 0.01 for a smoke run), armed is the number of armed legs.
+def run_benchmarks(scale=1.0, armed=10000):
+    def size(n):
+        return max(10, int(n * scale))
+
+    results = {}
+    prices = walk(size(50000))
+    with paper_engine(Pairs=[SYMBOL]) as engine:
+        engine.exchange.step(SYMBOL, PRICE)
+        results["stream.orderbook25"] = bench_stream(engine, engine.handle_orderbook25, book_messages(prices[:size(20000)]))
+        results["stream.trade"] = bench_stream(engine, engine.handle_trade, trade_messages(prices))
+        results["stream.kline"] = bench_stream(engine, engine.handle_kline, kline_messages(prices))
+        results["triggers.recovery"] = bench_triggers(engine, armed, size(100000))
+        results["strategy.get_tp_sl"] = bench_call(get_tp_sl, size(200000), PRICE, 200, TICK_PRICE, 2)
+        results["strategy.build_legs"] = bench_call(build_legs, size(100000), "Buy", PRICE, 1.0, 200, TICK_PRICE, 2, (1.5, 1.0, 1.5))
+        results["strategy.build_legs12"] = bench_call(build_legs, size(100000), "Buy", PRICE, 1.0, 200, TICK_PRICE, 2, (1.5, 1.0) * 6)
+        engine.exchange.step(SYMBOL, PRICE)
+        client = EngineClient(f'127.0.0.1:{engine.server.sockets[0].getsockname()[1]}')
+        try:
+            with mock.patch.object(views, "engine", client):
+                for action, data in TRADES_ACTIONS.items():
+                    results[f'view.trades.{action}'] = bench_view(action, data, size(500))
+        finally:
+            client.close()
+    results["triggers.index"] = bench_trigger_index(armed, size(200000))
+    meta = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(), "machine": platform.machine(),
+            "scale": scale, "armed": armed}
+    return {"meta": meta, "results": results}
+
+
+# Benchmarks that got worse than the baseline by more than tolerance (0.2 = 20%):
+# [(name, field, baseline, current), ...]
+def compare(current, baseline, tolerance=0.2):
+    regressions = []
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if not before:
+            continue
+        for field in COMPARED & result.keys() & before.keys():
+            old, new = before[field], result[field]
+            if not old or new is None:
+                continue
+            worse = (old - new) / old if field in HIGHER_IS_BETTER else (new - old) / old
+            if worse > tolerance:
+                regressions.append((name, field, old, new))
+    return regressions
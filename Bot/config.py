@@ -0,0 +1,161 @@
+import copy
+import dataclasses
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from threading import Lock
+from types import MappingProxyType
+
+from .strategy import fit_zone_offsets
+
+LOGGER = logging.getLogger()
+
+PROJECT_ROOT = Path(os.path.abspath(os.path.dirname(__file__)))
+file_settings = str(PROJECT_ROOT / 'Settings.json')
+
+
+# Immutable, typed snapshot of the "Settings" section of Settings.json.
+# Item access (settings["Pairs"], settings.get("BalanceTTL", 5)) reads the raw values, so the
+# snapshot can be handed to templates and to code written against the plain dict.
+@dataclass(frozen=True)
+class BotSettings:
+    api_name: str
+    api_key: str
+    api_secret: str
+    pairs: tuple
+    side: str
+    start_units: float
+    unit_price: float
+    tp_sl_ticks: float
+    zone_divider: float
+    tick_price: float
+    leverage: float
+    base_times: tuple
+    zone_offsets: tuple
+    raw: MappingProxyType = field(repr=False)
+
+    @classmethod
+    def from_dict(cls, settings):
+        # BaseTimes lists the unit multiplier of every recovery leg, without it the three legs of BaseTimes1..3.
+        # ZoneOffsets lists the recovery zones between unit_price and every leg, missing entries get the default
+        base_times = settings.get("BaseTimes") or [settings.get(f'BaseTimes{index}', 1) for index in (1, 2, 3)]
+        base_times = tuple(float(times) for times in base_times)
+        return cls(
+            api_name=settings.get("APIName", ""),
+            api_key=settings.get("APIKey", ""),
+            api_secret=settings.get("APISecret", ""),
+            pairs=tuple(settings.get("Pairs", ())),
+            side=settings.get("Side", "Buy"),
+            start_units=float(settings.get("StartUnits", 0)),
+            unit_price=float(settings.get("UnitPrice", 0)),
+            tp_sl_ticks=float(settings.get("TPSLTicks", 0)),
+            zone_divider=float(settings.get("ZoneDivider", 1)),
+            tick_price=float(settings.get("TickPrice", 0)),
+            leverage=float(settings.get("Leverage", 1)),
+            base_times=base_times,
+            zone_offsets=fit_zone_offsets(len(base_times), settings.get("ZoneOffsets") or ()),
+            raw=MappingProxyType({key: tuple(value) if isinstance(value, list) else value for key, value in settings.items()}),
+        )
+
+    # dataclasses.replace() that also takes base_times1, base_times2... for a single leg multiplier
+    def replace(self, **changes):
+        base_times = list(changes.get("base_times", self.base_times))
+        for name in [name for name in changes if re.fullmatch(r'base_times\d+', name)]:
+            index = int(name[len("base_times"):])
+            if not 1 <= index <= len(base_times):
+                raise ValueError(f'{name}: the recovery ladder has {len(base_times)} legs')
+            base_times[index - 1] = float(changes.pop(name))
+        changes["base_times"] = tuple(base_times)
+        changes.setdefault("zone_offsets", self.zone_offsets)
+        changes["zone_offsets"] = fit_zone_offsets(len(changes["base_times"]), changes["zone_offsets"])
+        return dataclasses.replace(self, **changes)
+
+    @property
+    def recovery_zone_ticks(self):
+        return self.tp_sl_ticks / self.zone_divider
+
+    def __getitem__(self, key):
+        return self.raw[key]
+
+    def get(self, key, default=None):
+        return self.raw.get(key, default)
+
+    # Mutable copy of the raw settings, e.g. to build an update
+    def to_dict(self):
+        return {key: list(value) if isinstance(value, tuple) else copy.deepcopy(value) for key, value in self.raw.items()}
+
+
+# Settings.json loaded once and reloaded when the file changes.
+# get() hands out the current snapshot without touching the disk; at most once per check_interval
+# seconds it stats the file and swaps in a new snapshot if the mtime moved.
+class SettingsStore:
+    def __init__(self, path=file_settings, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = Lock()
+
+    def get(self):
+        if self._snapshot is None or time.monotonic() - self._checked >= self.check_interval:
+            self._check()
+        return self._snapshot
+
+    def _check(self):
+        with self._lock:
+            self._checked = time.monotonic()
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                self._write(default_settings())
+                mtime = os.stat(self.path).st_mtime_ns
+            if self._snapshot is not None and mtime == self._mtime:
+                return
+            with open(self.path, 'r') as f:
+                settings = json.load(f)["Settings"]
+            self._snapshot, self._mtime = BotSettings.from_dict(settings), mtime
+            LOGGER.info(f'Settings loaded from {self.path}')
+
+    # Write through a temporary file and an atomic rename, so a concurrent reader never sees a truncated file
+    def _write(self, settings):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix='.Settings.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({"Settings": settings}, f, indent=4)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def update(self, settings):
+        with self._lock:
+            self._write(settings)
+            self._snapshot, self._mtime = BotSettings.from_dict(settings), os.stat(self.path).st_mtime_ns
+            self._checked = time.monotonic()
+
+
+def default_settings():
+    return {
+        "APIName": "Please set your API Name",
+        "APIKey": "Please set your API Key",
+        "APISecret": "Please set your API Secret"}
+
+
+SETTINGS = SettingsStore()
+
+
+# Get settings from Setting.json file
+def get_settings():
+    return {"Settings": SETTINGS.get().to_dict()}
+
+
+def update_settings(settings):
+    LOGGER.info('Updating settings')
+    SETTINGS.update(settings)
+    LOGGER.info(f"Settings have been successfully updated: {settings}")
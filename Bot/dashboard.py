@@ -0,0 +1,85 @@
+import asyncio
+import logging
+
+LOGGER = logging.getLogger()
+
+# Order statuses of orders still working on the exchange
+OPEN_STATUSES = {"Created", "New", "PartiallyFilled", "Untriggered"}
+
+
+# Versioned snapshot of the engine's in-memory state for the live dashboards.
+# Every interval the providers (name -> callable returning plain, freshly built data) are read and
+# compared with the previous values; a section that changed gets the next version number and wakes
+# the waiting clients. A client asks for the sections changed since the version it last saw, so
+# the cost is one refresh per interval whatever the number of dashboards, and none of it reaches
+# the exchange. Must be used from the runtime loop.
+class Dashboard:
+    def __init__(self, providers, interval=0.25):
+        self.providers = providers
+        self.interval = interval
+        self.version = 0
+        self.sections = {}  # name -> (version, value)
+        self._changed = None
+        self._task = None
+
+    async def start(self):
+        self._changed = asyncio.get_running_loop().create_future()
+        self._task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                LOGGER.error(f'Dashboard refresh failed: {e}')
+            await asyncio.sleep(self.interval)
+
+    def refresh(self):
+        changed = False
+        for name, provider in self.providers.items():
+            value = provider()
+            if name not in self.sections or self.sections[name][1] != value:
+                self.version += 1
+                self.sections[name] = (self.version, value)
+                changed = True
+        if changed and self._changed is not None:
+            self._changed.set_result(self.version)
+            self._changed = asyncio.get_running_loop().create_future()
+
+    # Sections changed after version; everything when the version is unknown (e.g. an engine restart)
+    def since(self, version=0):
+        if version > self.version:
+            version = 0
+        return {"version": self.version, "sections": {name: value for name, (changed, value) in self.sections.items() if changed > version}}
+
+    # Long poll: wait up to `wait` seconds for a change after version, then return since(version)
+    async def wait(self, since=0, wait=15.0):
+        if 0 < since == self.version:
+            try:
+                await asyncio.wait_for(asyncio.shield(self._changed), wait)
+            except asyncio.TimeoutError:
+                pass
+        return self.since(since)
+
+
+# Working orders from the order and stop order streams: {order id: summary}
+class OpenOrders:
+    def __init__(self):
+        self.orders = {}
+
+    def on_order(self, msg):
+        for data in msg["data"]:
+            order_id = data.get("stop_order_id") or data["order_id"]
+            if data["order_status"] in OPEN_STATUSES:
+                self.orders[order_id] = {"Pair": data["symbol"], "Side": data["side"], "Type": data["order_type"],
+                                         "Price": data.get("price"), "Trigger": data.get("stop_px"), "Quantity": data["qty"],
+                                         "Status": data["order_status"], "TP": data.get("take_profit"), "SL": data.get("stop_loss")}
+            else:
+                self.orders.pop(order_id, None)
+
+    def snapshot(self):
+        return {order_id: dict(order) for order_id, order in self.orders.items()}
@@ -0,0 +1,501 @@
+import asyncio
+import logging
+import signal
+import time
+from threading import Event
+
+from pybit import usdt_perpetual
+
+from .balance import BalanceCache
+from .config import PROJECT_ROOT
+from .dashboard import Dashboard, OpenOrders
+from .fills import FillStore
+from .instruments import Instruments
+from .ipc import DEFAULT_ADDRESS, serve
+from .metrics import REGISTRY, WS_MESSAGE
+from .orderbook import OrderBooks
+from .orders import OrderOps
+from .paper import PaperExchange, PaperFeed, PaperHTTP, PaperWebSocket
+from .positions import PositionCache
+from .prices import get_price_cache
+from .recorder import TickRecorder
+from .recovery import RecoveryEngine
+from .rest import RestClient
+from .runtime import Runtime
+from .signals import SignalQueue, signal_link_id
+from .store import SequenceStore
+from .strategy import legs_from_settings, order_tp_sl
+
+LOGGER = logging.getLogger()
+
+# Seconds to wait for the position stream to confirm a leverage change before asking again,
+# and the longest wait between failed attempts (doubled from LEVERAGE_BACKOFF after every failure)
+LEVERAGE_CONFIRM = 60
+LEVERAGE_BACKOFF = 5
+LEVERAGE_MAX_BACKOFF = 3600
+
+
+# Long-running trading engine: the only process that talks to the exchange.
+# It owns the REST client, the websocket streams and the recovery state, and serves the
+# Django views over the local IPC channel (see ipc.py).
+class Engine:
+    def __init__(self, settings_store):
+        self.settings_store = settings_store
+        settings = settings_store.get()
+        self.address = settings.get("EngineAddress", DEFAULT_ADDRESS)
+        self.feed = None
+        if settings.get("Exchange", "bybit") == "paper":
+            # In-process simulated exchange, driven by PaperFeed or exchange.step()
+            self.exchange = PaperExchange(balance=settings.get("PaperBalance", 10000.0))
+            self.client = PaperHTTP(self.exchange, latency=float(settings.get("PaperLatency", 0.0)))
+            self.ws = PaperWebSocket(self.exchange)
+            if settings.get("PaperFeed"):
+                self.feed = PaperFeed(self.exchange, dict(settings["PaperFeed"]), rate=float(settings.get("PaperFeedRate", 10)), loop=True)
+        else:
+            self.exchange = None
+            self.client = usdt_perpetual.HTTP(endpoint='https://api-testnet.bybit.com', api_key=settings['APIKey'], api_secret=settings['APISecret'])
+            self.ws = usdt_perpetual.WebSocket(test=True, api_key=settings['APIKey'], api_secret=settings['APISecret'])
+        # Single event loop running the stream callbacks, the recovery state machines and the IPC server
+        self.runtime = Runtime()
+        # Prioritized, rate-limit aware scheduler in front of the REST client
+        self.rest = RestClient(self.client, self.runtime, order_workers=int(settings.get("MaxOrderConcurrency", 8)),
+                               workers=int(settings.get("MaxRESTConcurrency", 4)))
+        # Tick size and quantity step of every symbol, from the disk cache until the exchange is asked again
+        self.instruments = Instruments(settings.get("InstrumentCache", str(PROJECT_ROOT / "instruments.json")),
+                                       ttl=float(settings.get("InstrumentTTL", 86400)))
+        self.instruments.load()
+        self.instruments_task = None
+        # Concurrent order batches, cancels and flattening with per-call results and retries
+        self.orders = OrderOps(self.rest, instruments=self.instruments)
+        # Last price per symbol, published by the stream handlers and read by the recovery logic
+        self.price_cache = get_price_cache(settings, csv_dir=PROJECT_ROOT)
+        self.recovery_trades = {}
+        # L2 books of the subscribed pairs: reference price (mid) for the triggers and fill estimates
+        self.books = OrderBooks()
+        self.resyncing = set()
+        # Every tick of the subscribed pairs, buffered in memory and appended to hourly partitions
+        self.recorder = None
+        if settings.get("RecordTicks", True):
+            self.recorder = TickRecorder(settings.get("TickDirectory", str(PROJECT_ROOT / "ticks")))
+            self.price_cache.subscribe(self.recorder.on_tick)
+        # Recovery sequences are saved to the database in the background and re-armed on startup
+        self.store = SequenceStore() if settings.get("PersistSequences", True) else None
+        # Local trade history, synced incrementally on startup and on every execution
+        self.fills = FillStore(self.rest, self.runtime) if settings.get("SyncFills", True) else None
+        # Fires the recovery legs on price ticks and order stream updates
+        self.recovery = RecoveryEngine(rest=self.rest, recovery_trades=self.recovery_trades, runtime=self.runtime, store=self.store,
+                                       books=self.books, mode=settings.get("RecoveryMode", "client"), instruments=self.instruments)
+        self.price_cache.subscribe(self.recovery.on_tick)
+        # USDT wallet balance served to the views, fed by REST and the wallet stream
+        self.balance_cache = BalanceCache(self.fetch_balance, ttl=float(settings.get("BalanceTTL", 5)))
+        # Alerts from the signal webhook, acknowledged on arrival and placed by a few workers
+        self.signals = SignalQueue(self.handle_signal, maxsize=int(settings.get("SignalQueueSize", 1000)),
+                                   workers=int(settings.get("SignalWorkers", 8)))
+        # Positions kept by the private position stream: no position reads once a pair is known
+        self.positions = PositionCache()
+        self.leverage_pending = set()
+        # symbol -> (leverage requested, failed attempts, monotonic time before which it isn't asked again)
+        self.leverage_requests = {}
+        # Live state pushed to the dashboards: working orders come from the private order streams
+        self.open_orders = OpenOrders()
+        self.dashboard = Dashboard({
+            "balance": lambda: {"balance": self.balance_cache.value, "updated": self.balance_cache.updated},
+            "prices": lambda: {symbol: tick.price for symbol, tick in self.price_cache.all().items()},
+            "positions": self.positions.snapshot,
+            "orders": self.open_orders.snapshot,
+            "recovery": self.recovery.snapshot,
+        })
+        self.server = None
+        self.subscribed_pairs = set()
+        # Set once the websocket subscriptions are in place
+        self.connected = Event()
+        self.commands = {
+            "balance": self.balance,
+            "place_order": self.place_order,
+            "cancel_orders": self.cancel_orders,
+            "place_orders": self.orders.place_orders,
+            "flatten": self.flatten,
+            "query_active_order": self.query_active_order,
+            "user_trade_records": self.user_trade_records,
+            "my_position": self.my_position,
+            "recovery_status": self.recovery.status,
+            "rate_limits": self.rest.limits.as_dict,
+            "recorder_status": self.recorder_status,
+            "sync_fills": self.sync_fills,
+            "orderbook": self.orderbook,
+            "instrument": self.instrument_rules,
+            "metrics": REGISTRY.render,
+            "dashboard": self.dashboard.wait,
+            "signal": self.signals.submit,
+            "signal_status": self.signals.status,
+        }
+        self.runtime.on_startup(self.start_instruments)
+        self.runtime.on_startup(self.restore_sequences)
+        self.runtime.on_startup(self.start_server)
+        self.runtime.on_startup(self.start_streams)
+        self.runtime.on_startup(self.start_settings_watch)
+        self.runtime.on_startup(self.start_positions)
+        self.runtime.on_startup(self.dashboard.start)
+        self.runtime.on_startup(self.signals.start)
+        if self.fills is not None:
+            self.runtime.on_startup(self.start_fills)
+        if self.recorder is not None:
+            self.runtime.on_startup(self.recorder.start)
+        if self.feed is not None:
+            self.runtime.on_startup(self.feed.start)
+        # Shutdown hooks run in reverse order: the store is flushed last
+        self.runtime.on_shutdown(self.stop_store)
+        if self.feed is not None:
+            self.runtime.on_shutdown(self.stop_feed)
+        if self.recorder is not None:
+            self.runtime.on_shutdown(self.stop_recorder)
+        self.runtime.on_shutdown(self.stop_streams)
+        self.runtime.on_shutdown(self.dashboard.stop)
+        self.runtime.on_shutdown(self.signals.stop)
+        self.runtime.on_shutdown(self.stop_server)
+
+    # Run until SIGINT/SIGTERM
+    def run(self):
+        stopped = Event()
+        signal.signal(signal.SIGINT, lambda *args: stopped.set())
+        signal.signal(signal.SIGTERM, lambda *args: stopped.set())
+        self.runtime.start()
+        stopped.wait()
+        self.runtime.stop()
+
+    # Current settings snapshot, reloaded when Settings.json changes
+    @property
+    def settings(self):
+        return self.settings_store.get()
+
+    @property
+    def leverage(self):
+        return self.settings.leverage
+
+    # Ask the exchange for the instruments when the disk cache is missing or stale, in the background
+    async def start_instruments(self):
+        if self.instruments.stale():
+            self.instruments_task = asyncio.ensure_future(self.refresh_instruments())
+
+    async def refresh_instruments(self):
+        try:
+            symbols = (await self.rest.call("query_symbol"))["result"]
+            self.instruments.update(symbols)
+            await self.runtime.blocking(self.instruments.save)
+            LOGGER.info(f'{len(self.instruments)} instruments loaded from the exchange')
+        except Exception as e:
+            LOGGER.error(f'Loading the instruments failed: {e}')
+
+    # Instrument of a symbol, waiting for a refresh in progress when the symbol is not known yet
+    async def instrument(self, symbol):
+        if not self.instruments.known(symbol) and self.instruments_task is not None and not self.instruments_task.done():
+            await asyncio.shield(self.instruments_task)
+        return self.instruments.get(symbol)
+
+    # IPC: trading rules of a symbol, for the orders built by the views
+    async def instrument_rules(self, symbol):
+        return (await self.instrument(symbol)).as_dict()
+
+    async def restore_sequences(self):
+        if self.store is None:
+            return
+        self.recovery.restore(await self.runtime.blocking(self.store.load_open))
+        self.store.start()
+        await self.recovery.reconcile()
+
+    # Legs still being placed are saved before the final flush.
+    # The Django ORM refuses to run on the event loop thread
+    async def stop_store(self):
+        await self.rest.drain()
+        if self.store is not None:
+            await self.runtime.blocking(self.store.stop)
+
+    # Catch up on the fills made while the engine was down, in the background
+    async def start_fills(self):
+        for pair in self.settings.pairs:
+            self.fills.request(pair)
+
+    # Read the positions of the pairs once; the position stream keeps them from then on
+    async def start_positions(self):
+        async def seed():
+            for pair in self.settings.pairs:
+                try:
+                    await self.cached_positions(pair)
+                except Exception as e:
+                    LOGGER.error(f'Reading the positions of {pair} failed: {e}')
+        asyncio.ensure_future(seed())
+
+    async def stop_feed(self):
+        await self.runtime.blocking(self.feed.stop)
+
+    # Final flush of the buffered ticks, off the loop
+    async def stop_recorder(self):
+        await self.runtime.blocking(self.recorder.stop)
+
+    async def start_server(self):
+        self.server = await serve(self.commands, self.address)
+
+    async def stop_server(self):
+        self.server.close()
+        for writer in list(self.server.clients):
+            writer.close()
+        await self.server.wait_closed()
+
+    async def start_streams(self):
+        async def connect():
+            try:
+                await self.runtime.blocking(self.get_connected, list(self.settings.pairs))
+            except Exception as e:
+                LOGGER.error(f'Websocket connection failed: {e}')
+        # Connecting can take a while, don't hold the startup on it
+        asyncio.ensure_future(connect())
+
+    # Subscribe the pairs added to Settings.json while the engine is running
+    async def start_settings_watch(self):
+        async def watch():
+            while True:
+                await asyncio.sleep(self.settings_store.check_interval)
+                for pair in self.subscribed_pairs:
+                    self.check_leverage(pair)
+                added = [p for p in self.settings.pairs if p not in self.subscribed_pairs]
+                if added and self.subscribed_pairs:
+                    try:
+                        await self.runtime.blocking(self.subscribe_pairs, added)
+                    except Exception as e:
+                        LOGGER.error(f'Websocket subscription failed for {added}: {e}')
+        self.watch_task = asyncio.ensure_future(watch())
+
+    def stop_streams(self):
+        self.watch_task.cancel()
+        for connection in self.ws.active_connections:
+            connection.exit()
+
+    # Subscribe to the execution topics: pybit multiplexes every pair over one public connection
+    def get_connected(self, pairs):
+        self.subscribe_pairs(pairs)
+        # Fill status of the parent orders comes from the private order stream
+        self.ws.order_stream(self.handle_order)
+        # Conditional recovery legs fired by the exchange (RecoveryMode "exchange")
+        self.ws.stop_order_stream(self.handle_stop_order)
+        self.ws.wallet_stream(self.handle_wallet)
+        if self.fills is not None:
+            self.ws.execution_stream(self.handle_execution)
+        self.ws.position_stream(self.handle_position)
+        self.connected.set()
+        LOGGER.info(f'Websocket connected: {pairs}')
+
+    def subscribe_pairs(self, pairs):
+        # Subscribe to the topics
+        # self.ws.trade_stream(callback=self.handle_trade, symbol=pairs)
+        self.ws.orderbook_25_stream(callback=self.handle_orderbook25, symbol=pairs)
+        # self.ws.kline_stream(self.handle_kline, symbol=pairs, interval='1')
+        self.subscribed_pairs.update(pairs)
+
+    # The stream handlers run on the pybit websocket threads: they only parse the message
+    # and hand the work over to the runtime loop.
+    def handle_trade(self, msg):
+        trade_data = msg["data"][0]
+        LOGGER.info('Trade Data: %s', msg, extra={"event": "tick", "symbol": trade_data["symbol"]})
+        self.runtime.call_soon(self.price_cache.update, trade_data["symbol"], trade_data["price"])
+
+    def handle_orderbook25(self, msg):
+        # print(f'OrderBook Data: {msg}')
+        self.runtime.call_soon(self.timed, "orderbook", time.perf_counter(), self.on_orderbook, msg)
+
+    def handle_kline(self, msg):
+        symbol = str(msg["topic"]).split('.')[-1]
+        price = msg["data"][0]["close"]
+        LOGGER.info('Kline Data: {"Symbol": %s, "Price": %s}', symbol, price, extra={"event": "tick", "symbol": symbol})
+        self.runtime.call_soon(self.price_cache.update, symbol, price)
+
+    # On the loop: update the book and publish its mid as the pair's price
+    def on_orderbook(self, msg):
+        book = self.books.apply(msg)
+        if book is None:
+            symbol = msg["topic"].split(".")[-1]
+            if symbol not in self.resyncing:
+                self.resyncing.add(symbol)
+                asyncio.ensure_future(self.resync_book(symbol))
+            return
+        mid = book.mid
+        tick = self.price_cache.get(book.symbol)
+        if mid is not None and (tick is None or tick.price != mid):
+            self.price_cache.update(book.symbol, mid)
+
+    async def resync_book(self, symbol):
+        try:
+            snapshot = await self.rest.call("orderbook", symbol=symbol)
+            self.books.resync(symbol, snapshot["result"])
+        except Exception as e:
+            LOGGER.error(f'Order book resync failed for {symbol}: {e}')
+        finally:
+            self.resyncing.discard(symbol)
+
+    # Check on your order and position through WebSocket.
+    def handle_order(self, msg):
+        LOGGER.info('Order Status changed: %s', msg, extra={"event": "order"})
+        self.runtime.call_soon(self.timed, "order", time.perf_counter(), self.on_order, msg)
+
+    def handle_stop_order(self, msg):
+        LOGGER.info('Stop Order Status changed: %s', msg, extra={"event": "stop_order"})
+        self.runtime.call_soon(self.timed, "stop_order", time.perf_counter(), self.on_stop_order, msg)
+
+    def on_order(self, msg):
+        self.recovery.on_order(msg)
+        self.open_orders.on_order(msg)
+
+    def on_stop_order(self, msg):
+        self.recovery.on_stop_order(msg)
+        self.open_orders.on_order(msg)
+
+    # Check on your order and position through WebSocket.
+    def handle_position(self, msg):
+        self.runtime.call_soon(self.timed, "position", time.perf_counter(), self.on_position, msg)
+
+    def on_position(self, msg):
+        for symbol in self.positions.update(msg["data"]):
+            self.check_leverage(symbol)
+
+    # Change the leverage of a pair only when the exchange reports one different from Settings.json.
+    # The same leverage is asked again only once the confirmation wait or the backoff of its last
+    # failure is over, so a refused change doesn't hit the exchange on every settings check.
+    def check_leverage(self, symbol):
+        leverage, target = self.positions.leverage(symbol), float(self.leverage)
+        if leverage is None or leverage == target:
+            self.leverage_requests.pop(symbol, None)
+            return
+        if symbol in self.leverage_pending:
+            return
+        requested = self.leverage_requests.get(symbol)
+        if requested is not None and requested[0] == target and time.monotonic() < requested[2]:
+            return
+        self.leverage_pending.add(symbol)
+        asyncio.ensure_future(self.set_leverage(symbol, target))
+
+    def handle_execution(self, msg):
+        self.runtime.call_soon(self.timed, "execution", time.perf_counter(), self.fills.on_execution, msg)
+
+    def handle_wallet(self, msg):
+        self.runtime.call_soon(self.timed, "wallet", time.perf_counter(), self.balance_cache.set, msg["data"][0]["wallet_balance"])
+
+    # On the loop: run a stream callback and record the time since the message was received
+    def timed(self, topic, received, callback, *args):
+        try:
+            callback(*args)
+        finally:
+            WS_MESSAGE.since(received, topic)
+
+    async def set_leverage(self, symbol, leverage):
+        LOGGER.info(f'Setting Leverage {leverage} for: {symbol}')
+        requested = self.leverage_requests.get(symbol)
+        failures = requested[1] if requested is not None and requested[0] == leverage else 0
+        try:
+            await self.rest.call("set_leverage", symbol=symbol, buy_leverage=leverage, sell_leverage=leverage)
+            LOGGER.info(f'Leverage {leverage} has been set for: {symbol}')
+            self.leverage_requests[symbol] = (leverage, 0, time.monotonic() + LEVERAGE_CONFIRM)
+        except Exception as e:
+            backoff = min(LEVERAGE_BACKOFF * 2 ** failures, LEVERAGE_MAX_BACKOFF)
+            LOGGER.error(f'Setting Leverage {leverage} for {symbol} failed, next attempt in {backoff}s: {e}')
+            self.leverage_requests[symbol] = (leverage, failures + 1, time.monotonic() + backoff)
+        finally:
+            self.leverage_pending.discard(symbol)
+
+    # IPC commands
+
+    async def fetch_balance(self):
+        balance = await self.rest.call("get_wallet_balance", coin='USDT')
+        return balance["result"]["USDT"]["wallet_balance"]
+
+    # Cached USDT balance with its age in seconds
+    async def balance(self):
+        return await self.balance_cache.get()
+
+    # Place a parent order and arm its recovery legs, both on the symbol's price and quantity grid
+    async def place_order(self, order, legs):
+        instrument = await self.instrument(order["symbol"])
+        order, legs = instrument.order(order), instrument.legs(legs)
+        result = await self.rest.call("place_active_order", **order)
+        result = result["result"]
+        order = {"order_id": result["order_id"], "Pair": result["symbol"], "side": result["side"],
+                 "order_type": result["order_type"], "price": result["price"],
+                 "qty": result["qty"], "order_status": result["order_status"],
+                 "TP": result["take_profit"], "SL": result["stop_loss"],
+                 "created_time": result["created_time"]
+                 }
+        self.recovery_trades[order["Pair"]] = legs
+        self.recovery.arm(order, legs)
+        return order
+
+    # Market order of a webhook signal with its recovery legs, at the signal's UnitPrice or the last price.
+    # The order_link_id comes from the signal ID, so the exchange refuses a second order for the same signal
+    async def handle_signal(self, alert):
+        settings = self.settings
+        pair, side = alert["Pair"], alert["Side"]
+        unit_price = alert["UnitPrice"] or self.price_cache.price(pair)
+        if unit_price is None:
+            raise ValueError(f'No price for {pair} yet')
+        start_units = alert["StartUnits"] or settings.start_units
+        instrument = await self.instrument(pair)
+        take_profit, stop_loss = order_tp_sl(side, unit_price, settings.tp_sl_ticks, settings.tick_price, settings.zone_divider, instrument)
+        legs = legs_from_settings(settings, side, unit_price, start_units, instrument)
+        return await self.place_order({
+            "symbol": pair,
+            "side": side,
+            "order_type": "Market",
+            "qty": start_units,
+            "take_profit": take_profit,
+            "stop_loss": stop_loss,
+            "time_in_force": "GoodTillCancel",
+            "reduce_only": False,
+            "close_on_trigger": False,
+            "order_link_id": signal_link_id(alert["ID"])
+        }, legs)
+
+    # Cancel every order of a pair, close its position and disarm its recovery sequences
+    async def cancel_orders(self, pair):
+        LOGGER.info(f'Cancelling the active orders of {pair}')
+        self.recovery.disarm(pair)
+        return await self.orders.flatten_pair(pair, await self.cached_positions(pair))
+
+    # Cancel everything and close every position of the configured pairs, all pairs at once
+    async def flatten(self, pairs=None):
+        pairs = list(pairs or self.settings.pairs)
+        LOGGER.info(f'Flattening: {pairs}')
+        for pair in pairs:
+            self.recovery.disarm(pair)
+        return await self.orders.flatten(pairs, {pair: self.positions.get(pair) for pair in pairs if self.positions.known(pair)})
+
+    async def query_active_order(self, **kwargs):
+        return await self.rest.call("query_active_order", **kwargs)
+
+    async def user_trade_records(self, **kwargs):
+        return await self.rest.call("user_trade_records", **kwargs)
+
+    # Top of the book of a pair, with the estimated fill of a market order when side and units are given
+    def orderbook(self, symbol, depth=5, side=None, units=None):
+        book = self.books.get(symbol)
+        if book is None:
+            return None
+        top = book.top(depth)
+        if side and units:
+            top["estimate"] = book.estimate_fill(side, float(units))
+        return top
+
+    # Sync the stored fills of a pair now, e.g. before reading them
+    async def sync_fills(self, symbol):
+        if self.fills is not None:
+            await self.fills.request(symbol)
+
+    def recorder_status(self):
+        return self.recorder.status() if self.recorder is not None else None
+
+    # Positions of a pair in the my_position format, from the cache once it is known
+    async def my_position(self, symbol, **kwargs):
+        return {"result": await self.cached_positions(symbol)}
+
+    async def cached_positions(self, symbol):
+        if not self.positions.known(symbol):
+            result = await self.rest.call("my_position", symbol=symbol)
+            self.positions.seed(symbol, result["result"] or [])
+            self.check_leverage(symbol)
+        return self.positions.get(symbol)
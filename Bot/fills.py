@@ -0,0 +1,139 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+
+from django.core.paginator import Paginator
+from django.db.models import Max
+
+from .models import Fill
+
+LOGGER = logging.getLogger()
+
+
+def fill_from_record(record):
+    return Fill(exec_id=record["exec_id"], order_id=record["order_id"], symbol=record["symbol"], side=record["side"],
+                order_type=record["order_type"], price=float(record["exec_price"]), qty=float(record["exec_qty"]),
+                fee=float(record.get("exec_fee") or 0), trade_time_ms=int(record["trade_time_ms"]))
+
+
+# Local copy of the account's trade history, kept by the engine.
+# A sync only asks the exchange for the executions since the newest stored trade_time_ms, page by
+# page, and inserts them in bulk; executions already stored are skipped on their exec_id. Pairs are
+# synced on startup and again whenever the execution stream reports a fill, so the views can page
+# through the history straight from the database.
+# A window is at most max_pages pages; when the history doesn't fit, the sync goes on with the next
+# window back in time (end_time at the oldest execution fetched) until it reaches the oldest one.
+# Nothing is stored before the sync is complete, so a sync cut short leaves no gap behind the newest
+# stored execution: the next one starts over from the same point.
+# sync() runs on the runtime loop, the database work goes to the blocking executor.
+class FillStore:
+    def __init__(self, rest, runtime, page_size=200, max_pages=100):
+        self.rest = rest
+        self.runtime = runtime
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self._syncing = {}  # symbol -> running sync task
+        self._again = set()  # symbols with fills reported while their sync was running
+
+    # Fetch and store the new executions of a symbol, returns how many were stored
+    async def sync(self, symbol):
+        since = await self.runtime.blocking(self.last_time, symbol)
+        records = {}
+        end = None
+        while True:
+            window, complete = await self.window(symbol, since, end)
+            new = [record for record in window if record["exec_id"] not in records]
+            records.update((record["exec_id"], record) for record in new)
+            if complete:
+                break
+            if not new:
+                LOGGER.warning(f'More than {self.max_pages * self.page_size} fills of {symbol} at {end - 1}ms, the older ones are not synced')
+                break
+            # end_time one past the oldest execution: its millisecond is fetched again whether end_time is inclusive or not
+            end = min(int(record["trade_time_ms"]) for record in window) + 1
+        return await self.runtime.blocking(self.save, list(records.values()))
+
+    # Up to max_pages pages of executions from since to before end, newest first: (records, reached the oldest)
+    async def window(self, symbol, since, end):
+        records = []
+        for page in range(1, self.max_pages + 1):
+            kwargs = {"symbol": symbol, "page": page, "limit": self.page_size}
+            if since is not None:
+                kwargs["start_time"] = since
+            if end is not None:
+                kwargs["end_time"] = end
+            result = (await self.rest.call("user_trade_records", **kwargs))["result"]
+            data = (result or {}).get("data") or []
+            records.extend(data)
+            if len(data) < self.page_size:
+                return records, True
+        return records, False
+
+    # One sync per symbol at a time: a request during a sync schedules a single follow-up
+    def request(self, symbol):
+        if symbol in self._syncing:
+            self._again.add(symbol)
+            return self._syncing[symbol]
+        task = asyncio.ensure_future(self._run(symbol))
+        self._syncing[symbol] = task
+        return task
+
+    async def _run(self, symbol):
+        try:
+            while True:
+                try:
+                    stored = await self.sync(symbol)
+                    if stored:
+                        LOGGER.info(f'{stored} new fills stored for {symbol}')
+                except Exception as e:
+                    LOGGER.error(f'Syncing the fills of {symbol} failed: {e}')
+                if symbol not in self._again:
+                    return
+                self._again.discard(symbol)
+        finally:
+            del self._syncing[symbol]
+
+    # Callback of the execution stream, on the loop
+    def on_execution(self, msg):
+        for symbol in {data["symbol"] for data in msg["data"]}:
+            self.request(symbol)
+
+    def last_time(self, symbol):
+        return Fill.objects.filter(symbol=symbol).aggregate(last=Max("trade_time_ms"))["last"]
+
+    def save(self, records):
+        fills = {record["exec_id"]: fill_from_record(record) for record in records}
+        if not fills:
+            return 0
+        existing = set(Fill.objects.filter(exec_id__in=list(fills)).values_list("exec_id", flat=True))
+        Fill.objects.bulk_create([fill for exec_id, fill in fills.items() if exec_id not in existing], batch_size=500)
+        return len(fills) - len(existing)
+
+
+# Milliseconds of a datetime or ISO string, None for no bound (empty or malformed)
+def to_ms(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            LOGGER.warning(f'Ignoring the malformed date {value!r}')
+            return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1000)
+
+
+# One page of the stored fills, newest first, filtered by pair and time range (datetimes or ISO
+# strings, UTC when naive): (rows, page) where page is a django Page
+def fills_page(symbol=None, start=None, end=None, page=1, per_page=50):
+    fills = Fill.objects.order_by("-trade_time_ms", "-id")
+    if symbol:
+        fills = fills.filter(symbol=symbol)
+    if to_ms(start) is not None:
+        fills = fills.filter(trade_time_ms__gte=to_ms(start))
+    if to_ms(end) is not None:
+        fills = fills.filter(trade_time_ms__lt=to_ms(end))
+    page = Paginator(fills, per_page).get_page(page)
+    return [fill.as_row(number) for number, fill in enumerate(page, page.start_index())], page
@@ -0,0 +1,137 @@
+import json
+import logging
+import os
+import tempfile
+import time
+from decimal import Decimal
+
+import numpy as np
+
+LOGGER = logging.getLogger()
+
+# Price fields of an order, rounded to the tick size when set
+PRICE_FIELDS = ("price", "take_profit", "stop_loss", "stop_px", "base_price")
+
+
+def decimals(step):
+    return max(0, -Decimal(str(step)).normalize().as_tuple().exponent)
+
+
+# Trading rules of one symbol: tick size, quantity step and minimum quantity.
+# round_price() and round_qty() snap to the symbol's grid and take floats or NumPy arrays; the
+# decimals are worked out once, so the result prints like the exchange expects (0.5, not 0.5000000001).
+class Instrument:
+    def __init__(self, symbol, tick_size=0.01, qty_step=0.01, min_qty=0.0):
+        self.symbol = symbol
+        self.tick_size = float(tick_size)
+        self.qty_step = float(qty_step)
+        self.min_qty = float(min_qty)
+        self.price_decimals = decimals(tick_size)
+        self.qty_decimals = decimals(qty_step)
+
+    def __repr__(self):
+        return f'Instrument({self.symbol}, tick_size={self.tick_size}, qty_step={self.qty_step}, min_qty={self.min_qty})'
+
+    # Keyword arguments of Instrument, e.g. to hand it to the views
+    def as_dict(self):
+        return {"symbol": self.symbol, "tick_size": self.tick_size, "qty_step": self.qty_step, "min_qty": self.min_qty}
+
+    def round_price(self, price):
+        if isinstance(price, np.ndarray):
+            return np.round(np.round(price / self.tick_size) * self.tick_size, self.price_decimals)
+        return round(round(price / self.tick_size) * self.tick_size, self.price_decimals)
+
+    # Nearest step, and never below the minimum quantity unless zero
+    def round_qty(self, qty):
+        if isinstance(qty, np.ndarray):
+            rounded = np.round(np.round(qty / self.qty_step) * self.qty_step, self.qty_decimals)
+            return np.where(qty > 0, np.maximum(rounded, self.min_qty), rounded)
+        rounded = round(round(qty / self.qty_step) * self.qty_step, self.qty_decimals)
+        return max(rounded, self.min_qty) if qty > 0 else rounded
+
+    # Copy of the keyword arguments of an order call with its quantity and prices on the grid
+    def order(self, order):
+        order = dict(order)
+        if order.get("qty"):
+            order["qty"] = self.round_qty(float(order["qty"]))
+        for name in PRICE_FIELDS:
+            if order.get(name):
+                order[name] = self.round_price(float(order[name]))
+        return order
+
+    # Copy of recovery legs with their prices and units on the grid
+    def legs(self, legs):
+        return [dict(leg, UnitPrice=self.round_price(leg["UnitPrice"]), Units=self.round_qty(leg["Units"]),
+                     TP=self.round_price(leg["TP"]) if leg["TP"] else leg["TP"], SL=self.round_price(leg["SL"]) if leg["SL"] else leg["SL"])
+                for leg in legs]
+
+
+# Two decimals on prices and units, the rounding used before symbols had their own rules
+DEFAULT = Instrument("", tick_size=0.01, qty_step=0.01)
+
+
+# Instrument of an entry of the symbols endpoint (query_symbol)
+def instrument_from_symbol(data):
+    price_filter = data.get("price_filter") or {}
+    lot_size = data.get("lot_size_filter") or {}
+    return Instrument(data["name"], tick_size=price_filter.get("tick_size", DEFAULT.tick_size),
+                      qty_step=lot_size.get("qty_step", DEFAULT.qty_step), min_qty=lot_size.get("min_trading_qty", 0))
+
+
+# Instruments of every symbol of the exchange, kept in a JSON file next to the settings.
+# load() reads the file once on startup, so a cold start doesn't wait for the exchange; the
+# engine only calls the symbols endpoint when the file is missing or older than ttl seconds, then
+# update() swaps the instruments in and save() writes the file back. Symbols nobody knows about
+# get `default`. path None keeps the instruments in memory only.
+class Instruments:
+    def __init__(self, path=None, ttl=86400, default=DEFAULT):
+        self.path = path
+        self.ttl = ttl
+        self.default = default
+        self.instruments = {}
+        self.symbols = []
+        self.updated = None
+
+    def __len__(self):
+        return len(self.instruments)
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'r') as f:
+                cached = json.load(f)
+            self.update(cached["symbols"], cached["updated"])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            LOGGER.warning(f'Instrument cache {self.path} ignored: {e}')
+            return False
+        LOGGER.info(f'{len(self.instruments)} instruments loaded from {self.path}')
+        return True
+
+    # Write through a temporary file and an atomic rename, like the settings
+    def save(self):
+        if not self.path:
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), prefix='.instruments.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({"updated": self.updated, "symbols": self.symbols}, f)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    # symbols: the result of the symbols endpoint
+    def update(self, symbols, updated=None):
+        self.instruments = {data["name"]: instrument_from_symbol(data) for data in symbols}
+        self.symbols = list(symbols)
+        self.updated = updated if updated is not None else time.time()
+
+    def stale(self):
+        return self.updated is None or time.time() - self.updated > self.ttl
+
+    def known(self, symbol):
+        return symbol in self.instruments
+
+    def get(self, symbol):
+        return self.instruments.get(symbol, self.default)
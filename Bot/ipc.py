@@ -0,0 +1,111 @@
+import asyncio
+import json
+import logging
+import socket
+from threading import Lock
+
+LOGGER = logging.getLogger()
+
+DEFAULT_ADDRESS = "127.0.0.1:6001"
+
+
+class EngineUnavailable(Exception):
+    pass
+
+
+class EngineError(Exception):
+    pass
+
+
+def parse_address(address):
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+def dumps(message):
+    return (json.dumps(message, default=str) + "\n").encode("utf-8")
+
+
+# Engine side: serve newline-delimited JSON requests {"cmd": ..., "args": {...}} on the runtime loop.
+# Every connection (one per web worker) is handled by a coroutine, so no thread is spent per client.
+# server.clients holds the open connections, so a shutdown can close them instead of waiting on their reads.
+async def serve(commands, address=DEFAULT_ADDRESS):
+    clients = set()
+
+    async def handle(reader, writer):
+        clients.add(writer)
+        try:
+            while line := await reader.readline():
+                request = json.loads(line)
+                try:
+                    result = commands[request["cmd"]](**request.get("args", {}))
+                    if asyncio.iscoroutine(result):
+                        result = await result
+                    response = {"ok": True, "result": result}
+                except Exception as e:
+                    LOGGER.error(f'Engine command {request.get("cmd")} failed: {e}')
+                    response = {"ok": False, "error": f'{type(e).__name__}: {e}'}
+                writer.write(dumps(response))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            clients.discard(writer)
+            writer.close()
+
+    host, port = parse_address(address)
+    server = await asyncio.start_server(handle, host, port)
+    server.clients = clients
+    LOGGER.info(f'Engine listening on {address}')
+    return server
+
+
+# Web side: a persistent connection to the engine, shared by the threads of one worker process
+class EngineClient:
+    def __init__(self, address=DEFAULT_ADDRESS, timeout=30):
+        self.address = parse_address(address)
+        self.timeout = timeout
+        self._sock = None
+        self._file = None
+        self._lock = Lock()
+
+    def _connect(self):
+        self._sock = socket.create_connection(self.address, timeout=self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self._sock.makefile("rb")
+
+    def close(self):
+        if self._sock is not None:
+            self._file.close()
+            self._sock.close()
+        self._sock = self._file = None
+
+    def call(self, cmd, **args):
+        with self._lock:
+            # A connection kept from a previous request may have been closed by an engine restart:
+            # when writing the request fails it never reached the engine and is sent again on a fresh connection.
+            for retry in (self._sock is not None, False):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    self._sock.sendall(dumps({"cmd": cmd, "args": args}))
+                    break
+                except OSError as e:
+                    self.close()
+                    if not retry:
+                        raise EngineUnavailable(f'Trading engine is not reachable at {self.address[0]}:{self.address[1]}: {e}') from e
+            # Once the request is written the engine may have run it, never send it twice
+            try:
+                line = self._file.readline()
+                if not line:
+                    raise ConnectionError("Engine closed the connection")
+            except TimeoutError as e:
+                self.close()
+                raise EngineUnavailable(f'Trading engine did not answer {cmd} in {self.timeout}s') from e
+            except OSError as e:
+                self.close()
+                raise EngineUnavailable(f'Trading engine dropped {cmd}: {e}') from e
+        response = json.loads(line)
+        if not response["ok"]:
+            raise EngineError(response["error"])
+        return response["result"]
@@ -0,0 +1,163 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from threading import Thread
+
+import colorlog
+
+# Attributes of every LogRecord, anything else on a record came from extra={...}
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+# One JSON object per line: time, level, logger, source line, the message and the extra fields
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {"time": round(record.created, 6), "level": record.levelname, "logger": record.name,
+                 "line": f'{record.module}:{record.lineno}', "message": record.getMessage()}
+        entry.update({key: value for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+# Lets through at most one record per symbol and interval for high-frequency events:
+# LOGGER.debug("tick %s %s", symbol, price, extra={"event": "tick", "symbol": symbol})
+class SymbolSampler(logging.Filter):
+    def __init__(self, interval=1.0, events=("tick",)):
+        super().__init__()
+        self.interval = interval
+        self.events = set(events)
+        self._last = {}
+        self.dropped = 0
+
+    def filter(self, record):
+        event = getattr(record, "event", None)
+        if event not in self.events:
+            return True
+        key = (event, getattr(record, "symbol", None))
+        now = record.created
+        if now - self._last.get(key, 0.0) < self.interval:
+            self.dropped += 1
+            return False
+        self._last[key] = now
+        return True
+
+
+# Types of the arguments safe to format later on the listener thread
+IMMUTABLE = (str, bytes, int, float, bool, type(None))
+
+
+# Hands the record over as is when its arguments are immutable (ticks, prices, ids): the message is
+# only formatted by the listener thread, so the caller pays for a queue put, not for the string
+# formatting. A record with a mutable argument (an order or legs dict) is formatted right away, so
+# it shows the state at the time of the call.
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        args = record.args
+        if args and not all(isinstance(arg, IMMUTABLE) for arg in (args.values() if isinstance(args, dict) else args)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+# Rotating file handler that writes a whole batch of records with one write and one flush
+class BatchRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    def emit_batch(self, records):
+        lines = []
+        for record in records:
+            try:
+                lines.append(self.format(record) + self.terminator)
+            except Exception:
+                self.handleError(record)
+        if not lines:
+            return
+        self.acquire()
+        try:
+            if self.stream is None:
+                self.stream = self._open()
+            if self.maxBytes > 0 and self.stream.tell() + sum(len(line) for line in lines) >= self.maxBytes:
+                self.doRollover()
+            self.stream.write("".join(lines))
+            self.stream.flush()
+        finally:
+            self.release()
+
+
+# Background writer: blocks for the first record, drains up to batch_size more, then hands the batch
+# to every handler (emit_batch when it has one)
+class BatchQueueListener:
+    def __init__(self, records, *handlers, batch_size=512):
+        self.records = records
+        self.handlers = handlers
+        self.batch_size = batch_size
+        self._thread = None
+
+    def start(self):
+        self._thread = Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self.records.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = [self.records.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.records.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                stopping = True
+                batch = [record for record in batch if record is not None]
+            self.write(batch)
+
+    def write(self, batch):
+        for handler in self.handlers:
+            records = [record for record in batch if record.levelno >= handler.level and handler.filter(record)]
+            if not records:
+                continue
+            if hasattr(handler, "emit_batch"):
+                handler.emit_batch(records)
+            else:
+                for record in records:
+                    handler.handle(record)
+
+
+def configure(filename='app-log.log', level=logging.INFO, sample_interval=1.0):
+    console = colorlog.StreamHandler(sys.stdout)
+    console.setLevel(level)
+    # --> %(log_color)s is very important, that's what colors the line
+    console.setFormatter(colorlog.ColoredFormatter('[%(asctime)s,%(lineno)s] %(log_color)s[%(message)s]', log_colors={
+        'DEBUG': 'green',
+        'INFO': 'cyan',
+        'WARNING': 'yellow',
+        'ERROR': 'red',
+        'CRITICAL': 'bold_red',
+    }))
+    file = BatchRotatingFileHandler(filename, maxBytes=50 * 1024 * 1024, backupCount=1, delay=True)
+    file.setLevel(level)
+    file.setFormatter(JsonFormatter())
+    records = queue.SimpleQueue()
+    handler = LazyQueueHandler(records)
+    handler.addFilter(SymbolSampler(sample_interval))
+    root = logging.getLogger()
+    root.setLevel(level)
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    listener = BatchQueueListener(records, console, file)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+LISTENER = configure()
+LOGGER = logging.getLogger()
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Bot.backtest import load_prices, run_backtest, summarize
+from Bot.config import SETTINGS
+
+
+class Command(BaseCommand):
+    help = "Replay historical prices (CSV or Parquet) through the recovery-zone legs and report PnL per sequence"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or Parquet file with a Price or close column")
+        parser.add_argument("--symbol", help="Rows of this symbol only, when the file has a Symbol column")
+        parser.add_argument("--side", choices=["Buy", "Sell"], help="Parent order side, defaults to Settings.json")
+        parser.add_argument("--tp-sl-ticks", type=float)
+        parser.add_argument("--zone-divider", type=float)
+        parser.add_argument("--tick-price", type=float)
+        parser.add_argument("--base-times", type=float, nargs="+", metavar="BT", help="Unit multiplier of every recovery leg")
+        parser.add_argument("--zone-offsets", type=float, nargs="+", metavar="ZONES", help="Recovery zones between the unit price and every leg")
+        parser.add_argument("--stop-when-flat", action="store_true",
+                            help="Drop the pending legs once every position is closed, instead of keeping the next leg armed like the engine")
+        parser.add_argument("--output", help="Write the per-sequence results to this CSV file")
+
+    def handle(self, *args, **options):
+        settings = SETTINGS.get()
+        overrides = {name: options[name] for name in ("tp_sl_ticks", "zone_divider", "tick_price") if options[name] is not None}
+        if options["base_times"]:
+            overrides["base_times"] = tuple(options["base_times"])
+        if options["zone_offsets"]:
+            overrides["zone_offsets"] = tuple(options["zone_offsets"])
+        settings = settings.replace(**overrides)
+        prices = load_prices(options["path"], options["symbol"])
+        started = time.perf_counter()
+        results = run_backtest(prices, settings, side=options["side"], stop_when_flat=options["stop_when_flat"])
+        elapsed = time.perf_counter() - started
+        if options["output"]:
+            results.to_csv(options["output"], index=False)
+        self.stdout.write(results.to_string(index=False))
+        self.stdout.write(f'{summarize(results)}')
+        self.stdout.write(f'{len(prices)} prices replayed in {elapsed:.3f}s')
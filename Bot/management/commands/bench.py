@@ -0,0 +1,36 @@
+import json
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Bot import logs  # noqa: F401 (configures logging)
+from Bot.bench import compare, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = "Offline benchmarks against the paper exchange: stream handlers, trigger decisions, leg construction and the trades() view"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", type=float, default=1.0, help="Multiplier of the default sizes, e.g. 0.1 for a quick run")
+        parser.add_argument("--armed", type=int, default=10000, help="Armed legs of the trigger benchmarks")
+        parser.add_argument("--output", help="Write the JSON results to this file")
+        parser.add_argument("--baseline", help="JSON results of an earlier run: fail when a benchmark got slower")
+        parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown against the baseline (0.2 = 20%%)")
+        parser.add_argument("--verbose", action="store_true", help="Keep the INFO logs, and their cost, in the measurements")
+
+    def handle(self, *args, **options):
+        if not options["verbose"]:
+            logging.getLogger().setLevel(logging.WARNING)
+        results = run_benchmarks(scale=options["scale"], armed=options["armed"])
+        text = json.dumps(results, indent=4)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(text)
+        self.stdout.write(text)
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                regressions = compare(results, json.load(f), options["tolerance"])
+            for name, field, old, new in regressions:
+                self.stderr.write(f'{name} {field}: {old} -> {new}')
+            if regressions:
+                raise CommandError(f'{len(regressions)} benchmark(s) regressed by more than {options["tolerance"]:.0%}')
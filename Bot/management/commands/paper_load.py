@@ -0,0 +1,25 @@
+import json
+import logging
+
+from django.core.management.base import BaseCommand
+
+from Bot import logs  # noqa: F401 (configures logging)
+from Bot.paper import paper_engine, run_load_test
+
+
+class Command(BaseCommand):
+    help = "Load test the engine against the in-process paper exchange: place N sequences and fire all their legs"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sequences", type=int, default=1000)
+        parser.add_argument("--symbol", default="SOLUSDT")
+        parser.add_argument("--latency", type=float, default=0.0, help="Simulated REST latency in seconds")
+        parser.add_argument("--mode", choices=["client", "exchange"], default="client")
+        parser.add_argument("--verbose", action="store_true", help="Keep the INFO logs of every order")
+
+    def handle(self, *args, **options):
+        if not options["verbose"]:
+            logging.getLogger().setLevel(logging.WARNING)
+        with paper_engine(PaperLatency=options["latency"], Pairs=[options["symbol"]], RecoveryMode=options["mode"]) as engine:
+            result = run_load_test(engine, options["symbol"], options["sequences"])
+        self.stdout.write(json.dumps(result, indent=4))
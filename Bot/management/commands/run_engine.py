@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from Bot import logs  # noqa: F401 (configures logging)
+from Bot.config import SETTINGS
+from Bot.engine import Engine
+
+
+class Command(BaseCommand):
+    help = "Run the trading engine: exchange connections, websocket streams and recovery orders"
+
+    def handle(self, *args, **options):
+        Engine(SETTINGS).run()
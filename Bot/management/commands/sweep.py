@@ -0,0 +1,55 @@
+import csv
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from Bot.config import SETTINGS
+from Bot.sweep import PARAMETERS, Ranking, defaults, grid, leg_parameters, random_sample, share_prices, sweep
+
+
+class Command(BaseCommand):
+    help = "Backtest a grid (or a random sample) of recovery settings over several pairs in a process pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+", help="CSV, Parquet or .npy price files, the pair is taken from the file name")
+        # One option per leg of the ladder in Settings.json: --BaseTimes1, --BaseTimes2...
+        for name in list(PARAMETERS) + leg_parameters(SETTINGS.get()):
+            parser.add_argument(f'--{name}', type=float, nargs="+", help=f'{name} values, defaults to Settings.json')
+        parser.add_argument("--samples", type=int, help="Evaluate this many random combinations instead of the full grid")
+        parser.add_argument("--seed", type=int)
+        parser.add_argument("--workers", type=int)
+        parser.add_argument("--cache-dir", default=str(Path(tempfile.gettempdir()) / "recovery-sweep"),
+                            help="Where the memory-mapped price arrays are written")
+        parser.add_argument("--output", help="Stream every result row to this CSV file")
+        parser.add_argument("--top", type=int, default=20)
+
+    def handle(self, *args, **options):
+        settings = SETTINGS.get()
+        space = {name: options.get(name) or [value] for name, value in defaults(settings).items()}
+        combos = random_sample(space, options["samples"], options["seed"]) if options["samples"] else grid(space)
+        shared = share_prices({Path(path).stem: path for path in options["paths"]}, options["cache_dir"])
+        self.stdout.write(f'Sweeping {len(combos)} combinations over {list(shared)}')
+        ranking = Ranking(shared, top=options["top"])
+        output = open(options["output"], "w", newline="") if options["output"] else None
+        writer = None
+        started = time.perf_counter()
+        completed = 0
+        try:
+            for row in sweep(settings, shared, combos, workers=options["workers"]):
+                if output is not None:
+                    if writer is None:
+                        writer = csv.DictWriter(output, fieldnames=list(row))
+                        writer.writeheader()
+                    writer.writerow(row)
+                if ranking.add(row) is not None:
+                    completed += 1
+                    if completed % max(1, len(combos) // 10) == 0:
+                        self.stdout.write(f'{completed}/{len(combos)} combinations in {time.perf_counter() - started:.1f}s, '
+                                          f'best so far: {ranking.ranked()[0]}')
+        finally:
+            if output is not None:
+                output.close()
+        self.stdout.write(pd.DataFrame(ranking.ranked()).to_string(index=False))
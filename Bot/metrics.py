@@ -0,0 +1,85 @@
+import time
+from bisect import bisect_left
+from threading import Lock
+
+# Bucket upper bounds in seconds: 50us to 10s, roughly 2.5x apart
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Series:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+
+
+# Fixed-bucket histogram, optionally split by one label (e.g. the REST method).
+# observe() is a bisect over ~17 bounds and three increments under a lock, cheap enough to stay on
+# in production; cumulative counts are only computed when the metrics are scraped.
+class Histogram:
+    def __init__(self, name, help, label=None, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = Lock()
+
+    def observe(self, seconds, label=None):
+        i = bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                series = self._series[label] = _Series(len(self.buckets) + 1)
+            series.counts[i] += 1
+            series.sum += seconds
+            series.count += 1
+
+    # Observe the time elapsed since a time.perf_counter() reading
+    def since(self, started, label=None):
+        self.observe(time.perf_counter() - started, label)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {label: (list(s.counts), s.sum, s.count) for label, s in self._series.items()}
+        for label, (counts, total, count) in sorted(series.items(), key=lambda item: str(item[0])):
+            labels = f'{self.label}="{label}",' if self.label else ""
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{labels}le="{le}"}} {cumulative}')
+            labels = f'{{{labels.rstrip(",")}}}' if labels else ""
+            lines.append(f'{self.name}_sum{labels} {total}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return "\n".join(lines)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def histogram(self, name, help, label=None, buckets=LATENCY_BUCKETS):
+        if name not in self.metrics:
+            self.metrics[name] = Histogram(name, help, label, buckets)
+        return self.metrics[name]
+
+    # Prometheus text exposition format
+    def render(self):
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+
+REGISTRY = Registry()
+
+# Websocket message: from the pybit callback to the end of its processing on the runtime loop
+WS_MESSAGE = REGISTRY.histogram("recoverybot_ws_message_seconds", "Websocket message handling time, callback to processed", label="topic")
+# Crossed-level lookup and state update of the recovery engine for one tick
+TRIGGER_EVAL = REGISTRY.histogram("recoverybot_trigger_eval_seconds", "Recovery trigger evaluation time per tick")
+# Time a REST call waited in the scheduler queue, then spent on the exchange
+REST_QUEUE = REGISTRY.histogram("recoverybot_rest_queue_seconds", "REST call wait in the scheduler queue", label="method")
+REST_CALL = REGISTRY.histogram("recoverybot_rest_call_seconds", "REST call duration", label="method")
+# Recovery leg from the tick that crossed it to the exchange's answer
+ORDER_PLACEMENT = REGISTRY.histogram("recoverybot_order_placement_seconds", "Recovery leg placement, tick to acknowledgement")
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Bot', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecoveryLeg',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveSmallIntegerField()),
+                ('side', models.CharField(max_length=4)),
+                ('unit_price', models.FloatField()),
+                ('units', models.FloatField()),
+                ('tp', models.FloatField()),
+                ('sl', models.FloatField()),
+                ('triggered', models.BooleanField(default=False)),
+            ],
+            options={
+                'ordering': ['sequence', 'index'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RecoverySequence',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_id', models.CharField(max_length=64, unique=True)),
+                ('pair', models.CharField(max_length=32)),
+                ('side', models.CharField(max_length=4)),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Active', 'Active'), ('Done', 'Done'), ('Cancelled', 'Cancelled')], default='Pending', max_length=16)),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='date created')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='date updated')),
+            ],
+        ),
+        migrations.DeleteModel(
+            name='Greeting',
+        ),
+        migrations.AddIndex(
+            model_name='recoverysequence',
+            index=models.Index(fields=['pair', 'status'], name='Bot_recover_pair_8ef5e7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recoverysequence',
+            index=models.Index(fields=['status'], name='Bot_recover_status_7a45a1_idx'),
+        ),
+        migrations.AddField(
+            model_name='recoveryleg',
+            name='sequence',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='legs', to='Bot.recoverysequence'),
+        ),
+        migrations.AddConstraint(
+            model_name='recoveryleg',
+            constraint=models.UniqueConstraint(fields=('sequence', 'index'), name='unique_recovery_leg'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Bot', '0002_recovery_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Fill',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('exec_id', models.CharField(max_length=64, unique=True)),
+                ('order_id', models.CharField(max_length=64)),
+                ('symbol', models.CharField(max_length=32)),
+                ('side', models.CharField(max_length=4)),
+                ('order_type', models.CharField(max_length=16)),
+                ('price', models.FloatField()),
+                ('qty', models.FloatField()),
+                ('fee', models.FloatField(default=0)),
+                ('trade_time_ms', models.BigIntegerField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['symbol', 'trade_time_ms'], name='Bot_fill_symbol_6aad46_idx')],
+            },
+        ),
+    ]
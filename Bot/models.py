@@ -1,5 +1,79 @@
+from datetime import datetime, timezone
+
 from django.db import models
 
+
 # Create your models here.
-class Greeting(models.Model):
-    when = models.DateTimeField("date created", auto_now_add=True)
+# A parent order and its recovery legs, persisted so an engine restart can re-arm them
+class RecoverySequence(models.Model):
+    PENDING = "Pending"  # parent order placed, not filled yet
+    ACTIVE = "Active"  # parent filled, legs armed
+    DONE = "Done"  # every leg triggered
+    CANCELLED = "Cancelled"
+    OPEN_STATUSES = (PENDING, ACTIVE)
+    STATUS_CHOICES = [(status, status) for status in (PENDING, ACTIVE, DONE, CANCELLED)]
+
+    order_id = models.CharField(max_length=64, unique=True)
+    pair = models.CharField(max_length=32)
+    side = models.CharField(max_length=4)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    created = models.DateTimeField("date created", auto_now_add=True)
+    updated = models.DateTimeField("date updated", auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["pair", "status"]),
+            models.Index(fields=["status"]),
+        ]
+
+    def __str__(self):
+        return f'{self.pair} {self.side} {self.order_id} ({self.status})'
+
+
+class RecoveryLeg(models.Model):
+    sequence = models.ForeignKey(RecoverySequence, related_name="legs", on_delete=models.CASCADE)
+    index = models.PositiveSmallIntegerField()
+    side = models.CharField(max_length=4)
+    unit_price = models.FloatField()
+    units = models.FloatField()
+    tp = models.FloatField()
+    sl = models.FloatField()
+    triggered = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ["sequence", "index"]
+        constraints = [
+            models.UniqueConstraint(fields=["sequence", "index"], name="unique_recovery_leg"),
+        ]
+
+    # Leg dictionary as used by the recovery engine and recovery_trades
+    def as_leg(self):
+        return {"Side": self.side, "Triggered": self.triggered, "UnitPrice": self.unit_price,
+                "Units": self.units, "TP": self.tp, "SL": self.sl}
+
+
+# One execution of the account, synced from user_trade_records (see fills.py)
+class Fill(models.Model):
+    exec_id = models.CharField(max_length=64, unique=True)
+    order_id = models.CharField(max_length=64)
+    symbol = models.CharField(max_length=32)
+    side = models.CharField(max_length=4)
+    order_type = models.CharField(max_length=16)
+    price = models.FloatField()
+    qty = models.FloatField()
+    fee = models.FloatField(default=0)
+    trade_time_ms = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["symbol", "trade_time_ms"]),
+        ]
+
+    def __str__(self):
+        return f'{self.symbol} {self.side} {self.qty}@{self.price} ({self.exec_id})'
+
+    # Row of the trades tables
+    def as_row(self, number):
+        return {"Order No": number, "Order ID": self.order_id, "Pair": self.symbol, "Side": self.side,
+                "Order Type": self.order_type, "Price": self.price, "Quantity": self.qty, "Fee": self.fee,
+                "Trade Time": datetime.fromtimestamp(self.trade_time_ms / 1000, tz=timezone.utc)}
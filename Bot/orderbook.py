@@ -0,0 +1,152 @@
+import logging
+from bisect import bisect_left, insort
+
+LOGGER = logging.getLogger()
+
+
+class OutOfSync(Exception):
+    pass
+
+
+# Level 2 book of one symbol, kept from the orderBookL2_25 snapshot and delta messages.
+# Each side is an ascending list of prices plus a price -> size dict, so an update is a bisect and
+# the best levels are read from the ends of the lists in O(1). Bybit entry ids are mapped to their
+# price, deletes may come without one.
+class OrderBook:
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.prices = {"Buy": [], "Sell": []}
+        self.sizes = {"Buy": {}, "Sell": {}}
+        self.ids = {}
+        self.seq = None
+        self.timestamp = None
+        self.synced = False
+
+    def snapshot(self, entries, seq=None, timestamp=None):
+        self.prices = {"Buy": [], "Sell": []}
+        self.sizes = {"Buy": {}, "Sell": {}}
+        self.ids = {}
+        for entry in entries:
+            self._set(entry)
+        self.prices = {side: sorted(sizes) for side, sizes in self.sizes.items()}
+        self.seq, self.timestamp = seq, timestamp
+        self.synced = True
+        self._check()
+
+    # Raises OutOfSync when the delta can't be applied: the caller resyncs from a snapshot
+    def delta(self, data, seq=None, timestamp=None):
+        if not self.synced:
+            raise OutOfSync(f'{self.symbol} book has no snapshot')
+        if seq is not None and self.seq is not None and seq <= self.seq:
+            return False  # already applied
+        for entry in data.get("delete", ()):
+            price = self.ids.pop(entry.get("id"), None)
+            price = float(entry["price"]) if price is None and "price" in entry else price
+            if price is None or self.sizes[entry["side"]].pop(price, None) is None:
+                self.synced = False
+                raise OutOfSync(f'{self.symbol} delete of unknown level {entry}')
+            self._remove(entry["side"], price)
+        for entry in list(data.get("update", ())) + list(data.get("insert", ())):
+            price = float(entry["price"])
+            if price not in self.sizes[entry["side"]]:
+                insort(self.prices[entry["side"]], price)
+            self._set(entry)
+        self.seq, self.timestamp = seq, timestamp
+        self._check()
+        return True
+
+    def _set(self, entry):
+        price = float(entry["price"])
+        self.sizes[entry["side"]][price] = float(entry["size"])
+        if "id" in entry:
+            self.ids[entry["id"]] = price
+
+    def _remove(self, side, price):
+        prices = self.prices[side]
+        i = bisect_left(prices, price)
+        if i < len(prices) and prices[i] == price:
+            del prices[i]
+
+    def _check(self):
+        bid, ask = self.best_bid, self.best_ask
+        if bid is not None and ask is not None and bid >= ask:
+            self.synced = False
+            raise OutOfSync(f'{self.symbol} book crossed: bid {bid} >= ask {ask}')
+
+    @property
+    def best_bid(self):
+        bids = self.prices["Buy"]
+        return bids[-1] if bids else None
+
+    @property
+    def best_ask(self):
+        asks = self.prices["Sell"]
+        return asks[0] if asks else None
+
+    @property
+    def mid(self):
+        bid, ask = self.best_bid, self.best_ask
+        return (bid + ask) / 2 if bid is not None and ask is not None else None
+
+    @property
+    def spread(self):
+        bid, ask = self.best_bid, self.best_ask
+        return ask - bid if bid is not None and ask is not None else None
+
+    # Average price and filled quantity of a market order of units on side, walking the book
+    def estimate_fill(self, side, units):
+        levels = self.prices["Sell"] if side == "Buy" else reversed(self.prices["Buy"])
+        sizes = self.sizes["Sell"] if side == "Buy" else self.sizes["Buy"]
+        filled, cost = 0.0, 0.0
+        for price in levels:
+            take = min(sizes[price], units - filled)
+            filled += take
+            cost += take * price
+            if filled >= units:
+                break
+        return (cost / filled if filled else None), filled
+
+    def top(self, depth=5):
+        return {"bids": [(price, self.sizes["Buy"][price]) for price in reversed(self.prices["Buy"][-depth:])],
+                "asks": [(price, self.sizes["Sell"][price]) for price in self.prices["Sell"][:depth]],
+                "best_bid": self.best_bid, "best_ask": self.best_ask, "mid": self.mid, "spread": self.spread,
+                "seq": self.seq, "synced": self.synced}
+
+
+# Books of every subscribed symbol, fed with the raw websocket messages
+class OrderBooks:
+    def __init__(self):
+        self.books = {}
+        self.resyncs = 0
+
+    def get(self, symbol):
+        return self.books.get(symbol)
+
+    # Apply an orderBookL2_25 message; returns the book, or None when it is out of sync and needs a snapshot
+    def apply(self, msg):
+        symbol = msg["topic"].split(".")[-1]
+        book = self.books.get(symbol)
+        if book is None:
+            book = self.books[symbol] = OrderBook(symbol)
+        seq, timestamp = msg.get("cross_seq"), msg.get("timestamp_e6")
+        data = msg["data"]
+        try:
+            if msg.get("type") == "delta":
+                book.delta(data, seq, timestamp)
+            else:
+                # pybit hands over the whole book as a list, the raw snapshot nests it under order_book
+                book.snapshot(data if isinstance(data, list) else data.get("order_book") or data.get("orderBook") or [], seq, timestamp)
+        except OutOfSync as e:
+            LOGGER.warning(f'{e}, resyncing')
+            self.resyncs += 1
+            return None
+        return book
+
+    # Reset a book from the REST L2 snapshot (list of entries)
+    def resync(self, symbol, entries):
+        book = self.books.setdefault(symbol, OrderBook(symbol))
+        try:
+            book.snapshot(entries)
+        except OutOfSync as e:
+            LOGGER.warning(f'{e}')
+        return book
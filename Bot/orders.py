@@ -0,0 +1,80 @@
+import asyncio
+import logging
+import uuid
+
+import requests
+from pybit.exceptions import FailedRequestError, InvalidRequestError
+
+LOGGER = logging.getLogger()
+
+# Calls placing an order: quantity and prices are put on the symbol's grid first
+ORDER_METHODS = {"place_active_order", "place_conditional_order"}
+
+# Bybit codes worth retrying: too many visits, rate limit, server busy / timeout
+RETRY_CODES = {10002, 10006, 10016, 10018, 30034}
+
+
+def retryable(error):
+    if isinstance(error, (FailedRequestError, requests.ConnectionError, requests.Timeout)):
+        return True
+    return isinstance(error, InvalidRequestError) and error.status_code in RETRY_CODES
+
+
+# Order operations over the RestClient: every call of a batch is submitted at once, so a batch
+# costs one round trip (bounded by the order lane workers) instead of one per call, and each call
+# gets its own result: {"ok": True, "result": ...} or {"ok": False, "error": "..."}.
+# Failed calls are retried with a backoff when the error is transient; placed orders always carry
+# an order_link_id so a retry can't open the same order twice. With instruments (see instruments.py)
+# orders are rounded to their symbol's tick size and quantity step, so they aren't refused for it.
+class OrderOps:
+    def __init__(self, rest, retries=2, backoff=0.2, instruments=None):
+        self.rest = rest
+        self.instruments = instruments
+        self.retries = retries
+        self.backoff = backoff
+
+    async def call(self, method, **kwargs):
+        if method == "place_active_order":
+            kwargs.setdefault("order_link_id", uuid.uuid4().hex)
+        if method in ORDER_METHODS and self.instruments is not None:
+            kwargs = self.instruments.get(kwargs["symbol"]).order(kwargs)
+        for attempt in range(self.retries + 1):
+            try:
+                return {"ok": True, "result": (await self.rest.call(method, **kwargs)).get("result"), "attempts": attempt + 1}
+            except Exception as e:
+                if attempt == self.retries or not retryable(e):
+                    LOGGER.error(f'{method} failed for {kwargs.get("symbol")}: {e}')
+                    return {"ok": False, "error": str(e), "attempts": attempt + 1}
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    # Run [(method, kwargs), ...] concurrently, results in the same order
+    async def batch(self, calls):
+        return await asyncio.gather(*(self.call(method, **kwargs) for method, kwargs in calls))
+
+    # Market orders with TP/SL, e.g. the legs of a sequence
+    async def place_orders(self, orders):
+        return await self.batch([("place_active_order", order) for order in orders])
+
+    # Cancel every order of a pair and close its position.
+    # Cancels and the position read go out together; the reduce-only close orders follow, so a pair
+    # takes two round trips. With positions given (e.g. from the position stream) the read is skipped.
+    async def flatten_pair(self, pair, positions=None):
+        calls = [("cancel_all_active_orders", {"symbol": pair}), ("cancel_all_conditional_orders", {"symbol": pair})]
+        if positions is None:
+            calls.append(("my_position", {"symbol": pair}))
+        results = await self.batch(calls)
+        if positions is None:
+            read = results.pop()
+            if not read["ok"]:
+                return {"cancel": results, "close": [read]}
+            positions = read["result"] or []
+        closes = [{"symbol": pair, "side": "Buy" if p["side"] == "Sell" else "Sell", "order_type": "Market",
+                   "qty": p["size"], "time_in_force": "ImmediateOrCancel", "reduce_only": True, "close_on_trigger": True}
+                  for p in (positions if isinstance(positions, list) else [positions]) if float(p["size"]) > 0]
+        return {"cancel": results, "close": await self.place_orders(closes)}
+
+    # Flatten many pairs at once: {pair: {"cancel": [...], "close": [...]}}
+    async def flatten(self, pairs, positions=None):
+        positions = positions or {}
+        results = await asyncio.gather(*(self.flatten_pair(pair, positions.get(pair)) for pair in pairs))
+        return dict(zip(pairs, results))
@@ -0,0 +1,449 @@
+import json
+import logging
+import os
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from itertools import count
+from threading import Event, RLock, Thread
+
+from pybit.exceptions import InvalidRequestError
+
+from .backtest import load_prices
+from .config import SETTINGS, SettingsStore
+from .instruments import decimals
+from .strategy import build_legs
+
+LOGGER = logging.getLogger()
+
+
+def now_iso():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def response(result):
+    return {"ret_code": 0, "ret_msg": "OK", "ext_code": "", "result": result, "time_now": f'{time.time():.6f}'}
+
+
+def invalid(message, code=10001):
+    return InvalidRequestError(request="paper", message=message, status_code=code, time=f'{time.time():.0f}')
+
+
+def paper_symbol(name, tick_size, qty_step, min_qty):
+    return {"name": name, "alias": name, "status": "Trading", "base_currency": name[:-4], "quote_currency": "USDT",
+            "price_scale": decimals(tick_size), "price_filter": {"min_price": str(tick_size), "max_price": "999999", "tick_size": str(tick_size)},
+            "lot_size_filter": {"max_trading_qty": 1000000, "min_trading_qty": min_qty, "qty_step": qty_step}}
+
+
+# Symbols of the paper exchange, with the trading rules of the live ones
+PAPER_SYMBOLS = [paper_symbol("BTCUSDT", 0.5, 0.001, 0.001), paper_symbol("SOLUSDT", 0.01, 0.1, 0.1),
+                 paper_symbol("BATUSDT", 0.0001, 0.1, 0.1)]
+
+
+def on_grid(value, step):
+    return abs(value / step - round(value / step)) < 1e-6
+
+
+# Simulated USDT perpetual exchange (hedge mode: one Buy and one Sell position per symbol).
+# Prices come from step()/PaperFeed; on every price the book around it is republished and
+# resting limit orders, untriggered conditional orders and position TP/SL are matched against it.
+# Market orders fill at the best ask (Buy) or best bid (Sell), half a spread away from the price.
+# Events are collected under the lock and delivered to the stream callbacks after it is released,
+# on the thread that caused them, like pybit does on its websocket threads.
+# Orders on the symbols of `symbols` (the symbols endpoint format) are refused when their quantity or
+# prices are off the symbol's grid, like the exchange does.
+class PaperExchange:
+    def __init__(self, balance=10000.0, fee=0.0006, tick_size=0.01, spread_ticks=1, depth=25, level_size=1000.0, symbols=PAPER_SYMBOLS):
+        self.balance = float(balance)
+        self.fee = fee
+        self.tick_size = tick_size
+        self.spread_ticks = spread_ticks
+        self.depth = depth
+        self.level_size = level_size
+        self.symbols = {data["name"]: data for data in symbols}
+        self.prices = {}
+        self.positions = defaultdict(lambda: {side: {"size": 0.0, "entry_price": 0.0, "take_profit": 0.0, "stop_loss": 0.0, "leverage": 10.0}
+                                              for side in ("Buy", "Sell")})
+        self.orders = {}  # resting limit orders
+        self.conditional = {}  # untriggered conditional orders
+        self.link_ids = set()
+        self.trades = defaultdict(list)
+        self.listeners = defaultdict(list)  # topic -> [(callback, symbols)]
+        self._seq = count(1)
+        self._lock = RLock()
+
+    def subscribe(self, topic, callback, symbols=None):
+        self.listeners[topic].append((callback, set(symbols) if symbols else None))
+
+    def _emit(self, events):
+        for topic, symbol, msg in events:
+            for callback, symbols in self.listeners.get(topic, ()):
+                if symbols is None or symbol in symbols:
+                    callback(msg)
+
+    def best(self, symbol):
+        price = self.prices[symbol]
+        half = self.spread_ticks * self.tick_size / 2
+        return round(price - half, 8), round(price + half, 8)
+
+    # Publish a new price and match everything against it
+    def step(self, symbol, price):
+        events = []
+        with self._lock:
+            self.prices[symbol] = float(price)
+            events.append(("orderbook", symbol, self._book_message(symbol)))
+            self._match(symbol, events)
+        self._emit(events)
+
+    def _book_message(self, symbol):
+        bid, ask = self.best(symbol)
+        entries = []
+        for i in range(self.depth):
+            for side, price in (("Buy", bid - i * self.tick_size), ("Sell", ask + i * self.tick_size)):
+                entries.append({"price": f'{price:.8f}'.rstrip("0").rstrip("."), "symbol": symbol,
+                                "id": int(round(price * 10000)), "side": side, "size": self.level_size})
+        return {"topic": f'orderBookL2_25.{symbol}', "type": "snapshot", "data": entries,
+                "cross_seq": next(self._seq), "timestamp_e6": int(time.time() * 1e6)}
+
+    def _match(self, symbol, events):
+        price = self.prices[symbol]
+        bid, ask = self.best(symbol)
+        for order_id, order in list(self.orders.items()):
+            if order["symbol"] == symbol and (ask <= order["price"] if order["side"] == "Buy" else bid >= order["price"]):
+                del self.orders[order_id]
+                self._fill(order, order["price"], events)
+        for stop_id, order in list(self.conditional.items()):
+            if order["symbol"] != symbol:
+                continue
+            rising = order["stop_px"] > order["base_price"]
+            if (price >= order["stop_px"]) if rising else (price <= order["stop_px"]):
+                del self.conditional[stop_id]
+                order["order_status"] = "Triggered"
+                events.append(("stop_order", symbol, {"topic": "stop_order", "data": [dict(order)]}))
+                self._fill(dict(order, order_id=uuid.uuid4().hex, order_type="Market"), ask if order["side"] == "Buy" else bid, events)
+        for side, position in self.positions[symbol].items():
+            if not position["size"]:
+                continue
+            tp, sl = position["take_profit"], position["stop_loss"]
+            if side == "Buy":
+                hit = (tp and price >= tp) or (sl and price <= sl)
+            else:
+                hit = (tp and price <= tp) or (sl and price >= sl)
+            if hit:
+                self._fill({"order_id": uuid.uuid4().hex, "symbol": symbol, "side": "Sell" if side == "Buy" else "Buy",
+                            "order_type": "Market", "qty": position["size"], "reduce_only": True, "take_profit": 0, "stop_loss": 0,
+                            "created_time": now_iso(), "order_link_id": ""}, bid if side == "Buy" else ask, events)
+
+    # Execute an order at price: open/increase the position of its side, or reduce the opposite one
+    def _fill(self, order, price, events):
+        symbol, qty = order["symbol"], float(order["qty"])
+        fee = price * qty * self.fee
+        closing = "Sell" if order["side"] == "Buy" else "Buy"
+        if order.get("reduce_only"):
+            position = self.positions[symbol][closing]
+            qty = min(qty, position["size"])
+            sign = 1 if closing == "Buy" else -1
+            self.balance += sign * qty * (price - position["entry_price"]) - fee
+            position["size"] = round(position["size"] - qty, 8)
+            if not position["size"]:
+                position.update(entry_price=0.0, take_profit=0.0, stop_loss=0.0)
+        else:
+            position = self.positions[symbol][order["side"]]
+            size = position["size"] + qty
+            position["entry_price"] = (position["entry_price"] * position["size"] + price * qty) / size
+            position["size"] = round(size, 8)
+            if order.get("take_profit"):
+                position["take_profit"] = float(order["take_profit"])
+            if order.get("stop_loss"):
+                position["stop_loss"] = float(order["stop_loss"])
+            self.balance -= fee
+        filled = dict(order, price=price, qty=qty, cum_exec_qty=qty, order_status="Filled", last_exec_price=price,
+                      update_time=now_iso())
+        self.trades[symbol].append({"exec_id": uuid.uuid4().hex, "order_id": order["order_id"], "order_link_id": order.get("order_link_id", ""), "symbol": symbol,
+                                    "side": order["side"], "order_type": order["order_type"], "price": price, "order_qty": qty,
+                                    "exec_price": price, "exec_qty": qty, "exec_fee": fee, "closed_size": qty if order.get("reduce_only") else 0,
+                                    "trade_time_ms": int(time.time() * 1000)})
+        events.append(("order", symbol, {"topic": "order", "data": [filled]}))
+        events.append(("execution", symbol, {"topic": "execution", "data": [self.trades[symbol][-1]]}))
+        events.append(("position", symbol, {"topic": "position", "data": [self._position(symbol, side) for side in ("Buy", "Sell")]}))
+        events.append(("wallet", None, {"topic": "wallet", "data": [{"wallet_balance": self.balance, "available_balance": self.balance}]}))
+        return filled
+
+    def _position(self, symbol, side):
+        position = self.positions[symbol][side]
+        price = self.prices.get(symbol, position["entry_price"])
+        return {"symbol": symbol, "side": side, "size": position["size"], "entry_price": position["entry_price"],
+                "position_value": position["size"] * position["entry_price"], "leverage": position["leverage"],
+                "free_qty": -position["size"] if side == "Buy" else position["size"],
+                "unrealised_pnl": (1 if side == "Buy" else -1) * position["size"] * (price - position["entry_price"]),
+                "take_profit": position["take_profit"], "stop_loss": position["stop_loss"], "trailing_stop": 0}
+
+    def _new_order(self, kwargs, order_type_key="order_type"):
+        if kwargs.get("order_link_id") and kwargs["order_link_id"] in self.link_ids:
+            raise invalid("Order link id exists", 130010)
+        if float(kwargs.get("qty", 0)) <= 0:
+            raise invalid("Qty must be greater than zero")
+        if kwargs["symbol"] not in self.prices:
+            raise invalid(f'No price for {kwargs["symbol"]}')
+        self._check_grid(kwargs)
+        if kwargs.get("order_link_id"):
+            self.link_ids.add(kwargs["order_link_id"])
+        return {"symbol": kwargs["symbol"], "side": kwargs["side"], "order_type": kwargs[order_type_key], "qty": float(kwargs["qty"]),
+                "price": float(kwargs.get("price") or 0), "time_in_force": kwargs.get("time_in_force", "GoodTillCancel"),
+                "reduce_only": bool(kwargs.get("reduce_only")), "close_on_trigger": bool(kwargs.get("close_on_trigger")),
+                "take_profit": float(kwargs.get("take_profit") or 0), "stop_loss": float(kwargs.get("stop_loss") or 0),
+                "order_link_id": kwargs.get("order_link_id", ""), "created_time": now_iso()}
+
+    def _check_grid(self, kwargs):
+        data = self.symbols.get(kwargs["symbol"])
+        if data is None:
+            return
+        lot_size = data["lot_size_filter"]
+        qty = float(kwargs["qty"])
+        if qty < float(lot_size["min_trading_qty"]) or not on_grid(qty, float(lot_size["qty_step"])):
+            raise invalid(f'Qty {qty} is not a multiple of {lot_size["qty_step"]} from {lot_size["min_trading_qty"]}')
+        tick_size = float(data["price_filter"]["tick_size"])
+        for name in ("price", "take_profit", "stop_loss", "stop_px", "base_price"):
+            if kwargs.get(name) and not on_grid(float(kwargs[name]), tick_size):
+                raise invalid(f'{name} {kwargs[name]} is not a multiple of the tick size {tick_size}')
+
+    def place_active_order(self, **kwargs):
+        events = []
+        with self._lock:
+            order = self._new_order(kwargs)
+            order["order_id"] = uuid.uuid4().hex
+            if order["order_type"] == "Market":
+                bid, ask = self.best(order["symbol"])
+                result = self._fill(order, ask if order["side"] == "Buy" else bid, events)
+            else:
+                order["order_status"] = "New"
+                self.orders[order["order_id"]] = order
+                result = dict(order)
+                self._match(order["symbol"], events)
+        self._emit(events)
+        return response(result)
+
+    # The trigger is checked against the current price right away, like the exchange does on the next trade,
+    # so a conditional armed after the price already crossed doesn't wait for another step
+    def place_conditional_order(self, **kwargs):
+        events = []
+        with self._lock:
+            order = self._new_order(kwargs)
+            order.update(stop_order_id=uuid.uuid4().hex, stop_px=float(kwargs["stop_px"]), base_price=float(kwargs["base_price"]),
+                         trigger_by=kwargs.get("trigger_by", "LastPrice"), order_status="Untriggered")
+            self.conditional[order["stop_order_id"]] = order
+            result = dict(order)
+            self._match(order["symbol"], events)
+        self._emit(events)
+        return response(result)
+
+    def query_active_order(self, symbol, **kwargs):
+        with self._lock:
+            return response([dict(order) for order in self.orders.values() if order["symbol"] == symbol])
+
+    def query_conditional_order(self, symbol, **kwargs):
+        with self._lock:
+            return response([dict(order) for order in self.conditional.values() if order["symbol"] == symbol])
+
+    def cancel_active_order(self, symbol, order_id=None, order_link_id=None, **kwargs):
+        with self._lock:
+            for key, order in list(self.orders.items()):
+                if order["symbol"] == symbol and (key == order_id or (order_link_id and order["order_link_id"] == order_link_id)):
+                    del self.orders[key]
+                    return response({"order_id": key})
+            raise invalid("Order not exists or too late to cancel", 130010)
+
+    def cancel_all_active_orders(self, symbol, **kwargs):
+        with self._lock:
+            cancelled = [key for key, order in self.orders.items() if order["symbol"] == symbol]
+            for key in cancelled:
+                del self.orders[key]
+            return response(cancelled)
+
+    def cancel_all_conditional_orders(self, symbol, **kwargs):
+        with self._lock:
+            cancelled = [key for key, order in self.conditional.items() if order["symbol"] == symbol]
+            for key in cancelled:
+                del self.conditional[key]
+            return response(cancelled)
+
+    def my_position(self, symbol=None, **kwargs):
+        with self._lock:
+            symbols = [symbol] if symbol else list(self.positions)
+            return response([self._position(s, side) for s in symbols for side in ("Buy", "Sell")])
+
+    def close_position(self, symbol):
+        results = []
+        for position in self.my_position(symbol=symbol)["result"]:
+            if position["size"] > 0:
+                results.append(self.place_active_order(symbol=symbol, side="Sell" if position["side"] == "Buy" else "Buy", order_type="Market",
+                                                       qty=position["size"], time_in_force="ImmediateOrCancel", reduce_only=True,
+                                                       close_on_trigger=True))
+        return results
+
+    def set_leverage(self, symbol, buy_leverage, sell_leverage, **kwargs):
+        with self._lock:
+            self.positions[symbol]["Buy"]["leverage"] = float(buy_leverage)
+            self.positions[symbol]["Sell"]["leverage"] = float(sell_leverage)
+            events = [("position", symbol, {"topic": "position", "data": [self._position(symbol, side) for side in ("Buy", "Sell")]})]
+        self._emit(events)
+        return response({})
+
+    def get_wallet_balance(self, coin="USDT", **kwargs):
+        with self._lock:
+            return response({coin: {"equity": self.balance, "available_balance": self.balance, "wallet_balance": self.balance}})
+
+    # Newest first, limit per page, optionally from start_time / before end_time (ms)
+    def user_trade_records(self, symbol, limit=50, page=1, start_time=None, end_time=None, **kwargs):
+        with self._lock:
+            trades = [trade for trade in reversed(self.trades[symbol])
+                      if (start_time is None or trade["trade_time_ms"] >= int(start_time)) and (end_time is None or trade["trade_time_ms"] < int(end_time))]
+            offset = (int(page) - 1) * int(limit)
+            return response({"current_page": int(page), "data": trades[offset:offset + int(limit)]})
+
+    def orderbook(self, symbol, **kwargs):
+        with self._lock:
+            return response(self._book_message(symbol)["data"])
+
+    def query_symbol(self, **kwargs):
+        return response([dict(data) for data in self.symbols.values()])
+
+
+# Drop-in for usdt_perpetual.HTTP: every call takes `latency` seconds, then runs on the exchange
+class PaperHTTP:
+    METHODS = {"place_active_order", "place_conditional_order", "query_active_order", "query_conditional_order",
+               "cancel_active_order", "cancel_all_active_orders", "cancel_all_conditional_orders", "my_position",
+               "close_position", "set_leverage", "get_wallet_balance", "user_trade_records", "orderbook", "query_symbol"}
+
+    def __init__(self, exchange, latency=0.0):
+        self.exchange = exchange
+        self.latency = latency
+
+    def __getattr__(self, name):
+        if name not in self.METHODS:
+            raise AttributeError(name)
+        method = getattr(self.exchange, name)
+
+        def call(**kwargs):
+            if self.latency:
+                time.sleep(self.latency)
+            return method(**kwargs)
+        return call
+
+
+# Drop-in for usdt_perpetual.WebSocket: the subscriptions become exchange listeners
+class PaperWebSocket:
+    def __init__(self, exchange):
+        self.exchange = exchange
+        self.active_connections = []
+
+    def orderbook_25_stream(self, callback, symbol):
+        self.exchange.subscribe("orderbook", callback, symbol if isinstance(symbol, list) else [symbol])
+
+    def order_stream(self, callback):
+        self.exchange.subscribe("order", callback)
+
+    def stop_order_stream(self, callback):
+        self.exchange.subscribe("stop_order", callback)
+
+    def execution_stream(self, callback):
+        self.exchange.subscribe("execution", callback)
+
+    def position_stream(self, callback):
+        self.exchange.subscribe("position", callback)
+
+    def wallet_stream(self, callback):
+        self.exchange.subscribe("wallet", callback)
+
+
+# Replays price series into the exchange from a thread: {symbol: array or file}, `rate` prices per
+# second per symbol (0 = as fast as possible), looping when loop=True
+class PaperFeed:
+    def __init__(self, exchange, series, rate=10.0, loop=False):
+        self.exchange = exchange
+        self.series = {symbol: load_prices(prices, symbol) if isinstance(prices, str) else prices for symbol, prices in series.items()}
+        self.rate = rate
+        self.loop = loop
+        self._stopped = Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = Thread(target=self.run, name="paper-feed", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def run(self):
+        length = max(len(prices) for prices in self.series.values())
+        while not self._stopped.is_set():
+            for i in range(length):
+                if self._stopped.is_set():
+                    return
+                for symbol, prices in self.series.items():
+                    if i < len(prices):
+                        self.exchange.step(symbol, float(prices[i]))
+                if self.rate:
+                    time.sleep(1 / self.rate)
+            if not self.loop:
+                return
+
+
+# Engine on a fresh PaperExchange that records and persists nothing: with paper_engine(Pairs=["SOLUSDT"]) as engine: ...
+@contextmanager
+def paper_engine(**overrides):
+    from .engine import Engine
+    settings = SETTINGS.get().to_dict()
+    with tempfile.TemporaryDirectory() as directory:
+        settings.update({"Exchange": "paper", "RecordTicks": False, "PersistSequences": False, "SyncFills": False,
+                         "EngineAddress": "127.0.0.1:0", "InstrumentCache": os.path.join(directory, "instruments.json")})
+        settings.update(overrides)
+        path = os.path.join(directory, "Settings.json")
+        with open(path, "w") as f:
+            json.dump({"Settings": settings}, f)
+        engine = Engine(SettingsStore(path, check_interval=0))
+        engine.runtime.start()
+        try:
+            engine.connected.wait(5)
+            yield engine
+        finally:
+            engine.runtime.stop()
+
+
+# Load test through the real engine path (IPC commands aside): places `sequences` Buy parents at
+# `price`, then walks the price through the recovery zone so that every sequence fires its three
+# legs. The engine must run on a PaperExchange. Returns timings and the engine's latency stats.
+def run_load_test(engine, symbol, sequences, price=40.0, tp_sl_ticks=200, tick_price=0.01, zone_divider=2, timeout=60):
+    exchange = engine.exchange
+    exchange.step(symbol, price)
+    zone = tp_sl_ticks / zone_divider * tick_price
+    started = time.perf_counter()
+    futures = []
+    for _ in range(sequences):
+        legs = build_legs("Buy", price, 1.0, tp_sl_ticks, tick_price, zone_divider, (1.5, 1.0, 1.5))
+        futures.append(engine.runtime.spawn(engine.place_order({"symbol": symbol, "side": "Buy", "order_type": "Market", "qty": 1.0,
+                                                                  "time_in_force": "GoodTillCancel", "reduce_only": False,
+                                                                  "close_on_trigger": False}, legs)))
+    for future in futures:
+        future.result(timeout=timeout)
+    placed = time.perf_counter()
+    deadline = time.time() + timeout
+    # Down through the zone (1st Sell leg), back to the unit price (2nd Buy leg), down again (3rd Sell leg)
+    for index, target in enumerate((price - zone - tick_price, price + tick_price, price - zone - tick_price)):
+        exchange.step(symbol, target)
+        while time.time() < deadline and any(not sequence["Legs"][index]["Triggered"] for sequence in list(engine.recovery.sequences.values())):
+            time.sleep(0.001)
+    # Let the last legs reach the exchange: a parent and three legs per sequence
+    while len(exchange.trades[symbol]) < 4 * sequences and time.time() < deadline:
+        time.sleep(0.001)
+    finished = time.perf_counter()
+    return {"sequences": sequences, "open": len(engine.recovery.sequences), "fills": len(exchange.trades[symbol]),
+            "place_seconds": round(placed - started, 3), "recovery_seconds": round(finished - placed, 3),
+            "sequences_per_second": round(sequences / (finished - started), 1),
+            "tick_to_order": engine.recovery.latency.as_dict()}
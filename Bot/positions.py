@@ -0,0 +1,63 @@
+import logging
+
+LOGGER = logging.getLogger()
+
+# Fields of a position as my_position returns them, with their value on a flat side
+FIELDS = {"size": 0.0, "position_value": 0.0, "entry_price": 0.0, "leverage": 0.0, "free_qty": 0.0, "take_profit": 0.0,
+          "stop_loss": 0.0, "trailing_stop": 0.0, "unrealised_pnl": 0.0}
+
+
+def position_entry(data):
+    entry = {"symbol": data["symbol"], "side": data["side"]}
+    for field, default in FIELDS.items():
+        value = data.get(field)
+        entry[field] = float(value) if value not in (None, "") else default
+    return entry
+
+
+# Latest position of every symbol and side, kept current by the private position stream.
+# A symbol is read once over REST (seed) when nothing is known about it yet; from then on the
+# stream keeps it up to date and every reader (views, flattening, dashboards) is served from
+# memory. A seed never overwrites a side the stream already reported, the stream being newer.
+# Must be used from the runtime loop.
+class PositionCache:
+    def __init__(self):
+        self.positions = {}  # symbol -> {side: entry}
+
+    def update(self, positions, seed=False):
+        symbols = set()
+        for data in positions:
+            if data.get("side") not in ("Buy", "Sell"):
+                continue
+            sides = self.positions.setdefault(data["symbol"], {})
+            if seed and data["side"] in sides:
+                continue
+            sides[data["side"]] = position_entry(data)
+            symbols.add(data["symbol"])
+        return symbols
+
+    # Positions of a symbol read over REST: the symbol is known from now on, even when flat
+    def seed(self, symbol, positions):
+        self.positions.setdefault(symbol, {})
+        return self.update(positions, seed=True)
+
+    def known(self, symbol):
+        return symbol in self.positions
+
+    # [entry, ...] like the result of my_position
+    def get(self, symbol):
+        return [dict(entry) for entry in self.positions.get(symbol, {}).values()]
+
+    # Leverage of a symbol, None until known
+    def leverage(self, symbol):
+        for entry in self.positions.get(symbol, {}).values():
+            if entry["leverage"]:
+                return entry["leverage"]
+        return None
+
+    # Positions of the dashboard: {symbol: {side: {"Size", "Entry Price", ...}}}
+    def snapshot(self):
+        return {symbol: {side: {"Size": entry["size"], "Entry Price": entry["entry_price"], "Leverage": entry["leverage"],
+                                "TP": entry["take_profit"], "SL": entry["stop_loss"], "Unrealised PnL": entry["unrealised_pnl"]}
+                         for side, entry in sides.items()}
+                for symbol, sides in self.positions.items()}
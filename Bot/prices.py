@@ -0,0 +1,98 @@
+import time
+from collections import namedtuple
+from itertools import count
+from pathlib import Path
+
+import pandas as pd
+
+# Latest known price of a symbol. Ticks are immutable, so a reader always gets a consistent
+# price/timestamp/seq triple even while the stream handlers keep publishing new ones.
+PriceTick = namedtuple("PriceTick", ["symbol", "price", "timestamp", "seq"])
+
+
+# Keeps the last tick per symbol in process memory.
+# Publishing replaces the whole tick with a single dict assignment, which is atomic under the GIL,
+# so neither the stream handlers nor the readers need a lock.
+class LocalPriceBackend:
+    def __init__(self):
+        self._ticks = {}
+
+    def set(self, tick):
+        self._ticks[tick.symbol] = tick
+
+    def get(self, symbol):
+        return self._ticks.get(symbol)
+
+    def all(self):
+        return dict(self._ticks)
+
+
+# Shares the last ticks between processes (e.g. gunicorn workers) through a Django cache,
+# which should point to a shared store such as Redis or Memcached to be useful.
+# The symbols with a price are listed in the cache too (prefix + "symbols"), so all() works in any
+# process; a writer only updates the list when it publishes a symbol for the first time.
+class DjangoCachePriceBackend:
+    def __init__(self, alias="default", prefix="price:", timeout=None):
+        from django.core.cache import caches
+        self.cache = caches[alias]
+        self.prefix = prefix
+        self.timeout = timeout
+        self.index_key = prefix + "symbols"
+        self._symbols = set()
+
+    def set(self, tick):
+        self.cache.set(self.prefix + tick.symbol, tuple(tick), timeout=self.timeout)
+        if tick.symbol not in self._symbols:
+            self._symbols.add(tick.symbol)
+            self.cache.set(self.index_key, tuple(set(self.cache.get(self.index_key, ())) | self._symbols), timeout=self.timeout)
+
+    def get(self, symbol):
+        tick = self.cache.get(self.prefix + symbol)
+        return PriceTick(*tick) if tick else None
+
+    def all(self):
+        ticks = self.cache.get_many([self.prefix + symbol for symbol in self.cache.get(self.index_key, ())])
+        return {tick[0]: PriceTick(*tick) for tick in ticks.values()}
+
+
+PRICE_BACKENDS = {
+    "local": LocalPriceBackend,
+    "django": DjangoCachePriceBackend,
+}
+
+
+class PriceCache:
+    def __init__(self, backend=None, csv_dir=None):
+        self.backend = backend or LocalPriceBackend()
+        # Optional debug sink: mirrors every tick to <csv_dir>/<SYMBOL>.csv like the old handlers did
+        self.csv_dir = Path(csv_dir) if csv_dir else None
+        self._seq = count(1)
+        self._listeners = []
+
+    # Register a callback that is invoked with every new tick, on the thread that published it
+    def subscribe(self, callback):
+        self._listeners.append(callback)
+
+    def update(self, symbol, price, timestamp=None):
+        tick = PriceTick(symbol, float(price), timestamp or time.time(), next(self._seq))
+        self.backend.set(tick)
+        if self.csv_dir is not None:
+            pd.DataFrame([{"Symbol": symbol, "Price": tick.price}]).to_csv(self.csv_dir / f'{symbol}.csv', index=False)
+        for callback in self._listeners:
+            callback(tick)
+        return tick
+
+    def get(self, symbol):
+        return self.backend.get(symbol)
+
+    def price(self, symbol):
+        tick = self.backend.get(symbol)
+        return tick.price if tick else None
+
+    def all(self):
+        return self.backend.all()
+
+
+def get_price_cache(settings, csv_dir=None):
+    backend = PRICE_BACKENDS[settings.get("PriceBackend", "local")]()
+    return PriceCache(backend=backend, csv_dir=csv_dir if settings.get("PriceCSVDebug", False) else None)
@@ -0,0 +1,157 @@
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
+from threading import Event, Thread
+
+import numpy as np
+
+LOGGER = logging.getLogger()
+
+# Columns of a partition: one raw little-endian float64 file each, appended batch by batch
+COLUMNS = ("timestamp", "price")
+DTYPE = np.dtype("<f8")
+HOUR = 3600
+
+
+# Preallocated ring of the ticks of one symbol.
+# Single producer (the runtime loop) and single consumer (the recorder thread): the producer writes
+# the slot before advancing head and the consumer only reads up to head, so no lock is needed.
+class TickRing:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.timestamp = np.empty(capacity, dtype=DTYPE)
+        self.price = np.empty(capacity, dtype=DTYPE)
+        self.head = 0  # ticks written
+        self.tail = 0  # ticks flushed
+        self.dropped = 0
+
+    def append(self, timestamp, price):
+        if self.head - self.tail >= self.capacity:
+            self.dropped += 1
+            return
+        i = self.head % self.capacity
+        self.timestamp[i] = timestamp
+        self.price[i] = price
+        self.head += 1
+
+    # Copy of the ticks not flushed yet, and the position to pass to release() once written
+    def pending(self):
+        head, tail = self.head, self.tail
+        start, end = tail % self.capacity, head % self.capacity
+        if head == tail:
+            return None, head
+        if start < end:
+            return (self.timestamp[start:end].copy(), self.price[start:end].copy()), head
+        return (np.concatenate((self.timestamp[start:], self.timestamp[:end])),
+                np.concatenate((self.price[start:], self.price[:end]))), head
+
+    def release(self, head):
+        self.tail = head
+
+
+# Records every price tick of the subscribed pairs to <directory>/<SYMBOL>/<YYYYMMDD-HH>/<column>.f8.
+# The PriceCache listener only stores the tick in the symbol's ring; a background thread flushes the
+# rings every flush_interval seconds (or sooner when one fills up) and appends each batch to the
+# hourly partition of its timestamps. The files are plain arrays, replayable with load_ticks() or
+# np.memmap, and by the backtester (load_prices accepts a symbol directory).
+class TickRecorder:
+    def __init__(self, directory, capacity=1 << 16, flush_interval=1.0):
+        self.directory = Path(directory)
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.rings = {}
+        self.recorded = 0
+        self._wakeup = Event()
+        self._stopped = False
+        self._thread = None
+
+    # PriceCache listener
+    def on_tick(self, tick):
+        ring = self.rings.get(tick.symbol)
+        if ring is None:
+            ring = self.rings[tick.symbol] = TickRing(self.capacity)
+        ring.append(tick.timestamp, tick.price)
+        if ring.head - ring.tail >= self.capacity // 2:
+            self._wakeup.set()
+
+    def start(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._thread = Thread(target=self._run, name="tick-recorder", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopped = True
+            self._wakeup.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                LOGGER.error(f'Recording ticks failed: {e}')
+
+    def flush(self):
+        for symbol, ring in list(self.rings.items()):
+            batch, head = ring.pending()
+            if batch is None:
+                continue
+            self._write(symbol, *batch)
+            ring.release(head)
+            self.recorded += len(batch[0])
+
+    # Split a batch on the hour boundaries and append every piece to its partition
+    def _write(self, symbol, timestamps, prices):
+        hours = (timestamps // HOUR).astype(np.int64)
+        bounds = np.flatnonzero(np.diff(hours)) + 1
+        for start, end in zip(np.concatenate(([0], bounds)), np.concatenate((bounds, [len(hours)]))):
+            partition = self.directory / symbol / partition_name(hours[start] * HOUR)
+            partition.mkdir(parents=True, exist_ok=True)
+            for column, values in zip(COLUMNS, (timestamps, prices)):
+                with open(partition / f'{column}.f8', "ab") as f:
+                    values[start:end].astype(DTYPE, copy=False).tofile(f)
+
+    def status(self):
+        return {"recorded": self.recorded,
+                "buffered": {symbol: ring.head - ring.tail for symbol, ring in self.rings.items()},
+                "dropped": {symbol: ring.dropped for symbol, ring in self.rings.items() if ring.dropped}}
+
+
+def partition_name(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y%m%d-%H")
+
+
+# Recorded ticks of a symbol directory as (timestamps, prices), optionally limited to [start, end) epoch seconds.
+# Partitions are memory-mapped, only the selected hours are read.
+def load_ticks(directory, start=None, end=None):
+    directory = Path(directory)
+    timestamps, prices = [], []
+    for partition in sorted(p for p in directory.iterdir() if p.is_dir()):
+        hour = datetime.strptime(partition.name, "%Y%m%d-%H").replace(tzinfo=timezone.utc).timestamp()
+        if (start is not None and hour + HOUR <= start) or (end is not None and hour >= end):
+            continue
+        columns = [read_column(partition / f'{column}.f8') for column in COLUMNS]
+        # A partition can be read while the recorder appends to it: keep the rows both columns have
+        rows = min(len(column) for column in columns)
+        timestamps.append(columns[0][:rows])
+        prices.append(columns[1][:rows])
+    if not timestamps:
+        return np.empty(0, dtype=DTYPE), np.empty(0, dtype=DTYPE)
+    timestamps, prices = np.concatenate(timestamps), np.concatenate(prices)
+    mask = np.ones(len(timestamps), dtype=bool)
+    if start is not None:
+        mask &= timestamps >= start
+    if end is not None:
+        mask &= timestamps < end
+    return timestamps[mask], prices[mask]
+
+
+def read_column(path):
+    if not path.exists() or not path.stat().st_size:
+        return np.empty(0, dtype=DTYPE)
+    return np.memmap(path, dtype=DTYPE, mode="r", shape=(path.stat().st_size // DTYPE.itemsize,))
@@ -0,0 +1,328 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from threading import Lock
+
+from .metrics import ORDER_PLACEMENT, TRIGGER_EVAL
+from .triggers import TriggerIndex
+
+LOGGER = logging.getLogger()
+
+ORDINALS = ["1st", "2nd", "3rd"]
+
+# Where the legs are triggered: by this process on price ticks, or by the exchange as conditional orders
+CLIENT = "client"
+EXCHANGE = "exchange"
+
+# Stop order statuses meaning the conditional leg fired, or will never fire
+STOP_FIRED = {"Triggered", "Active", "Filled"}
+STOP_DEAD = {"Cancelled", "Deactivated", "Rejected"}
+# Parent order statuses meaning it will never fill
+ORDER_DEAD = {"Cancelled", "Rejected"}
+
+
+def ordinal(index):
+    return ORDINALS[index] if index < len(ORDINALS) else f'{index + 1}th'
+
+
+# Running statistics of a latency measured in seconds
+class LatencyStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+        self._lock = Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.last = seconds
+            self.max = max(self.max, seconds)
+
+    def as_dict(self):
+        return {"count": self.count,
+                "last_ms": round(self.last * 1000, 3),
+                "avg_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+                "max_ms": round(self.max * 1000, 3)}
+
+
+# Fires the legs of recovery_trades[pair] as soon as a price tick crosses them.
+# Ticks come from the PriceCache listeners and fill status from the private order stream,
+# so nothing is polled. Only the next pending leg of every filled sequence is armed in a
+# TriggerIndex, so a tick costs one bisect per side whatever the number of sequences; crossed
+# legs are decided on the runtime loop and submitted through the RestClient order lane, one at a
+# time per pair so the legs of a sequence reach the exchange in order.
+# Every state change is handed to the optional write-behind store (see store.py).
+# In EXCHANGE mode the next leg is sent as a conditional order (stop_px = UnitPrice) instead of
+# being armed in the TriggerIndex, so the crossing is detected by the exchange; the stop order
+# stream reports it fired and the following leg is sent in turn. The legs are armed one at a time
+# because the 1st and 3rd legs share the same trigger price.
+# With instruments (see instruments.py) every leg order is put on its symbol's price and quantity grid.
+class RecoveryEngine:
+    def __init__(self, rest, recovery_trades, runtime, store=None, books=None, mode=CLIENT, instruments=None):
+        self.rest = rest
+        self.instruments = instruments
+        self.mode = mode
+        self.store = store
+        # Optional OrderBooks used to estimate the fill price of a leg before it is sent
+        self.books = books
+        self.recovery_trades = recovery_trades
+        self.runtime = runtime
+        # Parent order id -> armed sequence: pair, side, fill status and its recovery legs
+        self.sequences = {}
+        # Order statuses that arrived on the order stream before the order was armed
+        self.order_status = OrderedDict()
+        self.triggers = TriggerIndex()
+        # EXCHANGE mode: order_link_id of the armed conditional leg -> (parent order id, leg index)
+        self.conditional = {}
+        self.last_prices = {}
+        self.latency = LatencyStats()
+        self._lock = Lock()
+        self._pair_locks = defaultdict(asyncio.Lock)
+
+    # Start watching the recovery legs of a freshly placed parent order
+    def arm(self, order, legs=None):
+        order_id = order["order_id"]
+        with self._lock:
+            status = self.order_status.pop(order_id, order["order_status"])
+            if status in ORDER_DEAD:
+                LOGGER.info(f'Order has been {status.lower()}, not arming recovery for: {order["Pair"]}')
+                return
+            self.sequences[order_id] = {"Pair": order["Pair"], "Side": order["side"], "Filled": False,
+                                        "Legs": legs if legs is not None else self.recovery_trades[order["Pair"]]}
+            if status == "Filled":
+                self._fill(order_id)
+            else:
+                self._persist(order_id, "Pending")
+        LOGGER.info(f'RecoveryOrder handler armed for: {order}')
+
+    # Re-arm the open sequences loaded from the store after a restart
+    def restore(self, sequences):
+        with self._lock:
+            for order_id, sequence in sequences.items():
+                self.sequences[order_id] = sequence
+                self.recovery_trades[sequence["Pair"]] = sequence["Legs"]
+                if sequence["Filled"] and self.mode == CLIENT:
+                    self._arm_next(order_id)
+        if self.mode == EXCHANGE:
+            self.runtime.spawn(self._rearm_conditional([order_id for order_id, sequence in sequences.items() if sequence["Filled"]]))
+        LOGGER.info(f'Restored {len(sequences)} recovery sequences')
+
+    # The order stream of the previous run is gone: read the parent order of every restored Pending
+    # sequence and replay its status, so a parent filled while the engine was down arms its legs
+    async def reconcile(self):
+        with self._lock:
+            pending = [(order_id, sequence["Pair"]) for order_id, sequence in self.sequences.items() if not sequence["Filled"]]
+        for order_id, pair in pending:
+            try:
+                result = (await self.rest.call("query_active_order", symbol=pair, order_id=order_id))["result"]
+            except Exception as e:
+                LOGGER.error(f'Reading the parent order {order_id} of {pair} failed: {e}')
+                continue
+            if isinstance(result, list):
+                result = next((order for order in result if order["order_id"] == order_id), None)
+            if not result:
+                LOGGER.warning(f'Parent order {order_id} of {pair} not found, its recovery stays pending')
+                continue
+            self.on_order({"data": [{"order_id": order_id, "symbol": pair, "order_status": result["order_status"]}]})
+
+    # The conditional legs left on the exchange by the previous run are unknown: replace them
+    async def _rearm_conditional(self, order_ids):
+        for pair in {self.sequences[order_id]["Pair"] for order_id in order_ids if order_id in self.sequences}:
+            try:
+                await self.rest.call("cancel_all_conditional_orders", symbol=pair)
+            except Exception as e:
+                LOGGER.error(f'Cancelling the conditional legs of {pair} failed: {e}')
+        with self._lock:
+            for order_id in order_ids:
+                if order_id in self.sequences:
+                    self._arm_next(order_id)
+
+    # Drop every sequence of a pair, e.g. when its orders are cancelled
+    def disarm(self, pair):
+        with self._lock:
+            for order_id in [order_id for order_id, sequence in self.sequences.items() if sequence["Pair"] == pair]:
+                self._persist(order_id, "Cancelled")
+                sequence = self.sequences.pop(order_id)
+                if "Trigger" in sequence:
+                    self.triggers.remove(sequence["Trigger"])
+                self.conditional.pop(sequence.get("Conditional"), None)
+
+    # Callback of the order stream
+    def on_order(self, msg):
+        for data in msg["data"]:
+            order_id, status = data["order_id"], data["order_status"]
+            with self._lock:
+                sequence = self.sequences.get(order_id)
+                if sequence is None:
+                    self.order_status[order_id] = status
+                    if len(self.order_status) > 1000:
+                        self.order_status.popitem(last=False)
+                elif status == "Filled" and not sequence["Filled"]:
+                    self._fill(order_id)
+                elif status in ORDER_DEAD and not sequence["Filled"]:
+                    LOGGER.info(f'Order has been {status.lower()}, disarming recovery for: {data["symbol"]}')
+                    self._persist(order_id, "Cancelled")
+                    del self.sequences[order_id]
+
+    # Callback of the stop order stream (EXCHANGE mode)
+    def on_stop_order(self, msg):
+        for data in msg["data"]:
+            status = data["order_status"]
+            with self._lock:
+                armed = self.conditional.get(data.get("order_link_id"))
+                if armed is None or (status not in STOP_FIRED and status not in STOP_DEAD):
+                    continue
+                del self.conditional[data["order_link_id"]]
+                order_id, index = armed
+                sequence = self.sequences.get(order_id)
+                if sequence is None:
+                    continue
+                leg = sequence["Legs"][index]
+                if status in STOP_FIRED:
+                    LOGGER.info(f'{ordinal(index)} {leg["Side"]} conditional RecoveryOrder triggered for {sequence["Pair"]}: {data.get("stop_order_id")}')
+                    leg["Triggered"] = True
+                    self._arm_next(order_id)
+                else:
+                    # Not cancelled by us (disarm forgets the leg first): watch it from here instead
+                    LOGGER.warning(f'{ordinal(index)} conditional RecoveryOrder {status} for {sequence["Pair"]}, triggering it client side')
+                    sequence["Trigger"] = self.triggers.add_leg(sequence["Pair"], leg, (order_id, index))
+
+    # Callback of the PriceCache
+    def on_tick(self, tick):
+        received = time.perf_counter()
+        self.last_prices[tick.symbol] = tick.price
+        if not self.triggers.armed(tick.symbol):
+            return
+        with self._lock:
+            fired = []
+            for order_id, index in self.triggers.pop_crossed(tick.symbol, tick.price):
+                leg = self.sequences[order_id]["Legs"][index]
+                leg["Triggered"] = True
+                fired.append((index, leg))
+                self._arm_next(order_id)
+        TRIGGER_EVAL.since(received)
+        for index, leg in fired:
+            self.runtime.spawn(self._place_leg(tick.symbol, tick.price, index, leg, received))
+
+    # Must be called with the lock held
+    def _fill(self, order_id):
+        self.sequences[order_id]["Filled"] = True
+        self._arm_next(order_id)
+
+    # Must be called with the lock held: arm the next pending leg of a sequence, or retire it
+    def _arm_next(self, order_id):
+        sequence = self.sequences[order_id]
+        index = next((i for i, leg in enumerate(sequence["Legs"]) if not leg["Triggered"]), None)
+        if index is None:
+            self._persist(order_id, "Done")
+            del self.sequences[order_id]
+            return
+        self._persist(order_id, "Active")
+        if self.mode == EXCHANGE:
+            link_id = uuid.uuid4().hex
+            self.conditional[link_id] = (order_id, index)
+            sequence["Conditional"] = link_id
+            self.runtime.spawn(self._place_conditional(sequence["Pair"], order_id, index, sequence["Legs"][index], link_id))
+            return
+        sequence["Trigger"] = self.triggers.add_leg(sequence["Pair"], sequence["Legs"][index], (order_id, index))
+
+    # Must be called with the lock held
+    def _persist(self, order_id, status):
+        if self.store is not None:
+            sequence = self.sequences[order_id]
+            self.store.save(order_id, sequence["Pair"], sequence["Side"], status, sequence["Legs"])
+
+    # EXCHANGE mode: send the leg as a conditional market order keeping its TP/SL.
+    # If the price is already past UnitPrice the exchange would never see it cross, so the leg is
+    # placed right away like a client-side trigger; if the conditional order is refused the leg falls
+    # back to the client-side trigger.
+    async def _place_conditional(self, symbol, order_id, index, leg, link_id):
+        price = self.last_prices.get(symbol)
+        sell = leg["Side"] == "Sell"
+        if price is not None and (price <= leg["UnitPrice"] if sell else price >= leg["UnitPrice"]):
+            with self._lock:
+                if self.conditional.pop(link_id, None) is None:
+                    return
+                leg["Triggered"] = True
+                self._arm_next(order_id)
+            await self._place_leg(symbol, price, index, leg, time.perf_counter())
+            return
+        async with self._pair_locks[symbol]:
+            try:
+                order = await self.rest.call("place_conditional_order", **self.on_grid({
+                    "symbol": symbol,
+                    "side": leg["Side"],
+                    "order_type": "Market",
+                    "qty": leg["Units"],
+                    "base_price": price if price is not None else leg["UnitPrice"] * (1.001 if sell else 0.999),
+                    "stop_px": leg["UnitPrice"],
+                    "trigger_by": "LastPrice",
+                    "take_profit": leg["TP"],
+                    "stop_loss": leg["SL"],
+                    "time_in_force": "GoodTillCancel",
+                    "reduce_only": False,
+                    "close_on_trigger": False,
+                    "order_link_id": link_id
+                }))
+            except Exception as e:
+                LOGGER.error(f'{ordinal(index)} {leg["Side"]} conditional RecoveryOrder failed for {symbol}, triggering it client side: {e}')
+                with self._lock:
+                    if self.conditional.pop(link_id, None) is not None and order_id in self.sequences:
+                        self.sequences[order_id]["Trigger"] = self.triggers.add_leg(symbol, leg, (order_id, index))
+                return
+        LOGGER.info('%s %s conditional RecoveryOrder armed: %s', ordinal(index), leg["Side"], order['result'],
+                    extra={"event": "leg_armed", "symbol": symbol, "leg": index})
+
+    async def _place_leg(self, symbol, price, index, leg, received):
+        async with self._pair_locks[symbol]:
+            self.latency.add(time.perf_counter() - received)
+            # Hot path: lazy %-formatting, the record is formatted by the log writer thread
+            LOGGER.info('Placing the %s recovery order: %s, Pair: %s, PairPrice: %s, OrderPrice: %s, EstimatedFill: %s, TickToOrder: %.3fms',
+                        ordinal(index), leg["Side"], symbol, price, leg["UnitPrice"], self.estimate_fill(symbol, leg),
+                        self.latency.last * 1000, extra={"event": "leg", "symbol": symbol, "leg": index})
+            try:
+                order = await self.rest.call("place_active_order", **self.on_grid({
+                    "symbol": symbol,
+                    "side": leg["Side"],
+                    "order_type": "Market",
+                    "qty": leg["Units"],
+                    "take_profit": leg["TP"],
+                    "stop_loss": leg["SL"],
+                    "time_in_force": "GoodTillCancel",
+                    "reduce_only": False,
+                    "close_on_trigger": False
+                }))
+            except Exception as e:
+                LOGGER.error(f'{ordinal(index)} {leg["Side"]} RecoveryOrder failed for {symbol}: {e}')
+                return
+            ORDER_PLACEMENT.since(received)
+        LOGGER.info('%s %s RecoveryOrder has been placed: %s', ordinal(index), leg["Side"], order['result'],
+                    extra={"event": "leg_placed", "symbol": symbol, "leg": index})
+
+    # Order call keyword arguments on the symbol's grid
+    def on_grid(self, order):
+        return self.instruments.get(order["symbol"]).order(order) if self.instruments is not None else order
+
+    # (average price, fillable units) of the leg's market order on the current book, None without a book
+    def estimate_fill(self, symbol, leg):
+        book = self.books.get(symbol) if self.books is not None else None
+        if book is None or not book.synced:
+            return None
+        return book.estimate_fill(leg["Side"], leg["Units"])
+
+    # Copy of the armed sequences and their legs: {order_id: {"Pair", "Side", "Filled", "Legs"}}
+    def snapshot(self):
+        with self._lock:
+            return {order_id: {"Pair": sequence["Pair"], "Side": sequence["Side"], "Filled": sequence["Filled"],
+                               "Legs": [dict(leg) for leg in sequence["Legs"]]}
+                    for order_id, sequence in self.sequences.items()}
+
+    def status(self):
+        sequences = self.snapshot()
+        return {"mode": self.mode, "sequences": sequences, "armed_levels": len(self.triggers), "conditional_legs": len(self.conditional),
+                "tick_to_order": self.latency.as_dict()}
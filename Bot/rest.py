@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import count
+
+from requests.adapters import HTTPAdapter
+
+from .metrics import REST_CALL, REST_QUEUE
+
+LOGGER = logging.getLogger()
+
+# Call priorities, lower runs first
+ORDER = 0  # order placement and cancels: recovery legs, parent orders, flatten
+ACCOUNT = 1  # position and leverage management
+QUERY = 2  # dashboard reads
+
+PRIORITIES = {
+    "place_active_order": ORDER,
+    "place_conditional_order": ORDER,
+    "cancel_active_order": ORDER,
+    "cancel_all_active_orders": ORDER,
+    "cancel_conditional_order": ORDER,
+    "cancel_all_conditional_orders": ORDER,
+    "close_position": ORDER,
+    "set_leverage": ACCOUNT,
+    "set_trading_stop": ACCOUNT,
+    "my_position": ACCOUNT,
+}
+
+# Calls without side effects: identical concurrent reads share one request
+READ_METHODS = {"get_wallet_balance", "query_active_order", "query_conditional_order", "my_position",
+                "user_trade_records", "query_symbol", "latest_information_for_symbol", "orderbook"}
+
+
+# Per-endpoint budgets reported by the exchange with every response
+# (rate_limit, rate_limit_status = calls left, rate_limit_reset_ms).
+class RateLimits:
+    def __init__(self):
+        self.budgets = {}
+
+    def update(self, method, response):
+        if isinstance(response, dict) and "rate_limit_status" in response:
+            self.budgets[method] = (response["rate_limit_status"], response.get("rate_limit"), response.get("rate_limit_reset_ms", 0) / 1000)
+
+    # Seconds to wait before the endpoint can be called again
+    def delay(self, method):
+        remaining, limit, reset = self.budgets.get(method, (None, None, 0))
+        if remaining is None or remaining > 0:
+            return 0
+        return max(0.0, reset - time.time())
+
+    def spend(self, method):
+        if method in self.budgets:
+            remaining, limit, reset = self.budgets[method]
+            self.budgets[method] = (remaining - 1, limit, reset)
+
+    def as_dict(self):
+        return {method: {"remaining": remaining, "limit": limit, "reset": reset}
+                for method, (remaining, limit, reset) in self.budgets.items()}
+
+
+# Scheduler in front of the pybit REST client, driven by the runtime loop.
+# Order calls have a lane (queue + threads) of their own, so a burst of dashboard reads can never
+# hold up a recovery leg; the other calls share a second lane where account calls go ahead of
+# queries. Both lanes reuse keep-alive connections from one pooled session, wait for the
+# endpoint's rate-limit budget to reset when it is spent, and identical concurrent reads are
+# merged into a single request.
+class RestClient:
+    def __init__(self, client, runtime, order_workers=2, workers=4):
+        self.client = client
+        self.runtime = runtime
+        self.limits = RateLimits()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=order_workers + workers)
+        session = getattr(client, "client", None)
+        if session is not None:
+            session.mount("https://", adapter)
+        self._lanes = {
+            ORDER: (asyncio.PriorityQueue(), ThreadPoolExecutor(max_workers=order_workers, thread_name_prefix="rest-order"), order_workers),
+            QUERY: (asyncio.PriorityQueue(), ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rest"), workers),
+        }
+        self._inflight = {}
+        self._seq = count()
+        self._workers = []
+        runtime.on_startup(self.start)
+        runtime.on_shutdown(self.stop)
+
+    def start(self):
+        for queue, executor, size in self._lanes.values():
+            self._workers += [asyncio.ensure_future(self._work(queue, executor)) for _ in range(size)]
+
+    # Wait for the tasks still submitting calls (e.g. recovery legs) while the workers are up,
+    # by default until the end of the runtime's shutdown budget
+    async def drain(self, timeout=None):
+        if timeout is None:
+            timeout = self.runtime.remaining()
+        pending = asyncio.all_tasks() - set(self._workers) - {asyncio.current_task()}
+        if pending:
+            await asyncio.wait(pending, timeout=timeout)
+
+    async def stop(self):
+        await self.drain()
+        for worker in self._workers:
+            worker.cancel()
+        for queue, executor, size in self._lanes.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def call(self, method, priority=None, **kwargs):
+        if method in READ_METHODS:
+            key = (method, tuple(sorted(kwargs.items())))
+            if key not in self._inflight:
+                self._inflight[key] = asyncio.ensure_future(self._submit(method, priority, kwargs))
+                self._inflight[key].add_done_callback(lambda future: self._inflight.pop(key, None))
+            return await asyncio.shield(self._inflight[key])
+        return await self._submit(method, priority, kwargs)
+
+    async def _submit(self, method, priority, kwargs):
+        priority = PRIORITIES.get(method, QUERY) if priority is None else priority
+        queue = self._lanes[ORDER if priority == ORDER else QUERY][0]
+        future = asyncio.get_running_loop().create_future()
+        queue.put_nowait((priority, next(self._seq), method, kwargs, future, time.perf_counter()))
+        return await future
+
+    async def _work(self, queue, executor):
+        loop = asyncio.get_running_loop()
+        while True:
+            priority, seq, method, kwargs, future, enqueued = await queue.get()
+            if future.cancelled():
+                continue
+            REST_QUEUE.since(enqueued, method)
+            delay = self.limits.delay(method)
+            if delay:
+                LOGGER.warning(f'Rate limit of {method} reached, waiting {delay:.2f}s')
+                await asyncio.sleep(delay)
+            self.limits.spend(method)
+            started = time.perf_counter()
+            try:
+                result = await loop.run_in_executor(executor, partial(getattr(self.client, method), **kwargs))
+            except Exception as e:
+                if not future.cancelled():
+                    future.set_exception(e)
+                continue
+            finally:
+                REST_CALL.since(started, method)
+            self.limits.update(method, result)
+            if not future.cancelled():
+                future.set_result(result)
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from threading import Thread
+
+LOGGER = logging.getLogger()
+
+
+# One asyncio event loop, on one thread, that runs the stream callbacks and the recovery state machines.
+# Blocking calls (pybit REST requests, websocket subscriptions) go through a fixed-size executor,
+# so the number of threads stays flat no matter how many pairs and orders are active.
+class Runtime:
+    def __init__(self, max_blocking=4):
+        self.max_blocking = max_blocking
+        self.loop = asyncio.new_event_loop()
+        self._executor = ThreadPoolExecutor(max_workers=max_blocking, thread_name_prefix="runtime")
+        self._thread = None
+        self._startup = []
+        self._shutdown = []
+        self._deadline = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self.loop.is_running()
+
+    # Hooks are coroutine functions or plain callables, run on the loop in registration order
+    def on_startup(self, hook):
+        self._startup.append(hook)
+        return hook
+
+    def on_shutdown(self, hook):
+        self._shutdown.append(hook)
+        return hook
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = Thread(target=self.loop.run_forever, name="runtime-loop", daemon=True)
+        self._thread.start()
+        self.spawn(self._run_hooks(self._startup)).result()
+        LOGGER.info('Runtime started')
+
+    # timeout is the budget of the whole shutdown: the hooks bound their waits with remaining() and
+    # are always run to the end, so a slow exchange can't cut the final flushes short
+    def stop(self, timeout=10):
+        if self._thread is None:
+            return
+        self._deadline = time.monotonic() + timeout
+        try:
+            self.spawn(self._run_hooks(reversed(self._shutdown))).result()
+            self.spawn(self._drain(self.remaining())).result()
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout=timeout)
+            self._thread = None
+            self._deadline = None
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        LOGGER.info('Runtime stopped')
+
+    # Seconds left of the shutdown budget, None when the runtime is not stopping
+    def remaining(self):
+        if self._deadline is None:
+            return None
+        return max(0.0, self._deadline - time.monotonic())
+
+    # Let in-flight work (e.g. orders being submitted) finish before the loop goes away
+    async def _drain(self, timeout):
+        tasks = [task for task in asyncio.all_tasks(self.loop) if task is not asyncio.current_task()]
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+
+    async def _run_hooks(self, hooks):
+        for hook in hooks:
+            try:
+                result = hook()
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as e:
+                LOGGER.error(f'Runtime hook {getattr(hook, "__name__", hook)} failed: {e}')
+
+    # Thread-safe: schedule a plain callback on the loop (used by the websocket threads)
+    def call_soon(self, callback, *args):
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    # Thread-safe: run a coroutine on the loop and return a concurrent.futures.Future
+    def spawn(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    # Await a blocking call on the bounded executor
+    async def blocking(self, func, *args, **kwargs):
+        return await self.loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
@@ -0,0 +1,118 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+
+from .strategy import BUY, SELL
+
+LOGGER = logging.getLogger()
+
+QUEUED = "queued"
+DUPLICATE = "duplicate"
+FULL = "full"
+
+
+class InvalidSignal(ValueError):
+    pass
+
+
+def positive(value, name):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise InvalidSignal(f'{name} must be a number')
+    if value <= 0:
+        raise InvalidSignal(f'{name} must be positive')
+    return value
+
+
+# Parse and validate an alert body once: {"ID", "Pair", "Side", "UnitPrice"?, "StartUnits"?, "Secret"?}
+# Returns {"ID", "Pair", "Side", "UnitPrice", "StartUnits"}: UnitPrice None means the last price,
+# StartUnits None the settings. Alerts without an ID get a random one and are never deduplicated.
+def parse_signal(body, settings):
+    try:
+        data = json.loads(body)
+    except (TypeError, ValueError) as e:
+        raise InvalidSignal(f'Body is not JSON: {e}')
+    if not isinstance(data, dict):
+        raise InvalidSignal("Body must be a JSON object")
+    secret = settings.get("SignalSecret")
+    if secret and data.get("Secret") != secret:
+        raise InvalidSignal("Wrong secret")
+    signal_id = str(data.get("ID") or uuid.uuid4().hex)
+    if len(signal_id) > 64:
+        raise InvalidSignal("ID is longer than 64 characters")
+    pair = data.get("Pair")
+    if pair not in settings.pairs:
+        raise InvalidSignal(f'Pair {pair} is not in the settings Pairs')
+    side = data.get("Side")
+    if side not in (BUY, SELL):
+        raise InvalidSignal(f'Side must be {BUY} or {SELL}')
+    unit_price = data.get("UnitPrice")
+    start_units = data.get("StartUnits")
+    return {"ID": signal_id, "Pair": pair, "Side": side,
+            "UnitPrice": positive(unit_price, "UnitPrice") if unit_price not in (None, "") else None,
+            "StartUnits": positive(start_units, "StartUnits") if start_units not in (None, "") else None}
+
+
+# order_link_id of the parent order of a signal: a retried submission can't open it twice
+def signal_link_id(signal_id):
+    return "sig-" + hashlib.sha1(signal_id.encode("utf-8")).hexdigest()[:32]
+
+
+# Bounded queue of signals drained by `workers` tasks on the runtime loop.
+# submit() only checks the ID against the recently seen ones and does a non-blocking put, so the
+# webhook is acknowledged right away; a full queue refuses the signal instead of growing.
+# Must be used from the runtime loop.
+class SignalQueue:
+    def __init__(self, handle, maxsize=1000, workers=8, remember=10000):
+        self.handle = handle
+        self.maxsize = maxsize
+        self.workers = workers
+        self.remember = remember
+        self.seen = OrderedDict()  # signal ID -> time received
+        self.counts = {"queued": 0, "duplicate": 0, "full": 0, "done": 0, "failed": 0}
+        self._queue = None
+        self._tasks = []
+
+    async def start(self):
+        self._queue = asyncio.Queue(self.maxsize)
+        self._tasks = [asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+
+    def submit(self, signal):
+        if signal["ID"] in self.seen:
+            self.counts["duplicate"] += 1
+            return DUPLICATE
+        try:
+            self._queue.put_nowait((signal, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.counts["full"] += 1
+            return FULL
+        self.seen[signal["ID"]] = time.time()
+        if len(self.seen) > self.remember:
+            self.seen.popitem(last=False)
+        self.counts["queued"] += 1
+        return QUEUED
+
+    async def _work(self):
+        while True:
+            signal, received = await self._queue.get()
+            try:
+                await self.handle(signal)
+                self.counts["done"] += 1
+                LOGGER.info(f'Signal {signal["ID"]} {signal["Side"]} {signal["Pair"]} handled in {(time.perf_counter() - received) * 1000:.1f}ms')
+            except Exception as e:
+                self.counts["failed"] += 1
+                LOGGER.error(f'Signal {signal["ID"]} {signal["Side"]} {signal["Pair"]} failed: {e}')
+            finally:
+                self._queue.task_done()
+
+    def status(self):
+        return dict(self.counts, pending=self._queue.qsize() if self._queue is not None else 0)
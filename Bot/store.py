@@ -0,0 +1,99 @@
+import logging
+import queue
+from threading import Event, Thread
+
+from django.db import close_old_connections, transaction
+
+from .models import RecoveryLeg, RecoverySequence
+
+LOGGER = logging.getLogger()
+
+
+# Write-behind persistence of the recovery sequences.
+# The recovery engine only enqueues snapshots of the sequences it changed (a non-blocking put);
+# a single writer thread coalesces them and writes each batch in one transaction with bulk
+# queries, so the trigger path never waits on the database.
+class SequenceStore:
+    def __init__(self, flush_interval=0.5, batch_size=500):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._queue = queue.SimpleQueue()
+        self._stopped = Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = Thread(target=self._run, name="sequence-store", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    # Called by the recovery engine: latest state of one sequence, legs copied
+    def save(self, order_id, pair, side, status, legs):
+        self._queue.put((order_id, {"pair": pair, "side": side, "status": status, "legs": [dict(leg) for leg in legs]}))
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                LOGGER.error(f'Saving recovery sequences failed: {e}')
+        close_old_connections()
+
+    # Write everything queued so far; later snapshots of a sequence replace earlier ones
+    def flush(self):
+        pending = {}
+        while True:
+            try:
+                order_id, snapshot = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            pending[order_id] = snapshot
+            if len(pending) >= self.batch_size:
+                self._write(pending)
+                pending = {}
+        if pending:
+            self._write(pending)
+
+    def _write(self, pending):
+        with transaction.atomic():
+            existing = RecoverySequence.objects.in_bulk(list(pending), field_name="order_id")
+            created = RecoverySequence.objects.bulk_create([
+                RecoverySequence(order_id=order_id, pair=snapshot["pair"], side=snapshot["side"], status=snapshot["status"])
+                for order_id, snapshot in pending.items() if order_id not in existing])
+            # bulk_create does not return primary keys on every backend, read them back
+            if created:
+                existing.update(RecoverySequence.objects.in_bulk([sequence.order_id for sequence in created], field_name="order_id"))
+                RecoveryLeg.objects.bulk_create([
+                    RecoveryLeg(sequence=existing[sequence.order_id], index=index, side=leg["Side"], unit_price=leg["UnitPrice"],
+                                units=leg["Units"], tp=leg["TP"], sl=leg["SL"], triggered=leg["Triggered"])
+                    for sequence in created for index, leg in enumerate(pending[sequence.order_id]["legs"])])
+            created_ids = {sequence.order_id for sequence in created}
+            updated = [existing[order_id] for order_id in pending if order_id not in created_ids]
+            for sequence in updated:
+                sequence.status = pending[sequence.order_id]["status"]
+            RecoverySequence.objects.bulk_update(updated, ["status"])
+            legs = RecoveryLeg.objects.filter(sequence__in=updated).select_related("sequence")
+            changed = []
+            for leg in legs:
+                snapshot_legs = pending[leg.sequence.order_id]["legs"]
+                if leg.index < len(snapshot_legs) and leg.triggered != snapshot_legs[leg.index]["Triggered"]:
+                    leg.triggered = snapshot_legs[leg.index]["Triggered"]
+                    changed.append(leg)
+            RecoveryLeg.objects.bulk_update(changed, ["triggered"])
+
+    # Every open sequence with its legs, in one query: {order_id: {"Pair", "Side", "Filled", "Legs"}}
+    def load_open(self):
+        sequences = {}
+        legs = (RecoveryLeg.objects.filter(sequence__status__in=RecoverySequence.OPEN_STATUSES)
+                .select_related("sequence").order_by("sequence_id", "index"))
+        for leg in legs:
+            sequence = sequences.setdefault(leg.sequence.order_id, {
+                "Pair": leg.sequence.pair, "Side": leg.sequence.side,
+                "Filled": leg.sequence.status == RecoverySequence.ACTIVE, "Legs": []})
+            sequence["Legs"].append(leg.as_leg())
+        return sequences
@@ -0,0 +1,75 @@
+import numpy as np
+
+from .instruments import DEFAULT
+
+BUY = "Buy"
+SELL = "Sell"
+
+
+def opposite(side):
+    return SELL if side == BUY else BUY
+
+
+# Long and short TP/SL around unit_price, on the instrument's tick size.
+# Works on floats and, element-wise, on NumPy arrays
+def get_tp_sl(unit_price, tp_sl_ticks, tick_price, zone_divider, instrument=DEFAULT):
+    rounded = instrument.round_price
+    recovery_zone_ticks = tp_sl_ticks / zone_divider
+    tp_l = rounded(unit_price + (tp_sl_ticks * tick_price))
+    tp_s = rounded(unit_price - (tp_sl_ticks * tick_price))
+    sl_l = rounded(unit_price - ((recovery_zone_ticks + tp_sl_ticks) * tick_price))
+    sl_s = rounded(unit_price + ((recovery_zone_ticks + tp_sl_ticks) * tick_price))
+    return tp_l, tp_s, sl_l, sl_s
+
+
+# TP and SL of an order on side placed at unit_price
+def order_tp_sl(side, unit_price, tp_sl_ticks, tick_price, zone_divider, instrument=DEFAULT):
+    tp_l, tp_s, sl_l, sl_s = get_tp_sl(unit_price, tp_sl_ticks, tick_price, zone_divider, instrument)
+    return (tp_l, sl_l) if side == BUY else (tp_s, sl_s)
+
+
+# Zone offset of every leg when the settings give none: the opposite side one recovery zone away,
+# then the parent side back at unit_price, and so on
+def default_zone_offsets(legs):
+    return tuple(1.0 if index % 2 == 0 else 0.0 for index in range(legs))
+
+
+# Zone offsets of `legs` legs: the given ones, cut or completed with the defaults
+def fit_zone_offsets(legs, zone_offsets=()):
+    zone_offsets = tuple(float(offset) for offset in zone_offsets[:legs])
+    return zone_offsets + default_zone_offsets(legs)[len(zone_offsets):]
+
+
+# Every recovery leg of a parent order at once, as NumPy arrays of one entry per leg:
+# {"buy": bool, "price", "units", "tp", "sl"}. There are as many legs as base_times (unit multipliers
+# of start_units); the sides alternate starting with the opposite side, and leg i waits
+# zone_offsets[i] recovery zones from unit_price against the parent. Every leg keeps the TP/SL of
+# its side around unit_price, so the whole ladder exits at the same levels. Prices and units are
+# rounded to the instrument's tick size and quantity step.
+def ladder(side, unit_price, start_units, tp_sl_ticks, tick_price, zone_divider, base_times, zone_offsets=None, instrument=DEFAULT):
+    legs = len(base_times)
+    offsets = np.asarray(zone_offsets if zone_offsets is not None else default_zone_offsets(legs), dtype=np.float64)
+    buy = np.arange(legs) % 2 == (1 if side == BUY else 0)
+    direction = -1.0 if side == BUY else 1.0
+    recovery_zone_ticks = tp_sl_ticks / zone_divider
+    tp_l, tp_s, sl_l, sl_s = get_tp_sl(unit_price, tp_sl_ticks, tick_price, zone_divider, instrument)
+    return {"buy": buy,
+            "price": instrument.round_price(unit_price + direction * offsets * (recovery_zone_ticks * tick_price)),
+            "units": instrument.round_qty(start_units * np.asarray(base_times, dtype=np.float64)),
+            "tp": np.where(buy, tp_l, tp_s),
+            "sl": np.where(buy, sl_l, sl_s)}
+
+
+# Recovery legs of a parent order, as stored in recovery_trades[pair]: the ladder as leg dictionaries.
+# Used by the views, the engine and the backtester, so all of them build the exact same legs.
+def build_legs(side, unit_price, start_units, tp_sl_ticks, tick_price, zone_divider, base_times, zone_offsets=None, instrument=DEFAULT):
+    table = ladder(side, unit_price, start_units, tp_sl_ticks, tick_price, zone_divider, base_times, zone_offsets, instrument)
+    return [{"Side": BUY if buy else SELL, "Triggered": False, "UnitPrice": price, "Units": units, "TP": tp, "SL": sl}
+            for buy, price, units, tp, sl in zip(table["buy"].tolist(), table["price"].tolist(), table["units"].tolist(),
+                                                 table["tp"].tolist(), table["sl"].tolist())]
+
+
+# Legs from a settings snapshot (BotSettings), for start_units or the settings' StartUnits
+def legs_from_settings(settings, side, unit_price, start_units=None, instrument=DEFAULT):
+    return build_legs(side, unit_price, start_units if start_units is not None else settings.start_units, settings.tp_sl_ticks,
+                      settings.tick_price, settings.zone_divider, settings.base_times, settings.zone_offsets, instrument)
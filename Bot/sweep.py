@@ -0,0 +1,141 @@
+import heapq
+import itertools
+import logging
+import os
+import random
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import numpy as np
+
+from .backtest import TAKER_FEE, load_prices, run_backtest, summarize
+from .config import BotSettings
+
+LOGGER = logging.getLogger()
+
+# Settings.json keys that can be swept, and the BotSettings field each one maps to.
+# The unit multiplier of every leg of the ladder can be swept too, as BaseTimes1, BaseTimes2...
+PARAMETERS = {
+    "TPSLTicks": "tp_sl_ticks",
+    "ZoneDivider": "zone_divider",
+    "Leverage": "leverage",
+}
+LEG_PARAMETER = "BaseTimes"
+
+
+def leg_parameters(settings):
+    return [f'{LEG_PARAMETER}{index}' for index in range(1, len(settings.base_times) + 1)]
+
+
+def is_parameter(name):
+    return name in PARAMETERS or (name.startswith(LEG_PARAMETER) and name[len(LEG_PARAMETER):].isdigit())
+
+
+# BotSettings.replace() keyword of a swept key: BaseTimes2 -> base_times2
+def parameter_field(name):
+    return PARAMETERS[name] if name in PARAMETERS else f'base_times{name[len(LEG_PARAMETER):]}'
+
+
+# Current value of every sweepable key: {"TPSLTicks": 200.0, ..., "BaseTimes1": 1.55, ...}
+def defaults(settings):
+    values = {name: getattr(settings, field) for name, field in PARAMETERS.items()}
+    values.update(zip(leg_parameters(settings), settings.base_times))
+    return values
+
+
+# Memory-mapped price arrays of the worker process, opened once by the pool initializer
+_prices = {}
+
+
+# Every combination of the swept values: {"TPSLTicks": [100, 200], "ZoneDivider": [2]} -> [{...}, {...}]
+def grid(space):
+    keys = list(space)
+    return [dict(zip(keys, values)) for values in itertools.product(*(space[key] for key in keys))]
+
+
+# n combinations drawn without replacement from the grid, without building it
+def random_sample(space, n, seed=None):
+    keys = list(space)
+    sizes = [len(space[key]) for key in keys]
+    total = 1
+    for size in sizes:
+        total *= size
+    combos = []
+    for index in random.Random(seed).sample(range(total), min(n, total)):
+        combo = {}
+        for key, size in zip(reversed(keys), reversed(sizes)):
+            index, i = divmod(index, size)
+            combo[key] = space[key][i]
+        combos.append({key: combo[key] for key in keys})
+    return combos
+
+
+# Write the price history of every pair once as .npy files; workers map them read-only instead of
+# receiving pickled copies, so all processes share the same pages of the OS cache
+def share_prices(paths, directory):
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    shared = {}
+    for pair, path in paths.items():
+        target = directory / f'{pair}.npy'
+        source = Path(path)
+        if source.suffix == ".npy":
+            target = source
+        elif not target.exists() or target.stat().st_mtime < source.stat().st_mtime:
+            np.save(target, load_prices(source, pair))
+        shared[pair] = str(target)
+    return shared
+
+
+def _open_prices(shared):
+    _prices.clear()
+    _prices.update({pair: np.load(path, mmap_mode="r") for pair, path in shared.items()})
+
+
+# Worker: run a chunk of combinations on one pair (settings travel as the raw dict)
+def _evaluate(settings, pair, combos, fee):
+    settings = BotSettings.from_dict(settings)
+    prices = _prices[pair]
+    rows = []
+    for combo in combos:
+        candidate = settings.replace(**{parameter_field(key): value for key, value in combo.items()})
+        summary = summarize(run_backtest(prices, candidate, fee=fee))
+        margin = summary["MaxExposure"] / candidate.leverage if candidate.leverage else 0.0
+        summary["ReturnOnMargin"] = round(summary["PnL"] / margin, 6) if margin else 0.0
+        rows.append({"Pair": pair, **combo, **summary})
+    return rows
+
+
+# Runs every combination on every pair in a process pool and yields result rows as chunks complete
+def sweep(settings, shared, combos, workers=None, chunk_size=16, fee=TAKER_FEE):
+    workers = workers or os.cpu_count()
+    chunks = [combos[i:i + chunk_size] for i in range(0, len(combos), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_open_prices, initargs=(shared,)) as pool:
+        pending = {pool.submit(_evaluate, settings.to_dict(), pair, chunk, fee) for pair in shared for chunk in chunks}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+
+
+# Best combinations so far, ranked by their PnL summed over the pairs
+class Ranking:
+    def __init__(self, pairs, top=20):
+        self.pairs = len(pairs)
+        self.top = top
+        self._totals = {}
+
+    # Returns the combination's total once every pair has reported, None until then
+    def add(self, row):
+        key = tuple((name, value) for name, value in row.items() if is_parameter(name))
+        total = self._totals.setdefault(key, {"Pairs": 0, "PnL": 0.0, "MaxDrawdown": 0.0, "ReturnOnMargin": 0.0})
+        total["Pairs"] += 1
+        total["PnL"] += row["PnL"]
+        total["MaxDrawdown"] = max(total["MaxDrawdown"], row["MaxDrawdown"])
+        total["ReturnOnMargin"] += row["ReturnOnMargin"] / self.pairs
+        return total if total["Pairs"] == self.pairs else None
+
+    def ranked(self):
+        complete = [(key, total) for key, total in self._totals.items() if total["Pairs"] == self.pairs]
+        best = heapq.nlargest(self.top, complete, key=lambda item: item[1]["PnL"])
+        return [{**dict(key), **{name: round(value, 6) for name, value in total.items()}} for key, total in best]
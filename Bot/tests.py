@@ -1,7 +1,44 @@
+import asyncio
+import json
+import logging
+import os
+import queue
+import tempfile
+import time
+from unittest import mock
+
+import numpy as np
 from django.contrib.auth.models import AnonymousUser, User
-from django.test import TestCase, RequestFactory
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, RequestFactory
+from pybit.exceptions import InvalidRequestError
 
-from .views import index
+from .backtest import load_prices, run_backtest, run_sequence
+from .bench import compare, run_benchmarks
+from .balance import BalanceCache
+from .config import BotSettings, SettingsStore
+from .dashboard import Dashboard
+from .fills import FillStore, fills_page
+from .instruments import DEFAULT, Instrument, Instruments
+from .ipc import EngineClient, EngineError, EngineUnavailable, dumps, serve
+from .logs import BatchQueueListener, BatchRotatingFileHandler, JsonFormatter, LazyQueueHandler, SymbolSampler
+from .metrics import REST_CALL, Registry
+from .models import Fill, RecoverySequence
+from .orderbook import OrderBooks
+from .orders import OrderOps
+from .positions import PositionCache
+from .paper import PaperExchange, paper_engine, run_load_test
+from .prices import DjangoCachePriceBackend, PriceCache, PriceTick
+from .recorder import TickRecorder, load_ticks
+from .recovery import EXCHANGE, RecoveryEngine
+from .signals import InvalidSignal, parse_signal, signal_link_id
+from .rest import RestClient
+from .runtime import Runtime
+from .store import SequenceStore
+from .strategy import build_legs, get_tp_sl, legs_from_settings
+from .sweep import Ranking, defaults, grid, random_sample, share_prices, sweep
+from .triggers import ABOVE, BELOW, TriggerIndex
+from . import views
+from .views import index, trades
 
 
 class SimpleTest(TestCase):
@@ -18,3 +55,879 @@ class SimpleTest(TestCase):
         response = index(request)
         self.assertEqual(response.status_code, 200)
 
+
+
+class PriceCacheTest(SimpleTestCase):
+    def test_update_and_read(self):
+        cache = PriceCache()
+        self.assertIsNone(cache.price("SOLUSDT"))
+        first = cache.update("SOLUSDT", "40.49")
+        second = cache.update("SOLUSDT", 40.5)
+        self.assertEqual(cache.price("SOLUSDT"), 40.5)
+        self.assertEqual(cache.get("SOLUSDT").seq, second.seq)
+        self.assertGreater(second.seq, first.seq)
+
+    def test_django_cache_backend_shared_between_processes(self):
+        writer, reader = DjangoCachePriceBackend(prefix="test-price:"), DjangoCachePriceBackend(prefix="test-price:")
+        self.addCleanup(writer.cache.clear)
+        PriceCache(writer).update("SOLUSDT", 40.5)
+        PriceCache(writer).update("BTCUSDT", 30000.0)
+        # Another worker never published a price but sees both
+        self.assertEqual({symbol: tick.price for symbol, tick in PriceCache(reader).all().items()}, {"SOLUSDT": 40.5, "BTCUSDT": 30000.0})
+
+
+class StubClient:
+    def __init__(self):
+        self.orders = []
+
+    def place_active_order(self, **kwargs):
+        self.orders.append(kwargs)
+        return {"result": kwargs}
+
+
+class RecoveryEngineTest(SimpleTestCase):
+    def test_legs_fire_on_ticks_after_fill(self):
+        client = StubClient()
+        recovery_trades = {"SOLUSDT": [
+            {"Side": "Sell", "Triggered": False, "UnitPrice": 39.0, "Units": 46.5, "TP": 38.0, "SL": 43.0},
+            {"Side": "Buy", "Triggered": False, "UnitPrice": 40.0, "Units": 29.7, "TP": 42.0, "SL": 37.0},
+            {"Side": "Sell", "Triggered": False, "UnitPrice": 39.0, "Units": 45.0, "TP": 38.0, "SL": 43.0}]}
+        runtime = Runtime()
+        rest = RestClient(client, runtime)
+        engine = RecoveryEngine(rest=rest, recovery_trades=recovery_trades, runtime=runtime)
+        runtime.start()
+        self.addCleanup(runtime.stop)
+        prices = PriceCache()
+        prices.subscribe(engine.on_tick)
+        engine.arm({"order_id": "1", "Pair": "SOLUSDT", "side": "Buy", "order_status": "Created"}, recovery_trades["SOLUSDT"])
+        prices.update("SOLUSDT", 38.5)
+        engine.on_order({"data": [{"order_id": "1", "symbol": "SOLUSDT", "order_status": "Filled"}]})
+        for price in (39.5, 38.9, 39.5, 40.1, 38.0):
+            prices.update("SOLUSDT", price)
+        runtime.stop()
+        self.assertEqual([order["side"] for order in client.orders], ["Sell", "Buy", "Sell"])
+        self.assertEqual(engine.latency.count, 3)
+        self.assertEqual(engine.sequences, {})
+        self.assertEqual(len(engine.triggers), 0)
+
+
+    def test_exchange_mode_arms_conditional_legs_in_turn(self):
+        class ConditionalStub(StubClient):
+            def __init__(self):
+                super().__init__()
+                self.conditional = []
+
+            def place_conditional_order(self, **kwargs):
+                self.conditional.append(kwargs)
+                return {"result": kwargs}
+
+        client = ConditionalStub()
+        legs = [{"Side": "Sell", "Triggered": False, "UnitPrice": 39.0, "Units": 46.5, "TP": 38.0, "SL": 43.0},
+                {"Side": "Buy", "Triggered": False, "UnitPrice": 40.0, "Units": 29.7, "TP": 42.0, "SL": 37.0},
+                {"Side": "Sell", "Triggered": False, "UnitPrice": 39.0, "Units": 45.0, "TP": 38.0, "SL": 43.0}]
+        runtime = Runtime()
+        engine = RecoveryEngine(rest=RestClient(client, runtime), recovery_trades={}, runtime=runtime, mode=EXCHANGE)
+        runtime.start()
+        self.addCleanup(runtime.stop)
+        prices = PriceCache()
+        prices.subscribe(engine.on_tick)
+        prices.update("SOLUSDT", 40.0)
+        engine.arm({"order_id": "1", "Pair": "SOLUSDT", "side": "Buy", "order_status": "Filled"}, legs)
+
+        def wait_for(count):
+            deadline = time.time() + 5
+            while len(client.conditional) < count and time.time() < deadline:
+                time.sleep(0.01)
+
+        wait_for(1)
+        first = client.conditional[0]
+        self.assertEqual((first["side"], first["stop_px"], first["base_price"], first["take_profit"]), ("Sell", 39.0, 40.0, 38.0))
+        # Ticks no longer fire the legs, the exchange does
+        prices.update("SOLUSDT", 38.9)
+        engine.on_stop_order({"data": [{"order_link_id": first["order_link_id"], "order_status": "Triggered", "symbol": "SOLUSDT"}]})
+        wait_for(2)
+        self.assertEqual((client.conditional[1]["side"], client.conditional[1]["stop_px"], client.conditional[1]["base_price"]), ("Buy", 40.0, 38.9))
+        runtime.stop()
+        self.assertEqual(client.orders, [])
+        self.assertEqual(engine.status()["conditional_legs"], 1)
+        self.assertTrue(legs[0]["Triggered"])
+
+
+    def test_restored_pending_sequences_are_reconciled(self):
+        class QueryStub(StubClient):
+            statuses = {"1": "Filled", "2": "Rejected", "3": "New"}
+
+            def query_active_order(self, symbol, order_id):
+                return {"result": {"order_id": order_id, "symbol": symbol, "order_status": self.statuses[order_id]}}
+
+        class StoreStub:
+            def __init__(self):
+                self.saved = []
+
+            def save(self, order_id, pair, side, status, legs):
+                self.saved.append((order_id, status))
+
+        def legs():
+            return [{"Side": "Sell", "Triggered": False, "UnitPrice": 39.0, "Units": 46.5, "TP": 38.0, "SL": 43.0}]
+
+        runtime = Runtime()
+        store = StoreStub()
+        engine = RecoveryEngine(rest=RestClient(QueryStub(), runtime), recovery_trades={}, runtime=runtime, store=store)
+        runtime.start()
+        self.addCleanup(runtime.stop)
+        engine.restore({order_id: {"Pair": "SOLUSDT", "Side": "Buy", "Filled": False, "Legs": legs()} for order_id in ("1", "2", "3")})
+        runtime.spawn(engine.reconcile()).result()
+        self.assertEqual(sorted(engine.sequences), ["1", "3"])
+        self.assertTrue(engine.sequences["1"]["Filled"])
+        self.assertFalse(engine.sequences["3"]["Filled"])
+        self.assertEqual(engine.triggers.levels("SOLUSDT", BELOW), [39.0])
+        self.assertEqual(store.saved, [("1", "Active"), ("2", "Cancelled")])
+
+
+class TriggerIndexTest(SimpleTestCase):
+    def test_pop_crossed_levels(self):
+        index = TriggerIndex()
+        index.add("SOLUSDT", BELOW, 39.0, "sell-39")
+        index.add("SOLUSDT", BELOW, 38.0, "sell-38")
+        index.add("SOLUSDT", ABOVE, 41.0, "buy-41")
+        index.add("SOLUSDT", ABOVE, 42.0, "buy-42")
+        removed = index.add("SOLUSDT", ABOVE, 40.5, "removed")
+        self.assertEqual(index.remove(removed), "removed")
+        self.assertEqual(index.pop_crossed("SOLUSDT", 40.0), [])
+        self.assertEqual(index.pop_crossed("SOLUSDT", 38.5), ["sell-39"])
+        self.assertEqual(index.pop_crossed("SOLUSDT", 45.0), ["buy-41", "buy-42"])
+        self.assertEqual(index.levels("SOLUSDT", BELOW), [38.0])
+        self.assertEqual(len(index), 1)
+
+
+class EngineIPCTest(SimpleTestCase):
+    def test_call_round_trip(self):
+        async def add(a, b):
+            return a + b
+
+        def fail():
+            raise ValueError("boom")
+
+        runtime = Runtime()
+        runtime.start()
+        self.addCleanup(runtime.stop)
+        server = runtime.spawn(serve({"add": add, "fail": fail}, "127.0.0.1:0")).result()
+        port = server.sockets[0].getsockname()[1]
+        self.addCleanup(server.close)
+        client = EngineClient(f"127.0.0.1:{port}")
+        self.addCleanup(client.close)
+        self.assertEqual(client.call("add", a=1, b=2), 3)
+        self.assertEqual(client.call("add", a=2, b=2), 4)
+        with self.assertRaises(EngineError):
+            client.call("fail")
+
+    def test_request_dropped_after_reading_is_not_sent_again(self):
+        handled = []
+
+        # The engine answers the first request, then runs the second and goes away before answering
+        async def handle(reader, writer):
+            while await reader.readline():
+                handled.append(1)
+                if len(handled) > 1:
+                    break
+                writer.write(dumps({"ok": True, "result": None}))
+                await writer.drain()
+            writer.close()
+
+        runtime = Runtime()
+        runtime.start()
+        self.addCleanup(runtime.stop)
+        server = runtime.spawn(asyncio.start_server(handle, "127.0.0.1", 0)).result()
+        self.addCleanup(server.close)
+        client = EngineClient("127.0.0.1:%d" % server.sockets[0].getsockname()[1], timeout=5)
+        self.addCleanup(client.close)
+        client.call("balance")
+        with self.assertRaises(EngineUnavailable):
+            client.call("place_order", order={"symbol": "SOLUSDT"})
+        time.sleep(0.1)
+        self.assertEqual(len(handled), 2)
+
+
+class BalanceCacheTest(SimpleTestCase):
+    def test_concurrent_reads_share_one_fetch(self):
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "100.5"
+
+        async def read():
+            cache = BalanceCache(fetch, ttl=60)
+            snapshots = await asyncio.gather(*[cache.get() for _ in range(10)])
+            cache.set(99)
+            return snapshots, await cache.get()
+
+        snapshots, pushed = asyncio.run(read())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual({snapshot["balance"] for snapshot in snapshots}, {100.5})
+        self.assertEqual(pushed["balance"], 99.0)
+
+
+class SettingsStoreTest(SimpleTestCase):
+    def test_reload_on_update(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'Settings.json')
+            with open(path, 'w') as f:
+                json.dump({"Settings": {"Pairs": ["SOLUSDT"], "TPSLTicks": 200, "ZoneDivider": 2}}, f)
+            store = SettingsStore(path, check_interval=0)
+            settings = store.get()
+            self.assertEqual(settings.pairs, ("SOLUSDT",))
+            self.assertEqual(settings.recovery_zone_ticks, 100)
+            updated = settings.to_dict()
+            updated["Pairs"].append("BTCUSDT")
+            store.update(updated)
+            self.assertEqual(store.get()["Pairs"], ("SOLUSDT", "BTCUSDT"))
+            self.assertEqual(settings.pairs, ("SOLUSDT",))
+            self.assertEqual(os.listdir(directory), ['Settings.json'])
+
+
+class SequenceStoreTest(TestCase):
+    def test_write_behind_and_load_open(self):
+        store = SequenceStore()
+        legs = [{"Side": "Sell", "Triggered": False, "UnitPrice": 39.0, "Units": 46.5, "TP": 38.0, "SL": 43.0},
+                {"Side": "Buy", "Triggered": False, "UnitPrice": 40.0, "Units": 29.7, "TP": 42.0, "SL": 37.0}]
+        store.save("1", "SOLUSDT", "Buy", "Pending", legs)
+        legs[0]["Triggered"] = True
+        store.save("1", "SOLUSDT", "Buy", "Active", legs)
+        store.save("2", "BTCUSDT", "Sell", "Pending", legs)
+        store.flush()
+        store.save("2", "BTCUSDT", "Sell", "Cancelled", legs)
+        store.flush()
+        self.assertEqual(RecoverySequence.objects.count(), 2)
+        sequences = store.load_open()
+        self.assertEqual(list(sequences), ["1"])
+        self.assertTrue(sequences["1"]["Filled"])
+        self.assertEqual(sequences["1"]["Legs"], legs)
+
+
+class RestClientTest(SimpleTestCase):
+    def test_identical_reads_are_merged(self):
+        class SlowClient:
+            calls = []
+
+            def query_active_order(self, **kwargs):
+                self.calls.append(kwargs)
+                time.sleep(0.05)
+                return {"result": [], "rate_limit_status": 99, "rate_limit": 100, "rate_limit_reset_ms": 0}
+
+        async def read(rest):
+            return await asyncio.gather(*[rest.call("query_active_order", symbol="SOLUSDT") for _ in range(5)],
+                                        rest.call("query_active_order", symbol="BTCUSDT"))
+
+        client = SlowClient()
+        runtime = Runtime()
+        rest = RestClient(client, runtime)
+        runtime.start()
+        self.addCleanup(runtime.stop)
+        results = runtime.spawn(read(rest)).result(timeout=5)
+        self.assertEqual(len(results), 6)
+        self.assertEqual(len(client.calls), 2)
+        self.assertEqual(rest.limits.as_dict()["query_active_order"]["remaining"], 99)
+
+
+    def test_shutdown_flush_runs_within_the_budget(self):
+        class StuckClient:
+            def place_active_order(self, **kwargs):
+                time.sleep(1)
+                return {"result": kwargs}
+
+        runtime = Runtime()
+        rest = RestClient(StuckClient(), runtime)
+        flushed = []
+
+        # Like Engine.stop_store: the legs still being placed, then the final flush
+        async def stop_store():
+            await rest.drain()
+            flushed.append(runtime.remaining())
+
+        runtime.on_shutdown(stop_store)
+        runtime.start()
+        runtime.spawn(rest.call("place_active_order", symbol="SOLUSDT"))
+        time.sleep(0.05)
+        started = time.monotonic()
+        runtime.stop(timeout=0.3)
+        self.assertLess(time.monotonic() - started, 0.9)
+        self.assertEqual(len(flushed), 1)
+        self.assertIsNone(runtime.remaining())
+
+
+class BacktestTest(SimpleTestCase):
+    settings = BotSettings.from_dict({"Side": "Buy", "StartUnits": 30, "TPSLTicks": 200, "ZoneDivider": 2, "TickPrice": 0.01,
+                                      "BaseTimes1": 1.55, "BaseTimes2": 0.99, "BaseTimes3": 1.5})
+
+    def test_legs_match_live_rules(self):
+        prices = np.array([40.0, 39.5, 38.9, 39.5, 40.1, 38.0, 36.5])
+        fills = run_sequence(prices, 0, "Buy", self.settings)
+        self.assertEqual([(fill.side, fill.entry_index) for fill in fills], [("Buy", 0), ("Sell", 2), ("Buy", 4), ("Sell", 5)])
+        self.assertEqual([fill.units for fill in fills[1:]], [leg["Units"] for leg in legs_from_settings(self.settings, "Buy", 40.0)])
+
+    def test_next_leg_stays_armed_when_flat(self):
+        # Parent hits its TP at 42, then the price falls through the 1st leg at 39
+        prices = np.array([40.0, 42.0, 41.0, 38.9, 38.0])
+        fills = run_sequence(prices, 0, "Buy", self.settings)
+        self.assertEqual([(fill.side, fill.entry_index) for fill in fills], [("Buy", 0), ("Sell", 3)])
+        fills = run_sequence(prices, 0, "Buy", self.settings, stop_when_flat=True)
+        self.assertEqual([(fill.side, fill.entry_index) for fill in fills], [("Buy", 0)])
+        self.assertEqual(list(run_backtest(prices, self.settings, fee=0, stop_when_flat=True)["Start"]), [0, 2])
+        self.assertEqual(list(run_backtest(prices, self.settings, fee=0)["Start"]), [0])
+
+    def test_sequences_run_back_to_back(self):
+        # Parent hits its TP at 42 before any leg fires, the next sequence starts on the following tick
+        prices = np.array([40.0, 41.0, 42.0, 42.5, 40.0, 41.0])
+        results = run_backtest(prices, self.settings, fee=0)
+        self.assertEqual(list(results["Start"]), [0, 3])
+        self.assertAlmostEqual(results["PnL"][0], 60.0)
+        self.assertEqual(results["Open"][1], 1)
+        self.assertAlmostEqual(results["MaxDrawdown"][1], 91.5)
+
+
+class LadderTest(SimpleTestCase):
+    def test_three_legs_of_the_recovery_zone(self):
+        legs = legs_from_settings(BacktestTest.settings, "Buy", 40.0)
+        self.assertEqual(legs, [{"Side": "Sell", "Triggered": False, "UnitPrice": 39.0, "Units": 46.5, "TP": 38.0, "SL": 43.0},
+                                {"Side": "Buy", "Triggered": False, "UnitPrice": 40.0, "Units": 29.7, "TP": 42.0, "SL": 37.0},
+                                {"Side": "Sell", "Triggered": False, "UnitPrice": 39.0, "Units": 45.0, "TP": 38.0, "SL": 43.0}])
+
+    def test_legs_and_offsets_from_settings(self):
+        settings = BotSettings.from_dict({"StartUnits": 10, "TPSLTicks": 200, "ZoneDivider": 2, "TickPrice": 0.01,
+                                          "BaseTimes": [1, 2, 3, 4, 5], "ZoneOffsets": [1, 0, 2]})
+        self.assertEqual(settings.zone_offsets, (1.0, 0.0, 2.0, 0.0, 1.0))
+        legs = legs_from_settings(settings, "Sell", 40.0)
+        self.assertEqual([(leg["Side"], leg["UnitPrice"], leg["Units"]) for leg in legs],
+                         [("Buy", 41.0, 10.0), ("Sell", 40.0, 20.0), ("Buy", 42.0, 30.0), ("Sell", 40.0, 40.0), ("Buy", 41.0, 50.0)])
+        self.assertEqual(settings.replace(base_times2=9).base_times, (1.0, 9.0, 3.0, 4.0, 5.0))
+        self.assertEqual(BacktestTest.settings.replace(base_times=(1.0,) * 4).zone_offsets, (1.0, 0.0, 1.0, 0.0))
+
+    def test_vectorized_tp_sl_matches_scalar(self):
+        prices = np.array([40.0, 39.0, 41.37])
+        arrays = get_tp_sl(prices, 200, 0.01, 2)
+        for i, price in enumerate(prices.tolist()):
+            self.assertEqual([float(values[i]) for values in arrays], list(get_tp_sl(price, 200, 0.01, 2)))
+
+    def test_deep_ladder_replays_in_order(self):
+        settings = BacktestTest.settings.replace(base_times=(1.0,) * 6)
+        # Down through the zone, back up, three times over
+        prices = np.array([40.0, 38.9, 40.1, 38.9, 40.1, 38.9, 40.1])
+        fills = run_sequence(prices, 0, "Buy", settings)
+        self.assertEqual([fill.entry_index for fill in fills], list(range(7)))
+        self.assertEqual(len(build_legs("Buy", 40.0, 1.0, 200, 0.01, 2, (1.0,) * 12)), 12)
+
+
+class SweepTest(SimpleTestCase):
+    def test_random_sample_is_drawn_from_the_grid(self):
+        space = {"TPSLTicks": [100, 200, 300], "ZoneDivider": [2, 3], "Leverage": [5, 10]}
+        combos = random_sample(space, 5, seed=1)
+        self.assertEqual(len(combos), 5)
+        self.assertEqual(len({tuple(combo.items()) for combo in combos}), 5)
+        self.assertTrue(all(combo in grid(space) for combo in combos))
+
+    def test_sweep_ranks_combinations_over_shared_prices(self):
+        settings = BacktestTest.settings
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "SOLUSDT.npy")
+            np.save(path, np.array([40.0, 41.0, 42.0, 42.5, 40.0, 41.0, 44.0, 45.0]))
+            shared = share_prices({"SOLUSDT": path}, directory)
+            ranking = Ranking(shared, top=2)
+            rows = list(sweep(settings, shared, grid({"TPSLTicks": [100, 200, 300]}), workers=1, chunk_size=2))
+            for row in rows:
+                ranking.add(row)
+        self.assertEqual(sorted(row["TPSLTicks"] for row in rows), [100, 200, 300])
+        ranked = ranking.ranked()
+        self.assertEqual(len(ranked), 2)
+        self.assertGreaterEqual(ranked[0]["PnL"], ranked[1]["PnL"])
+
+    def test_every_leg_of_the_ladder_is_swept(self):
+        settings = BotSettings.from_dict({"Side": "Buy", "StartUnits": 30, "TPSLTicks": 200, "ZoneDivider": 2, "TickPrice": 0.01,
+                                          "Leverage": 5, "BaseTimes": [1.5, 1.0]})
+        space = defaults(settings)
+        self.assertEqual(space, {"TPSLTicks": 200.0, "ZoneDivider": 2.0, "Leverage": 5.0, "BaseTimes1": 1.5, "BaseTimes2": 1.0})
+        with self.assertRaisesMessage(ValueError, "base_times3: the recovery ladder has 2 legs"):
+            settings.replace(base_times3=2.0)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "SOLUSDT.npy")
+            np.save(path, np.array([40.0, 38.9, 40.1, 38.9, 36.0]))
+            shared = share_prices({"SOLUSDT": path}, directory)
+            ranking = Ranking(shared)
+            for row in sweep(settings, shared, grid({"BaseTimes2": [1.0, 2.0]}), workers=1):
+                ranking.add(row)
+        self.assertEqual(sorted(row["BaseTimes2"] for row in ranking.ranked()), [1.0, 2.0])
+
+
+class TickRecorderTest(SimpleTestCase):
+    def test_ticks_are_partitioned_by_hour_and_replayable(self):
+        with tempfile.TemporaryDirectory() as directory:
+            recorder = TickRecorder(directory, capacity=4)
+            hour = 1700000000 // 3600 * 3600
+            ticks = [PriceTick("SOLUSDT", 40.0 + i, hour - 2 + i, i) for i in range(6)]
+            for tick in ticks[:3]:
+                recorder.on_tick(tick)
+            recorder.flush()
+            # Wraps around the ring
+            for tick in ticks[3:]:
+                recorder.on_tick(tick)
+            recorder.on_tick(PriceTick("BTCUSDT", 30000.0, hour, 7))
+            recorder.stop()
+            self.assertEqual(len(os.listdir(os.path.join(directory, "SOLUSDT"))), 2)
+            timestamps, prices = load_ticks(os.path.join(directory, "SOLUSDT"))
+            self.assertEqual(list(timestamps), [tick.timestamp for tick in ticks])
+            self.assertEqual(list(load_prices(os.path.join(directory, "SOLUSDT"))), [tick.price for tick in ticks])
+            self.assertEqual(list(load_ticks(os.path.join(directory, "SOLUSDT"), start=hour)[1]), [42.0, 43.0, 44.0, 45.0])
+            self.assertEqual(recorder.status()["recorded"], 7)
+
+    def test_full_ring_drops_instead_of_blocking(self):
+        recorder = TickRecorder(tempfile.gettempdir(), capacity=2)
+        for i in range(3):
+            recorder.on_tick(PriceTick("SOLUSDT", 40.0, 1.0, i))
+        self.assertEqual(recorder.status()["dropped"], {"SOLUSDT": 1})
+
+
+class OrderBookTest(SimpleTestCase):
+    snapshot = {"topic": "orderBookL2_25.SOLUSDT", "type": "snapshot", "cross_seq": 10, "data": {"order_book": [
+        {"price": "40.48", "symbol": "SOLUSDT", "id": 404800, "side": "Buy", "size": 10},
+        {"price": "40.49", "symbol": "SOLUSDT", "id": 404900, "side": "Buy", "size": 5},
+        {"price": "40.51", "symbol": "SOLUSDT", "id": 405100, "side": "Sell", "size": 4},
+        {"price": "40.53", "symbol": "SOLUSDT", "id": 405300, "side": "Sell", "size": 20}]}}
+
+    def test_snapshot_and_deltas(self):
+        books = OrderBooks()
+        book = books.apply(self.snapshot)
+        self.assertEqual((book.best_bid, book.best_ask), (40.49, 40.51))
+        self.assertAlmostEqual(book.mid, 40.5)
+        self.assertAlmostEqual(book.spread, 0.02)
+        books.apply({"topic": "orderBookL2_25.SOLUSDT", "type": "delta", "cross_seq": 11, "data": {
+            "delete": [{"symbol": "SOLUSDT", "id": 405100, "side": "Sell"}],
+            "update": [{"price": "40.48", "symbol": "SOLUSDT", "id": 404800, "side": "Buy", "size": 12}],
+            "insert": [{"price": "40.52", "symbol": "SOLUSDT", "id": 405200, "side": "Sell", "size": 6}]}})
+        self.assertEqual((book.best_bid, book.best_ask), (40.49, 40.52))
+        self.assertEqual(book.top(2)["bids"], [(40.49, 5.0), (40.48, 12.0)])
+        price, filled = book.estimate_fill("Buy", 10)
+        self.assertAlmostEqual(price, (6 * 40.52 + 4 * 40.53) / 10)
+        self.assertEqual(filled, 10)
+        self.assertEqual(book.estimate_fill("Sell", 100)[1], 17)
+
+    def test_bad_delta_needs_resync(self):
+        books = OrderBooks()
+        delta = {"topic": "orderBookL2_25.SOLUSDT", "type": "delta", "cross_seq": 11,
+                 "data": {"delete": [{"symbol": "SOLUSDT", "id": 1, "side": "Sell"}], "update": [], "insert": []}}
+        self.assertIsNone(books.apply(delta))
+        books.apply(self.snapshot)
+        self.assertIsNone(books.apply(delta))
+        self.assertFalse(books.get("SOLUSDT").synced)
+        self.assertEqual(books.resync("SOLUSDT", self.snapshot["data"]["order_book"]).best_ask, 40.51)
+        self.assertEqual(books.resyncs, 2)
+
+
+class MetricsTest(SimpleTestCase):
+    def test_histogram_exposition(self):
+        registry = Registry()
+        histogram = registry.histogram("test_seconds", "Test latency", label="method", buckets=(0.001, 0.01))
+        for seconds in (0.0005, 0.005, 0.005, 2.0):
+            histogram.observe(seconds, "place_active_order")
+        text = registry.render()
+        self.assertIn('test_seconds_bucket{method="place_active_order",le="0.001"} 1', text)
+        self.assertIn('test_seconds_bucket{method="place_active_order",le="0.01"} 3', text)
+        self.assertIn('test_seconds_bucket{method="place_active_order",le="+Inf"} 4', text)
+        self.assertIn('test_seconds_count{method="place_active_order"} 4', text)
+
+    def test_metrics_view_without_engine(self):
+        response = self.client.get("/metrics")
+        self.assertIn(response.status_code, (200, 503))
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+
+    def test_recovery_view_without_engine(self):
+        with mock.patch.object(views, "engine", EngineClient("127.0.0.1:1", timeout=0.5)):
+            response = self.client.get("/recovery/")
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("error", response.json())
+
+    def test_index_without_balance(self):
+        request = RequestFactory().get("/")
+        request.user = AnonymousUser()
+        with mock.patch.object(views.engine, "call", side_effect=EngineError("InvalidRequestError: timestamp expired")):
+            response = index(request)
+        self.assertEqual(response.status_code, 200)
+
+
+class LoggingTest(SimpleTestCase):
+    def test_batched_json_records_with_tick_sampling(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "test.log")
+            file = BatchRotatingFileHandler(path, maxBytes=1024 * 1024, backupCount=1, delay=True)
+            file.setFormatter(JsonFormatter())
+            records = queue.SimpleQueue()
+            handler = LazyQueueHandler(records)
+            sampler = SymbolSampler(interval=60)
+            handler.addFilter(sampler)
+            logger = logging.getLogger("Bot.tests.batched")
+            logger.propagate = False
+            logger.addHandler(handler)
+            self.addCleanup(logger.removeHandler, handler)
+            listener = BatchQueueListener(records, file)
+            listener.start()
+            for price in (40.1, 40.2, 40.3):
+                logger.warning("Trade %s %s", "SOLUSDT", price, extra={"event": "tick", "symbol": "SOLUSDT"})
+            logger.warning("Trade %s %s", "BTCUSDT", 30000.0, extra={"event": "tick", "symbol": "BTCUSDT"})
+            logger.warning("Order %s placed", "1", extra={"event": "order", "order_id": "1"})
+            legs = [{"Triggered": False}]
+            logger.warning("Legs %s", legs)
+            legs[0]["Triggered"] = True
+            listener.stop()
+            file.close()
+            with open(path) as f:
+                entries = [json.loads(line) for line in f]
+        self.assertEqual([entry["message"] for entry in entries], ["Trade SOLUSDT 40.1", "Trade BTCUSDT 30000.0", "Order 1 placed",
+                                                              "Legs [{'Triggered': False}]"])
+        self.assertEqual(entries[2]["order_id"], "1")
+        self.assertEqual(entries[0]["symbol"], "SOLUSDT")
+        self.assertEqual(sampler.dropped, 2)
+
+
+class OrderOpsTest(SimpleTestCase):
+    def test_flatten_pairs_with_retries(self):
+        class ExchangeStub:
+            def __init__(self):
+                self.calls = []
+                self.busy = 1
+
+            def cancel_all_active_orders(self, **kwargs):
+                self.calls.append(("cancel_all_active_orders", kwargs))
+                return {"result": []}
+
+            def cancel_all_conditional_orders(self, **kwargs):
+                self.calls.append(("cancel_all_conditional_orders", kwargs))
+                return {"result": []}
+
+            def my_position(self, symbol):
+                self.calls.append(("my_position", {"symbol": symbol}))
+                size = 3 if symbol == "SOLUSDT" else 0
+                return {"result": [{"symbol": symbol, "side": "Buy", "size": size}, {"symbol": symbol, "side": "Sell", "size": 0}]}
+
+            def place_active_order(self, **kwargs):
+                self.calls.append(("place_active_order", kwargs))
+                if self.busy:
+                    self.busy -= 1
+                    raise InvalidRequestError("place", "Too many visits", 10006, "0")
+                return {"result": kwargs}
+
+        client = ExchangeStub()
+        runtime = Runtime()
+        ops = OrderOps(RestClient(client, runtime), backoff=0.01)
+        runtime.start()
+        self.addCleanup(runtime.stop)
+        results = runtime.spawn(ops.flatten(["SOLUSDT", "BTCUSDT"])).result(timeout=5)
+        self.assertEqual(results["BTCUSDT"]["close"], [])
+        close = results["SOLUSDT"]["close"]
+        self.assertEqual(len(close), 1)
+        self.assertTrue(close[0]["ok"])
+        self.assertEqual(close[0]["attempts"], 2)
+        self.assertEqual((close[0]["result"]["side"], close[0]["result"]["qty"], close[0]["result"]["reduce_only"]), ("Sell", 3, True))
+        placed = [kwargs for method, kwargs in client.calls if method == "place_active_order"]
+        # The retry reuses the order_link_id
+        self.assertEqual(len({kwargs["order_link_id"] for kwargs in placed}), 1)
+        self.assertEqual(sum(method.startswith("cancel_all") for method, kwargs in client.calls), 4)
+
+
+class PaperExchangeTest(SimpleTestCase):
+    def test_market_fill_and_take_profit(self):
+        exchange = PaperExchange(balance=1000.0, fee=0.0)
+        events = []
+        exchange.subscribe("order", events.append)
+        exchange.step("SOLUSDT", 40.0)
+        exchange.place_active_order(symbol="SOLUSDT", side="Buy", order_type="Market", qty=2, take_profit=41.0, stop_loss=39.0)
+        position = exchange.my_position(symbol="SOLUSDT")["result"][0]
+        self.assertEqual((position["side"], position["size"], position["take_profit"]), ("Buy", 2.0, 41.0))
+        # Bought at the ask, half the one-tick spread above the mid
+        self.assertAlmostEqual(position["entry_price"], 40.005)
+        with self.assertRaises(InvalidRequestError):
+            exchange.place_active_order(symbol="SOLUSDT", side="Buy", order_type="Market", qty=0)
+        exchange.place_conditional_order(symbol="SOLUSDT", side="Sell", order_type="Market", qty=1, base_price=40.0,
+                                         stop_px=39.5, order_link_id="leg")
+        exchange.step("SOLUSDT", 39.4)
+        self.assertEqual(exchange.query_conditional_order(symbol="SOLUSDT")["result"], [])
+        self.assertEqual(exchange.my_position(symbol="SOLUSDT")["result"][1]["size"], 1.0)
+        exchange.step("SOLUSDT", 41.0)
+        self.assertEqual(exchange.my_position(symbol="SOLUSDT")["result"][0]["size"], 0)
+        self.assertEqual(len(exchange.trades["SOLUSDT"]), 3)
+        self.assertEqual([event["data"][0]["order_status"] for event in events], ["Filled"] * 3)
+
+    def test_engine_load_test(self):
+        with paper_engine(Pairs=["SOLUSDT"]) as engine:
+            result = run_load_test(engine, "SOLUSDT", 20, timeout=10)
+        self.assertEqual(result["open"], 0)
+        self.assertEqual(result["fills"], 80)
+        self.assertEqual(result["tick_to_order"]["count"], 60)
+
+
+class BenchTest(TestCase):
+    def test_smoke_run_and_compare(self):
+        results = run_benchmarks(scale=0.001, armed=100)
+        self.assertIn("stream.orderbook25", results["results"])
+        self.assertIn("view.trades.placeorder", results["results"])
+        self.assertEqual(results["results"]["triggers.recovery"]["armed"], 100)
+        self.assertEqual(compare(results, results), [])
+        baseline = {"results": {"a": {"per_second": 100.0, "us_per_call": 1.0}, "b": {"ms_per_request": 2.0}}}
+        current = {"results": {"a": {"per_second": 70.0, "us_per_call": 1.1}, "b": {"ms_per_request": 3.0}, "c": {"per_second": 1.0}}}
+        self.assertEqual(compare(current, baseline), [("a", "per_second", 100.0, 70.0), ("b", "ms_per_request", 2.0, 3.0)])
+
+
+class ThreadRuntime:
+    async def blocking(self, func, *args, **kwargs):
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+
+class PaperRest:
+    def __init__(self, exchange):
+        self.exchange = exchange
+        self.calls = []
+
+    async def call(self, method, **kwargs):
+        self.calls.append(kwargs)
+        return getattr(self.exchange, method)(**kwargs)
+
+
+# The fill store queries the database from the runtime's executor threads
+class FillStoreTest(TransactionTestCase):
+    def test_incremental_paginated_sync(self):
+        exchange = PaperExchange()
+        exchange.step("SOLUSDT", 40.0)
+        for _ in range(5):
+            exchange.place_active_order(symbol="SOLUSDT", side="Buy", order_type="Market", qty=1)
+        rest = PaperRest(exchange)
+        store = FillStore(rest, ThreadRuntime(), page_size=2)
+        self.assertEqual(asyncio.run(store.sync("SOLUSDT")), 5)
+        self.assertEqual([call["page"] for call in rest.calls], [1, 2, 3])
+        self.assertNotIn("start_time", rest.calls[0])
+        exchange.place_active_order(symbol="SOLUSDT", side="Sell", order_type="Market", qty=1)
+        rest.calls.clear()
+        # Only the fills since the newest stored one are fetched, the overlap is skipped
+        self.assertEqual(asyncio.run(store.sync("SOLUSDT")), 1)
+        self.assertEqual(rest.calls[0]["start_time"], exchange.trades["SOLUSDT"][4]["trade_time_ms"])
+        self.assertEqual(Fill.objects.count(), 6)
+        rows, page = fills_page("SOLUSDT", per_page=4)
+        self.assertEqual((len(rows), page.paginator.num_pages), (4, 2))
+        self.assertEqual(rows[0]["Side"], "Sell")
+        rows, page = fills_page("SOLUSDT", per_page=4, page=2)
+        self.assertEqual([row["Order No"] for row in rows], [5, 6])
+        request = RequestFactory().post("/trades", "gettrades=&Pair=SOLUSDT&From=&To=&Page=2", content_type="application/x-www-form-urlencoded")
+        response = trades(request)
+        # Out of range pages fall back to the last one
+        self.assertContains(response, "<td>6</td>", html=True)
+        self.assertNotContains(response, "NEXT")
+
+    def test_history_longer_than_a_window(self):
+        exchange = PaperExchange()
+        exchange.step("SOLUSDT", 40.0)
+        for i in range(7):
+            exchange.place_active_order(symbol="SOLUSDT", side="Buy", order_type="Market", qty=1)
+            exchange.trades["SOLUSDT"][-1]["trade_time_ms"] = 1700000000000 + i // 2
+        rest = PaperRest(exchange)
+        store = FillStore(rest, ThreadRuntime(), page_size=2, max_pages=2)
+        # Windows of two pages, each one back from the oldest fill of the previous one
+        self.assertEqual(asyncio.run(store.sync("SOLUSDT")), 7)
+        self.assertEqual(Fill.objects.count(), 7)
+        self.assertEqual([call.get("end_time") for call in rest.calls], [None, None, 1700000000002, 1700000000002, 1700000000001, 1700000000001])
+
+    def test_time_range(self):
+        Fill.objects.bulk_create([Fill(exec_id=str(i), order_id=str(i), symbol="SOLUSDT", side="Buy", order_type="Market",
+                                       price=40.0, qty=1.0, trade_time_ms=1700000000000 + i * 3600000) for i in range(4)])
+        rows, page = fills_page("SOLUSDT", start="2023-11-14T23:13", end="2023-11-15T01:13:20")
+        self.assertEqual([row["Order ID"] for row in rows], ["2", "1"])
+        self.assertEqual(fills_page("BTCUSDT")[0], [])
+        # A malformed bound is no bound
+        self.assertEqual(len(fills_page("SOLUSDT", start="yesterday", end="2023-11-15T01:13:20")[0]), 3)
+
+
+class DashboardTest(SimpleTestCase):
+    def test_long_poll_returns_changed_sections(self):
+        state = {"prices": {"SOLUSDT": 40.0}, "orders": {}}
+        runtime = Runtime()
+        dashboard = Dashboard({name: (lambda name=name: dict(state[name])) for name in state}, interval=0.01)
+        runtime.on_startup(dashboard.start)
+        runtime.on_shutdown(dashboard.stop)
+        runtime.start()
+        self.addCleanup(runtime.stop)
+        first = runtime.spawn(dashboard.wait(0)).result(timeout=5)
+        self.assertEqual(first["sections"], {"prices": {"SOLUSDT": 40.0}, "orders": {}})
+        waiting = runtime.spawn(dashboard.wait(first["version"], wait=5))
+        time.sleep(0.05)
+        self.assertFalse(waiting.done())
+        state["prices"] = {"SOLUSDT": 40.5}
+        update = waiting.result(timeout=1)
+        self.assertEqual(update["sections"], {"prices": {"SOLUSDT": 40.5}})
+        # Nothing changed: the poll times out with no sections
+        self.assertEqual(runtime.spawn(dashboard.wait(update["version"], wait=0.05)).result(timeout=5)["sections"], {})
+        # An unknown version (engine restarted) gets everything
+        self.assertEqual(len(runtime.spawn(dashboard.wait(10 ** 6)).result(timeout=5)["sections"]), 2)
+
+    def test_event_stream(self):
+        with paper_engine(Pairs=["SOLUSDT"]) as engine:
+            engine.exchange.step("SOLUSDT", 40.0)
+            legs = legs_from_settings(engine.settings, "Buy", 40.0)
+            engine.runtime.spawn(engine.place_order({"symbol": "SOLUSDT", "side": "Buy", "order_type": "Market", "qty": 1.0}, legs)).result(timeout=5)
+            client = EngineClient("%s:%d" % ("127.0.0.1", engine.server.sockets[0].getsockname()[1]))
+            self.addCleanup(client.close)
+            with mock.patch.object(views, "engine", client), mock.patch.object(views, "STREAM_SECONDS", 0.5):
+                response = views.dashboard_stream(RequestFactory().get("/trades/stream"))
+                content = b"".join(response.streaming_content).decode()
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        events = [event for event in content.split("\n\n") if event.startswith("id: ")]
+        # The first event has every section, the later ones what changed since
+        self.assertEqual(set(json.loads(events[0].split("data: ", 1)[1])), {"balance", "prices", "positions", "orders", "recovery"})
+        sections = {}
+        for event in events:
+            sections.update(json.loads(event.split("data: ", 1)[1]))
+        self.assertEqual(sections["positions"]["SOLUSDT"]["Buy"]["Size"], 1.0)
+        self.assertEqual(len(next(iter(sections["recovery"].values()))["Legs"]), 3)
+
+
+class SignalTest(SimpleTestCase):
+    def test_parse_signal(self):
+        settings = BotSettings.from_dict({"Pairs": ["SOLUSDT"], "SignalSecret": "s3"})
+        alert = parse_signal(b'{"ID": "a1", "Pair": "SOLUSDT", "Side": "Sell", "UnitPrice": "41.5", "Secret": "s3"}', settings)
+        self.assertEqual(alert, {"ID": "a1", "Pair": "SOLUSDT", "Side": "Sell", "UnitPrice": 41.5, "StartUnits": None})
+        for body in (b"Buy SOLUSDT", b'["SOLUSDT"]', b'{"Pair": "SOLUSDT", "Side": "Buy", "Secret": "no"}',
+                     b'{"Pair": "BTCUSDT", "Side": "Buy", "Secret": "s3"}', b'{"Pair": "SOLUSDT", "Side": "Long", "Secret": "s3"}',
+                     b'{"Pair": "SOLUSDT", "Side": "Buy", "StartUnits": -1, "Secret": "s3"}'):
+            with self.assertRaises(InvalidSignal):
+                parse_signal(body, settings)
+        self.assertNotEqual(parse_signal(b'{"Pair": "SOLUSDT", "Side": "Buy", "Secret": "s3"}', settings)["ID"], "")
+
+    def test_webhook_queues_once(self):
+        factory = RequestFactory()
+        with paper_engine(Pairs=["SOLUSDT"]) as engine:
+            engine.exchange.step("SOLUSDT", 40.0)
+            deadline = time.time() + 5
+            while engine.price_cache.price("SOLUSDT") is None and time.time() < deadline:
+                time.sleep(0.005)
+            client = EngineClient("127.0.0.1:%d" % engine.server.sockets[0].getsockname()[1])
+            self.addCleanup(client.close)
+            body = json.dumps({"ID": "tv-1", "Pair": "SOLUSDT", "Side": "Buy"})
+            with mock.patch.object(views, "engine", client), mock.patch.object(views.SETTINGS, "get", return_value=engine.settings):
+                # JSON posted to trades/ is routed to the webhook
+                first = views.trades(factory.post("/trades/", body, content_type="application/json"))
+                again = views.signal_webhook(factory.post("/signal/", body, content_type="application/json"))
+                invalid = views.signal_webhook(factory.post("/signal/", "{}", content_type="application/json"))
+            self.assertEqual((first.status_code, json.loads(first.content)["status"]), (202, "queued"))
+            self.assertEqual((again.status_code, json.loads(again.content)["status"]), (200, "duplicate"))
+            self.assertEqual(invalid.status_code, 400)
+            while not engine.exchange.trades["SOLUSDT"] and time.time() < deadline:
+                time.sleep(0.005)
+            trades = engine.exchange.trades["SOLUSDT"]
+            self.assertEqual([trade["order_link_id"] for trade in trades], [signal_link_id("tv-1")])
+            self.assertEqual(trades[0]["exec_qty"], engine.settings.start_units)
+            status = engine.runtime.spawn(asyncio.sleep(0.05, engine.signals.status())).result(timeout=5)
+        self.assertEqual((status["queued"], status["duplicate"]), (1, 1))
+
+
+class PositionCacheTest(SimpleTestCase):
+    def test_stream_wins_over_seed(self):
+        cache = PositionCache()
+        self.assertFalse(cache.known("SOLUSDT"))
+        cache.update([{"symbol": "SOLUSDT", "side": "Buy", "size": "2", "entry_price": 40.0, "leverage": 5}])
+        cache.seed("SOLUSDT", [{"symbol": "SOLUSDT", "side": "Buy", "size": 0, "leverage": 10},
+                               {"symbol": "SOLUSDT", "side": "Sell", "size": 1, "leverage": 10}])
+        self.assertEqual({p["side"]: p["size"] for p in cache.get("SOLUSDT")}, {"Buy": 2.0, "Sell": 1.0})
+        self.assertEqual(cache.leverage("SOLUSDT"), 5.0)
+        cache.seed("BTCUSDT", [])
+        self.assertTrue(cache.known("BTCUSDT"))
+        self.assertEqual(cache.get("BTCUSDT"), [])
+
+    def test_no_position_reads_in_steady_state(self):
+        def calls(method):
+            series = REST_CALL._series.get(method)
+            return series.count if series else 0
+
+        with paper_engine(Pairs=["SOLUSDT"]) as engine:
+            engine.exchange.step("SOLUSDT", 40.0)
+            deadline = time.time() + 5
+            # The startup read finds the exchange's leverage (10) and sets the one of Settings.json
+            while engine.positions.leverage("SOLUSDT") != engine.leverage and time.time() < deadline:
+                time.sleep(0.005)
+            self.assertEqual(engine.positions.leverage("SOLUSDT"), engine.leverage)
+            before = calls("my_position"), calls("set_leverage")
+            legs = legs_from_settings(engine.settings, "Buy", 40.0)
+            engine.runtime.spawn(engine.place_order({"symbol": "SOLUSDT", "side": "Buy", "order_type": "Market", "qty": 2.0}, legs)).result(timeout=5)
+            while not engine.positions.get("SOLUSDT")[0]["size"] and time.time() < deadline:
+                time.sleep(0.005)
+            result = engine.runtime.spawn(engine.my_position(symbol="SOLUSDT")).result(timeout=5)["result"]
+            self.assertEqual({p["side"]: p["size"] for p in result}, {"Buy": 2.0, "Sell": 0.0})
+            flattened = engine.runtime.spawn(engine.cancel_orders("SOLUSDT")).result(timeout=5)
+            self.assertEqual(flattened["close"][0]["result"]["qty"], 2.0)
+            self.assertEqual((calls("my_position"), calls("set_leverage")), before)
+
+    def test_refused_leverage_backs_off(self):
+        with paper_engine(Pairs=["SOLUSDT"]) as engine:
+            with mock.patch.object(engine.exchange, "set_leverage", side_effect=InvalidRequestError("paper", "Insufficient margin", 10001, "0")) as refused:
+                position = {"symbol": "SOLUSDT", "side": "Buy", "size": 0, "leverage": 7}
+                engine.runtime.call_soon(engine.on_position, {"topic": "position", "data": [position]})
+                # The settings watch checks the leverage on every pass (check_interval 0 here)
+                time.sleep(0.3)
+                self.assertEqual(refused.call_count, 1)
+                self.assertEqual(engine.leverage_requests["SOLUSDT"][:2], (engine.leverage, 1))
+
+
+class InstrumentTest(SimpleTestCase):
+    def test_rounding_on_the_symbol_grid(self):
+        btc = Instrument("BTCUSDT", tick_size=0.5, qty_step=0.001, min_qty=0.001)
+        self.assertEqual((btc.round_price(30123.3), btc.round_qty(0.0234), btc.round_qty(0.0001), btc.round_qty(0)), (30123.5, 0.023, 0.001, 0))
+        self.assertEqual(btc.round_price(np.array([30123.3, 30123.1])).tolist(), [30123.5, 30123.0])
+        bat = Instrument("BATUSDT", tick_size=0.0001, qty_step=0.1)
+        self.assertEqual(bat.order({"symbol": "BATUSDT", "qty": 12.345, "take_profit": 0.212345, "stop_loss": 0}),
+                         {"symbol": "BATUSDT", "qty": 12.3, "take_profit": 0.2123, "stop_loss": 0})
+        self.assertEqual(DEFAULT.round_price(40.005001), 40.01)
+
+    def test_disk_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "instruments.json")
+            instruments = Instruments(path)
+            self.assertFalse(instruments.load())
+            self.assertTrue(instruments.stale())
+            instruments.update([{"name": "BTCUSDT", "price_filter": {"tick_size": "0.5"}, "lot_size_filter": {"qty_step": 0.001, "min_trading_qty": 0.001}}])
+            instruments.save()
+            cached = Instruments(path)
+            self.assertTrue(cached.load())
+            self.assertFalse(cached.stale())
+            self.assertEqual(cached.get("BTCUSDT").tick_size, 0.5)
+            self.assertIs(cached.get("ETHUSDT"), DEFAULT)
+
+    def test_orders_accepted_on_the_first_submission(self):
+        with paper_engine(Pairs=["BTCUSDT"]) as engine:
+            engine.exchange.step("BTCUSDT", 30000.0)
+            with self.assertRaises(InvalidRequestError):
+                engine.exchange.place_active_order(symbol="BTCUSDT", side="Buy", order_type="Market", qty=0.0234)
+            # As the views build them, with the rules the engine hands out
+            instrument = Instrument(**engine.runtime.spawn(engine.commands["instrument"](symbol="BTCUSDT")).result(timeout=5))
+            self.assertEqual((instrument.tick_size, instrument.qty_step), (0.5, 0.001))
+            legs = build_legs("Buy", 30000.3, 0.0234, 200, 0.01, 2, (1.5, 1.0, 1.5), instrument=instrument)
+            order = engine.runtime.spawn(engine.place_order({"symbol": "BTCUSDT", "side": "Buy", "order_type": "Market", "qty": 0.0234,
+                                                             "take_profit": 30002.3}, legs)).result(timeout=5)
+            self.assertEqual((order["qty"], order["TP"]), (0.023, 30002.5))
+            armed = next(iter(engine.recovery.snapshot().values()))["Legs"]
+            self.assertEqual([(leg["UnitPrice"], leg["Units"]) for leg in armed], [(29999.5, 0.035), (30000.5, 0.023), (29999.5, 0.035)])
+            placed = engine.runtime.spawn(engine.orders.place_orders([{"symbol": "BTCUSDT", "side": "Sell", "order_type": "Market",
+                                                                       "qty": 0.01234}])).result(timeout=5)
+            self.assertEqual((placed[0]["ok"], placed[0]["attempts"], placed[0]["result"]["qty"]), (True, 1, 0.012))
+            with open(engine.instruments.path) as f:
+                self.assertIn("BTCUSDT", json.load(f)["symbols"][0]["name"])
+
+    def test_conditional_legs_on_the_grid(self):
+        with paper_engine(Pairs=["BTCUSDT"], RecoveryMode="exchange") as engine:
+            # The book mid (the base price of the conditional legs) is off the 0.5 tick
+            engine.exchange.step("BTCUSDT", 30000.3)
+            deadline = time.time() + 5
+            while engine.price_cache.price("BTCUSDT") is None and time.time() < deadline:
+                time.sleep(0.005)
+            legs = build_legs("Buy", 30000.5, 0.01, 200, 0.5, 2, (1.0, 1.0, 1.0), instrument=engine.instruments.get("BTCUSDT"))
+            engine.runtime.spawn(engine.place_order({"symbol": "BTCUSDT", "side": "Buy", "order_type": "Market", "qty": 0.01}, legs)).result(timeout=5)
+            while not engine.exchange.conditional and time.time() < deadline:
+                time.sleep(0.005)
+            conditional = list(engine.exchange.conditional.values())
+            self.assertEqual(len(conditional), 1)
+            self.assertEqual(conditional[0]["base_price"], 30000.5)
+            self.assertFalse(engine.recovery.triggers.armed("BTCUSDT"))
@@ -0,0 +1,66 @@
+from bisect import bisect_left, insort
+from itertools import count
+
+BELOW = "below"  # fire when price <= level
+ABOVE = "above"  # fire when price >= level
+
+
+# Direction in which a leg's UnitPrice has to be crossed: Sell legs wait for the price to fall, Buy legs for it to rise
+def leg_direction(leg):
+    return BELOW if leg["Side"] == "Sell" else ABOVE
+
+
+# Per-symbol sorted index of pending trigger levels.
+# Both sides are kept in ascending lists of (key, trigger_id) ordered so that the crossed levels are
+# always at the tail: BELOW levels are stored as-is (crossed when level >= price), ABOVE levels are
+# stored negated (crossed when -level >= -price). A tick therefore bisects once per side and slices
+# the crossed entries off the end, O(log n + k) however many levels are armed.
+class TriggerIndex:
+    def __init__(self):
+        self._levels = {}  # (symbol, direction) -> sorted [(key, trigger_id)]
+        self._triggers = {}  # trigger_id -> (symbol, direction, key, payload)
+        self._ids = count(1)
+
+    def __len__(self):
+        return len(self._triggers)
+
+    def armed(self, symbol):
+        return bool(self._levels.get((symbol, BELOW))) or bool(self._levels.get((symbol, ABOVE)))
+
+    def add(self, symbol, direction, price, payload):
+        trigger_id = next(self._ids)
+        key = float(price) if direction == BELOW else -float(price)
+        insort(self._levels.setdefault((symbol, direction), []), (key, trigger_id))
+        self._triggers[trigger_id] = (symbol, direction, key, payload)
+        return trigger_id
+
+    def add_leg(self, symbol, leg, payload):
+        return self.add(symbol, leg_direction(leg), leg["UnitPrice"], payload)
+
+    def remove(self, trigger_id):
+        trigger = self._triggers.pop(trigger_id, None)
+        if trigger is None:
+            return None
+        symbol, direction, key, payload = trigger
+        levels = self._levels[(symbol, direction)]
+        i = bisect_left(levels, (key, trigger_id))
+        if i < len(levels) and levels[i] == (key, trigger_id):
+            del levels[i]
+        return payload
+
+    # Remove and return the payloads of every level crossed by price, in the order they were armed
+    def pop_crossed(self, symbol, price):
+        crossed = []
+        for direction, key in ((BELOW, price), (ABOVE, -price)):
+            levels = self._levels.get((symbol, direction))
+            if not levels:
+                continue
+            i = bisect_left(levels, (key,))
+            if i < len(levels):
+                crossed.extend(trigger_id for _, trigger_id in levels[i:])
+                del levels[i:]
+        crossed.sort()
+        return [self._triggers.pop(trigger_id)[3] for trigger_id in crossed]
+
+    def levels(self, symbol, direction):
+        return [key if direction == BELOW else -key for key, _ in self._levels.get((symbol, direction), [])]
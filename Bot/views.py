@@ -1,370 +1,51 @@
 import json
-import logging.config
-import os
-from datetime import datetime, timedelta, timezone
-from pathlib import Path
-from threading import Thread
-from time import sleep
+import logging
+import time
 
 import pandas as pd
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.views.decorators.csrf import csrf_exempt
 # from dotenv import load_dotenv
-from pybit import usdt_perpetual
 
-from .models import Greeting
+from . import logs  # noqa: F401 (configures logging)
+from .config import SETTINGS, update_settings
+from .fills import fills_page
+from .instruments import Instrument
+from .signals import FULL, QUEUED, InvalidSignal, parse_signal
+from .ipc import DEFAULT_ADDRESS, EngineClient, EngineError, EngineUnavailable
+from .models import RecoverySequence
+from .strategy import BUY, SELL, build_legs, order_tp_sl
 
 # load_dotenv()
 
-logging.config.dictConfig({
-    "version": 1,
-    "disable_existing_loggers": False,
-    'formatters': {
-        'colored': {
-            '()': 'colorlog.ColoredFormatter',  # colored output
-            # --> %(log_color)s is very important, that's what colors the line
-            'format': '[%(asctime)s,%(lineno)s] %(log_color)s[%(message)s]',
-            'log_colors': {
-                'DEBUG': 'green',
-                'INFO': 'cyan',
-                'WARNING': 'yellow',
-                'ERROR': 'red',
-                'CRITICAL': 'bold_red',
-            },
-        },
-        'simple': {
-            'format': '[%(asctime)s,%(lineno)s] [%(message)s]',
-        },
-    },
-    "handlers": {
-        "console": {
-            "class": "colorlog.StreamHandler",
-            "level": "INFO",
-            "formatter": "colored",
-            "stream": "ext://sys.stdout"
-        },
-        "file": {
-            "class": "logging.handlers.RotatingFileHandler",
-            "level": "INFO",
-            "formatter": "simple",
-            "filename": 'app-log.log',
-            "maxBytes": 50 * 1024 * 1024,
-            "backupCount": 1
-        },
-    },
-    "root": {"level": "INFO",
-             "handlers": ["console", "file"]
-             }
-})
 LOGGER = logging.getLogger()
 
-PROJECT_ROOT = Path(os.path.abspath(os.path.dirname(__file__)))
-file_settings = str(PROJECT_ROOT / 'Settings.json')
+# The exchange connections and the recovery state live in the engine process (manage.py run_engine)
+engine = EngineClient(SETTINGS.get().get("EngineAddress", DEFAULT_ADDRESS))
 
 
-# Get settings from Setting.json file
-def get_settings():
-    if os.path.isfile(file_settings):
-        with open(file_settings, 'r') as f:
-            return json.load(f)
-    temp = {"Settings": {
-        "APIName": "Please set your API Name",
-        "APIKey": "Please set your API Key",
-        "APISecret": "Please set your API Secret"}}
-    with open(file_settings, 'w') as f:
-        json.dump(temp, f, indent=4)
-    with open(file_settings, 'r') as f:
-        return json.load(f)
-
-
-def update_settings(settings):
-    with open(file_settings, 'w') as f:
-        LOGGER.info(f'Updating settings')
-        json.dump({"Settings": settings}, f, indent=4)
-        LOGGER.info(f"Settings have been successfully updated: {settings}")
-
-
-websocket_connected = False
-settings = get_settings()["Settings"]
-api_key = settings['APIKey']
-api_secret = settings['APISecret']
-pair = settings["Pairs"][0]
-side = settings["Side"]
-start_units = float(settings["StartUnits"])
-unit_price = float(settings["UnitPrice"])
-tp_sl_ticks = float(settings["TPSLTicks"])
-zone_divider = float(settings["ZoneDivider"])
-tick_price = float(settings["TickPrice"])
-leverage = float(settings["Leverage"])
-base_times1 = float(settings["BaseTimes1"])
-base_times2 = float(settings["BaseTimes2"])
-base_times3 = float(settings["BaseTimes3"])
-recovery_zone_ticks = tp_sl_ticks / zone_divider
-# recovery_trades = [{pair: []} for pair in settings["Pairs"]]
-recovery_trades = {}
-client = usdt_perpetual.HTTP(endpoint='https://api-testnet.bybit.com', api_key=api_key, api_secret=api_secret)
-ws = usdt_perpetual.WebSocket(test=True, api_key=api_key, api_secret=api_secret)
-
-
-def get_tp_sl(unit_price, tp_sl_ticks, tick_price):
-    recovery_zone_ticks = tp_sl_ticks / zone_divider
-    tp_l = round(unit_price + (tp_sl_ticks * tick_price), 2)
-    tp_s = round(unit_price - (tp_sl_ticks * tick_price), 2)
-    sl_l = round(unit_price - ((recovery_zone_ticks + tp_sl_ticks) * tick_price), 2)
-    sl_s = round(unit_price + ((recovery_zone_ticks + tp_sl_ticks) * tick_price), 2)
-    return tp_l, tp_s, sl_l, sl_s
-
-
-def get_data_frame(pair):
-    file_path = str(PROJECT_ROOT / f'{pair}.csv')
-    return pd.read_csv(file_path, index_col=None)
-
-
-# Check on your order and position through WebSocket.
-def handle_recovery_order(order):
-    # order_id = order["data"][0]["order_id"]
-    # pair = order["data"][0]["symbol"]
-    order_id = order["order_id"]
-    pair = order["Pair"]
-    # LOGGER.info(f'RecoveryOrder handler started for: {pair}, OrderID: {order_id}')
-    LOGGER.info(f'RecoveryOrder handler started for: {order}')
-    while True:
-        sleep(12)
-        if recovery_trades[pair][2]["Triggered"]:
-            break
-        try:
-            df = get_data_frame(pair=pair)
-            df["Price"] = df["Price"].astype(float)
-        except:
-            continue
-        order = client.query_active_order(symbol=pair, order_id=order_id)
-        # LOGGER.info(f'Query order: {order}')
-        # LOGGER.info(f'Order Status: {order["result"]["order_status"]}, Side: {order["result"]["side"]}')
-        if order["result"]["order_status"] == "Cancelled":
-            return
-        if (order["result"]["side"] == "Buy") and (order["result"]["order_status"] == "Filled"):
-            if not recovery_trades[pair][0]["Triggered"]:
-                LOGGER.info(f'Order Status: {order["result"]["order_status"]}, Pair: {pair}, Side: {order["result"]["side"]}, PairPrice: {df.iloc[-1]["Price"]}: OrderPrice: {recovery_trades[pair][0]["UnitPrice"]}, 1st RecoveryOrder Condition Matched: {df.iloc[-1]["Price"] <= recovery_trades[pair][0]["UnitPrice"]}')
-            elif recovery_trades[pair][0]["Triggered"] and not recovery_trades[pair][1]["Triggered"]:
-                LOGGER.info(f'Order Status: {order["result"]["order_status"]}, Pair: {pair}, Side: {order["result"]["side"]}, PairPrice: {df.iloc[-1]["Price"]}: OrderPrice: {recovery_trades[pair][1]["UnitPrice"]}, 2nd RecoveryOrder Condition Matched: {df.iloc[-1]["Price"] >= recovery_trades[pair][0]["UnitPrice"]}')
-            elif recovery_trades[pair][1]["Triggered"] and not recovery_trades[pair][2]["Triggered"]:
-                LOGGER.info(f'Order Status: {order["result"]["order_status"]}, Pair: {pair}, Side: {order["result"]["side"]}, PairPrice: {df.iloc[-1]["Price"]}: OrderPrice: {recovery_trades[pair][2]["UnitPrice"]}, 3rd RecoveryOrder Condition Matched: {df.iloc[-1]["Price"] <= recovery_trades[pair][0]["UnitPrice"]}')
-            if (df.iloc[-1]['Price'] <= recovery_trades[pair][0]["UnitPrice"]) and not recovery_trades[pair][0]["Triggered"]:
-                LOGGER.info(f'Placing the 1st recovery order: {recovery_trades[pair][0]["Side"]}')
-                # print(f"Switching TP/SL mode to Partial")
-                # tp_sl_mode = client.full_partial_position_tp_sl_switch(symbol=pair, tp_sl_mode="Partial")
-                # tp_sl_mode = json.loads(json.dumps(tp_sl_mode, indent=4))['result']
-                # print(f"TP/SL Mode: {tp_sl_mode}")
-                # print(f'Placing new buy limit order at price: {buy_price - buy_less}')
-                recovery_trades[pair][0]["Triggered"] = True
-                order_buy = client.place_active_order(
-                    symbol=pair,
-                    side=recovery_trades[pair][0]["Side"],
-                    order_type="Market",
-                    qty=recovery_trades[pair][0]["Units"],
-                    take_profit=recovery_trades[pair][0]["TP"],
-                    stop_loss=recovery_trades[pair][0]["SL"],
-                    time_in_force="GoodTillCancel",
-                    reduce_only=False,
-                    close_on_trigger=False
-                )
-                order_buy = json.loads(json.dumps(order_buy, indent=4))['result']
-                print(f'1st {recovery_trades[pair][0]["Side"]} RecoveryOrder has been placed: {order_buy}')
-            elif (df.iloc[-1]['Price'] >= recovery_trades[pair][1]["UnitPrice"]) and (recovery_trades[pair][0]["Triggered"] and not recovery_trades[pair][1]["Triggered"]):
-                LOGGER.info(f'Placing the 2nd recovery order: {recovery_trades[pair][0]["Side"]}')
-                recovery_trades[pair][1]["Triggered"] = True
-                order_buy = client.place_active_order(
-                    symbol=pair,
-                    side=recovery_trades[pair][1]["Side"],
-                    order_type="Market",
-                    qty=recovery_trades[pair][1]["Units"],
-                    take_profit=recovery_trades[pair][1]["TP"],
-                    stop_loss=recovery_trades[pair][1]["SL"],
-                    time_in_force="GoodTillCancel",
-                    reduce_only=False,
-                    close_on_trigger=False
-                )
-                order_buy = json.loads(json.dumps(order_buy, indent=4))['result']
-                print(f'2nd {recovery_trades[pair][1]["Side"]} RecoveryOrder has been placed: {order_buy}')
-            elif (df.iloc[-1]['Price'] <= recovery_trades[pair][2]["UnitPrice"]) and (recovery_trades[pair][1]["Triggered"] and not recovery_trades[pair][2]["Triggered"]):
-                LOGGER.info(f'Placing the 3rd recovery order: {recovery_trades[pair][0]["Side"]}')
-                recovery_trades[pair][2]["Triggered"] = True
-                order_buy = client.place_active_order(
-                    symbol=pair,
-                    side=recovery_trades[pair][2]["Side"],
-                    order_type="Market",
-                    qty=recovery_trades[pair][2]["Units"],
-                    take_profit=recovery_trades[pair][2]["TP"],
-                    stop_loss=recovery_trades[pair][2]["SL"],
-                    time_in_force="GoodTillCancel",
-                    reduce_only=False,
-                    close_on_trigger=False
-                )
-                order_buy = json.loads(json.dumps(order_buy, indent=4))['result']
-                print(f'3rd {recovery_trades[pair][2]["Side"]} RecoveryOrder has been placed: {order_buy}')
-        if (order["result"]["side"] == "Sell") and (order["result"]["order_status"] == "Filled"):
-            if not recovery_trades[pair][0]["Triggered"]:
-                LOGGER.info(f'Order Status: {order["result"]["order_status"]}, Pair: {pair} Side: {order["result"]["side"]}, PairPrice: {df.iloc[-1]["Price"]}: OrderPrice: {recovery_trades[pair][0]["UnitPrice"]}, 1st RecoveryOrder Condition Matched: {df.iloc[-1]["Price"] >= recovery_trades[pair][0]["UnitPrice"]}')
-            elif recovery_trades[pair][0]["Triggered"] and not recovery_trades[pair][1]["Triggered"]:
-                LOGGER.info(f'Order Status: {order["result"]["order_status"]}, Pair: {pair}, Side: {order["result"]["side"]}, PairPrice: {df.iloc[-1]["Price"]}: OrderPrice: {recovery_trades[pair][1]["UnitPrice"]}, 2nd RecoveryOrder Condition Matched: {df.iloc[-1]["Price"] <= recovery_trades[pair][0]["UnitPrice"]}')
-            elif recovery_trades[pair][1]["Triggered"] and not recovery_trades[pair][2]["Triggered"]:
-                LOGGER.info(f'Order Status: {order["result"]["order_status"]}, Pair: {pair}, Side: {order["result"]["side"]}, PairPrice: {df.iloc[-1]["Price"]}: OrderPrice: {recovery_trades[pair][2]["UnitPrice"]}, 3rd RecoveryOrder Condition Matched: {df.iloc[-1]["Price"] >= recovery_trades[pair][0]["UnitPrice"]}')
-
-            if (df.iloc[-1]['Price'] >= recovery_trades[pair][0]["UnitPrice"]) and (not recovery_trades[pair][0]["Triggered"]):
-                LOGGER.info(f'Placing the 1st recovery order: {recovery_trades[pair][0]["Side"]}')
-                print(f'Status: {order["result"]["order_status"]}')
-                # print(f"Switching TP/SL mode to Partial")
-                # tp_sl_mode = client.full_partial_position_tp_sl_switch(symbol=pair, tp_sl_mode="Partial")
-                # tp_sl_mode = json.loads(json.dumps(tp_sl_mode, indent=4))['result']
-                # print(f"TP/SL Mode: {tp_sl_mode}")
-                # print(f'Placing new buy limit order at price: {buy_price - buy_less}')
-                recovery_trades[pair][0]["Triggered"] = True
-                order_sell = client.place_active_order(
-                    symbol=pair,
-                    side=recovery_trades[pair][0]["Side"],
-                    order_type="Market",
-                    qty=recovery_trades[pair][0]["Units"],
-                    take_profit=recovery_trades[pair][0]["TP"],
-                    stop_loss=recovery_trades[pair][0]["SL"],
-                    time_in_force="GoodTillCancel",
-                    reduce_only=False,
-                    close_on_trigger=False
-                )
-                order_sell = json.loads(json.dumps(order_sell, indent=4))['result']
-                print(f'1st {recovery_trades[pair][0]["Side"]} RecoveryOrder has been placed: {order_sell}')
-            elif (df.iloc[-1]['Price'] <= recovery_trades[pair][1]["UnitPrice"]) and (recovery_trades[pair][0]["Triggered"] and not recovery_trades[pair][1]["Triggered"]):
-                LOGGER.info(f'Placing the 2nd recovery order: {recovery_trades[pair][0]["Side"]}')
-                recovery_trades[pair][1]["Triggered"] = True
-                order_sell = client.place_active_order(
-                    symbol=pair,
-                    side=recovery_trades[pair][1]["Side"],
-                    order_type="Market",
-                    qty=recovery_trades[pair][1]["Units"],
-                    take_profit=recovery_trades[pair][1]["TP"],
-                    stop_loss=recovery_trades[pair][1]["SL"],
-                    time_in_force="GoodTillCancel",
-                    reduce_only=False,
-                    close_on_trigger=False
-                )
-                order_sell = json.loads(json.dumps(order_sell, indent=4))['result']
-                print(f'2nd {recovery_trades[pair][1]["Side"]} RecoveryOrder has been placed: {order_sell}')
-            elif (df.iloc[-1]['Price'] >= recovery_trades[pair][2]["UnitPrice"]) and (recovery_trades[pair][1]["Triggered"] and not recovery_trades[pair][2]["Triggered"]):
-                LOGGER.info(f'Placing the 3rd recovery order: {recovery_trades[pair][0]["Side"]}')
-                recovery_trades[pair][2]["Triggered"] = True
-                order_sell = client.place_active_order(
-                    symbol=pair,
-                    side=recovery_trades[pair][2]["Side"],
-                    order_type="Market",
-                    qty=recovery_trades[pair][2]["Units"],
-                    take_profit=recovery_trades[pair][2]["TP"],
-                    stop_loss=recovery_trades[pair][2]["SL"],
-                    time_in_force="GoodTillCancel",
-                    reduce_only=False,
-                    close_on_trigger=False
-                )
-                order_sell = json.loads(json.dumps(order_sell, indent=4))['result']
-                print(f'3rd {recovery_trades[pair][2]["Side"]} RecoveryOrder has been placed: {order_sell}')
-
-
-def handle_trade(msg):
-    trade_data = msg["data"][0]
-    print(f'Trade Data: {msg}')
-    # trade_data = json.loads(json.dumps(msg, indent=4))["data"][0]
-    df = pd.DataFrame([trade_data])
-    df = df.loc[:, ['symbol', 'price']]
-    df.columns = ['Symbol', 'Price']
-    df["Price"] = df["Price"].astype(float)
-    # df["Time"] = pd.to_datetime(df["Time"])
-    file_path = str(PROJECT_ROOT / f'{trade_data["symbol"]}.csv')
-    df.to_csv(file_path, index=False)
-    # if not os.path.isfile(file_path):
-    #     data_frame.to_csv(file_path, index=False)
-    # else:  # else if exists so append without writing the header
-    #     data_frame.to_csv(file_path, mode='a', header=False, index=False)
-
-
-def handle_orderbook25(msg):
-    trade_data = msg["data"][0]
-    # trade_data = json.loads(json.dumps(msg, indent=4))["data"][0]
-    # print(f'OrderBook Data: {trade_data}')
-    df = pd.DataFrame([trade_data])
-    df = df.loc[:, ['symbol', 'price']]
-    df.columns = ['Symbol', 'Price']
-    df["Price"] = df["Price"].astype(float)
-    # df["Time"] = pd.to_datetime(df["Time"])
-    file_path = str(PROJECT_ROOT / f'{trade_data["symbol"]}.csv')
-    df.to_csv(file_path, index=False)
-    # if not os.path.isfile(file_path):
-    #     data_frame.to_csv(file_path, index=False)
-    # else:  # else if exists so append without writing the header
-    #     data_frame.to_csv(file_path, mode='a', header=False, index=False)
-
-
-def handle_kline(msg):
-    symbol = str(msg["topic"]).split('.')[-1]
-    price = msg["data"][0]["close"]
-    trade_data = {"Symbol": symbol, "Price": price}
-    # trade_data = json.loads(json.dumps(trade_data, indent=4))["data"][0]
-    print(f'Kline Data: {trade_data}')
-    df = pd.DataFrame([trade_data])
-    # df = df.loc[:, ['symbol', 'price']]
-    # df.columns = ['Symbol', 'Price']
-    df["Price"] = df["Price"].astype(float)
-    # df["Time"] = pd.to_datetime(df["Time"])
-    file_path = str(PROJECT_ROOT / f'{trade_data["Symbol"]}.csv')
-    df.to_csv(file_path, index=False)
-    # if not os.path.isfile(file_path):
-    #     data_frame.to_csv(file_path, index=False)
-    # else:  # else if exists so append without writing the header
-    #     data_frame.to_csv(file_path, mode='a', header=False, index=False)
-
-
-# Check on your order and position through WebSocket.
-def handle_order(msg):
-    LOGGER.info(f'Order Status changed: {msg}')
-    order = json.loads(json.dumps(msg, indent=4))
-    if order["data"][0]["order_status"] == "Cancelled":
-        LOGGER.info(f'Order has been cancelled, returning from handle_order')
-        return
-    # Handle each recovery order in a separate thread
-    Thread(target=handle_recovery_order, args=[order]).start()
-
-
-# Check on your order and position through WebSocket.
-def handle_position(msg):
-    order = json.loads(json.dumps(msg, indent=4))
-    LOGGER.info(f'Setting Leverage {leverage} for: {order["data"][0]["symbol"]}')
-    client.set_leverage(symbol=order["data"][0]["symbol"], buy_leverage=leverage, sell_leverage=leverage)
-    LOGGER.info(f'Leverage {leverage} has been set for: {order["data"][0]["symbol"]}')
-
-
-# Subscribe to the execution topics
-def get_connected(pair="BTCUSDT"):
-    # Subscribe to the topics
-    # ws.trade_stream(callback=handle_trade, symbol=pair)
-    ws.orderbook_25_stream(callback=handle_orderbook25, symbol=pair)
-    # ws.kline_stream(handle_kline, symbol=pair, interval='1')
-    # ws.order_stream(handle_order)
-    # ws.position_stream(handle_position)
-    # print(f'Websocket Market connected: {pair}')
-
-
-if not websocket_connected:
-    # ws.order_stream(handle_order)
-    print(f'Websocket connected')
-    # Thread(target=get_connected, args=[pair]).start()
-    # Start WebSocket for each pair in a separate thread
-    [Thread(target=get_connected, args=[p]).start() for p in settings["Pairs"]]
-    # get_connected(pair=pair)
-    websocket_connected = True
+# Cached balance snapshot from the engine: {"balance", "updated", "age"}
+def get_account_balance():
+    try:
+        return engine.call("balance")
+    except (EngineUnavailable, EngineError) as e:
+        # The page renders without a balance, e.g. when the engine couldn't read it yet
+        LOGGER.warning(f'Account balance unavailable: {e}')
+        return None
 
 
 @csrf_exempt
 def trades(request):
-    account_balance = client.get_wallet_balance(coin='USDT')["result"]["USDT"]["wallet_balance"]
+    # Alerts posted here as JSON go through the signal webhook
+    if request.method == 'POST' and request.content_type not in ("application/x-www-form-urlencoded", "multipart/form-data"):
+        return signal_webhook(request)
+    account_balance = get_account_balance()
     # account_balance = 50000
-    settings = get_settings()["Settings"]
+    # One immutable snapshot of Settings.json for the whole request
+    settings = SETTINGS.get()
+    start_units = settings.start_units
+    tp_sl_ticks = settings.tp_sl_ticks
     if request.method == 'POST':
         if "placeorder" in request.POST:
             print(f'REQUEST METHOD: {request.method}, DATA: {request.POST}')
@@ -376,134 +57,32 @@ def trades(request):
             tp_sl_ticks = float(request.POST["TPSLTicks"])
             zone_divider = float(request.POST["ZoneDivider"])
             tick_price = float(request.POST["TickPrice"])
-            leverage = float(request.POST["Leverage"])
-            tp_l, tp_s, sl_l, sl_s = get_tp_sl(unit_price, tp_sl_ticks, tick_price)
-            if "Buy" in str(request.POST):
-                recovery_trades[pair] = [{"Side": "Sell", "Triggered": False, "UnitPrice": round(unit_price - (recovery_zone_ticks * tick_price), 2), "Units": round(start_units * base_times1, 2), "TP": tp_s, "SL": sl_s},
-                                         {"Side": "Buy", "Triggered": False, "UnitPrice": unit_price, "Units": start_units * base_times2, "TP": tp_l, "SL": sl_l},
-                                         {"Side": "Sell", "Triggered": False, "UnitPrice": round(unit_price - (recovery_zone_ticks * tick_price), 2), "Units": round(start_units * base_times3, 2), "TP": tp_s, "SL": sl_s}]
-                LOGGER.info(f'Recovery Trades Dictionary {recovery_trades}')
-                order = client.place_active_order(
-                    symbol=pair,
-                    side=side,
-                    order_type="Market",
-                    qty=start_units,
-                    take_profit=tp_l,
-                    stop_loss=sl_l,
-                    time_in_force="GoodTillCancel",
-                    reduce_only=False,
-                    close_on_trigger=False
-                )
-                order = json.loads(json.dumps(order, indent=4))["result"]
-                order = {"order_id": order["order_id"], "Pair": order["symbol"], "side": order["side"],
-                         "order_type": order["order_type"], "price": order["price"],
-                         "qty": order["qty"], "order_status": order["order_status"],
-                         "TP": order["take_profit"], "SL": order["stop_loss"],
-                         "created_time": pd.to_datetime(order["created_time"])
-                         }
-                LOGGER.info(f"Buy order has been placed: {order}")
-                Thread(target=handle_recovery_order, args=[order]).start()
-                return render(request, 'trades.html', {"account_balance": account_balance, "settings": settings, "order": order})
-            elif "Sell" in str(request.POST):
-                recovery_trades[pair] = [
-                    {"Side": "Buy", "Triggered": False, "UnitPrice": round(unit_price + (recovery_zone_ticks * tick_price), 2),
-                     "Units": round(start_units * base_times1, 2), "TP": tp_l, "SL": sl_l},
-                    {"Side": "Sell", "Triggered": False, "UnitPrice": unit_price, "Units": round(start_units * base_times2, 2), "TP": tp_s,
-                     "SL": sl_s},
-                    {"Side": "Buy", "Triggered": False, "UnitPrice": round(unit_price + (recovery_zone_ticks * tick_price), 2),
-                     "Units": round(start_units * base_times3, 2), "TP": tp_l, "SL": sl_l}]
-                order = client.place_active_order(
-                    symbol=pair,
-                    side=side,
-                    order_type="Market",
-                    qty=start_units,
-                    take_profit=tp_s,
-                    stop_loss=sl_s,
-                    time_in_force="GoodTillCancel",
-                    reduce_only=False,
-                    close_on_trigger=False
-                )
-                order = json.loads(json.dumps(order, indent=4))["result"]
-                order = {"order_id": order["order_id"], "Pair": order["symbol"], "side": order["side"],
-                         "order_type": order["order_type"], "price": order["price"],
-                         "qty": order["qty"], "order_status": order["order_status"],
-                         "TP": order["take_profit"], "SL": order["stop_loss"],
-                         "created_time": pd.to_datetime(order["created_time"])
-                         }
-                LOGGER.info(f"Sell order has been placed: {order}")
-                Thread(target=handle_recovery_order, args=[order]).start()
+            # The leverage of the pairs is kept at settings.leverage by the engine
+            if side in (BUY, SELL):
+                # Prices and units on the pair's grid, so the exchange takes the orders as they are
+                instrument = Instrument(**engine.call("instrument", symbol=pair))
+                qty = instrument.round_qty(start_units)
+                take_profit, stop_loss = order_tp_sl(side, unit_price, tp_sl_ticks, tick_price, zone_divider, instrument)
+                legs = build_legs(side, unit_price, qty, tp_sl_ticks, tick_price, zone_divider,
+                                  settings.base_times, settings.zone_offsets, instrument)
+                LOGGER.info(f'Recovery Trades Dictionary {legs}')
+                order = engine.call("place_order", order={
+                    "symbol": pair,
+                    "side": side,
+                    "order_type": "Market",
+                    "qty": qty,
+                    "take_profit": take_profit,
+                    "stop_loss": stop_loss,
+                    "time_in_force": "GoodTillCancel",
+                    "reduce_only": False,
+                    "close_on_trigger": False
+                }, legs=legs)
+                order["created_time"] = pd.to_datetime(order["created_time"])
+                LOGGER.info(f"{side} order has been placed: {order}")
                 return render(request, 'trades.html', {"account_balance": account_balance, "settings": settings, "order": order})
-        elif "Buy" in request.body.decode(encoding="utf-8"):
-            print(f'RequestBody: {request.body.decode(encoding="utf-8")}, {type(request.body.decode(encoding="utf-8"))}')
-            print(f'REQUEST METHOD: {request.method}, DATA: {request.POST}----{request.body}')
-            request_data = json.loads(request.body.decode(encoding="utf-8"))
-            print(f"Account Balance: {account_balance}")
-            pair = request_data["Pair"]
-            side = request_data["Side"]
-            unit_price = float(request.POST["UnitPrice"])
-            tick_price = float(request.POST["TickPrice"])
-            tp_sl_ticks = float(request.POST["TPSLTicks"])
-            tp_l, tp_s, sl_l, sl_s = get_tp_sl(unit_price, tp_sl_ticks, tick_price)
-            recovery_trades[pair] = [{"Side": "Sell", "Triggered": False, "UnitPrice": round(unit_price - (recovery_zone_ticks * tick_price), 2), "Units": round(start_units * base_times1, 2), "TP": tp_s, "SL": sl_s},
-                                     {"Side": "Buy", "Triggered": False, "UnitPrice": unit_price, "Units": round(start_units * base_times2, 2), "TP": tp_l, "SL": sl_l},
-                                     {"Side": "Sell", "Triggered": False, "UnitPrice": round(unit_price - (recovery_zone_ticks * tick_price), 2), "Units": round(start_units * base_times3, 2), "TP": tp_s, "SL": sl_s}]
-            order = client.place_active_order(
-                symbol=pair,
-                side=side,
-                order_type="Market",
-                qty=start_units,
-                take_profit=tp_l,
-                stop_loss=sl_l,
-                time_in_force="GoodTillCancel",
-                reduce_only=False,
-                close_on_trigger=False
-            )
-            order = json.loads(json.dumps(order, indent=4))["result"]
-            order = {"order_id": order["order_id"], "Pair": order["symbol"], "side": order["side"],
-                     "order_type": order["order_type"], "price": order["price"],
-                     "qty": order["qty"], "order_status": order["order_status"],
-                     "TP": order["take_profit"], "SL": order["stop_loss"],
-                     "created_time": pd.to_datetime(order["created_time"])
-                     }
-            LOGGER.info(f"Buy order has been placed: {order}")
-            Thread(target=handle_recovery_order, args=[order]).start()
-            return render(request, 'trades.html', {"account_balance": account_balance, "settings": settings, "order": order})
-        elif "Sell" in request.body.decode(encoding="utf-8"):
-            request_data = json.loads(request.body.decode(encoding="utf-8"))
-            print(f'REQUEST METHOD: {request.method}, DATA: {request_data}')
-            print(f"Account Balance: {account_balance}")
-            pair = request_data["Pair"]
-            side = request_data["Side"]
-            unit_price = request.POST["UnitPrice"]
-            tick_price = request.POST["TickPrice"]
-            tp_l, tp_s, sl_l, sl_s = get_tp_sl(unit_price, tp_sl_ticks, tick_price)
-            recovery_trades[pair] = [{"Side": "Buy", "Triggered": False, "UnitPrice": round(unit_price + (recovery_zone_ticks * tick_price), 2), "Units": round(start_units * base_times1, 2), "TP": tp_l, "SL": sl_l},
-                                     {"Side": "Sell", "Triggered": False, "UnitPrice": unit_price, "Units": round(start_units * base_times2, 2), "TP": tp_s, "SL": sl_s},
-                                     {"Side": "Buy", "Triggered": False, "UnitPrice": round(unit_price + (recovery_zone_ticks * tick_price), 2), "Units": round(start_units * base_times3, 2), "TP": tp_l, "SL": sl_l}]
-            order = client.place_active_order(
-                symbol=pair,
-                side=side,
-                order_type="Market",
-                qty=start_units,
-                take_profit=tp_s,
-                stop_loss=sl_s,
-                time_in_force="GoodTillCancel",
-                reduce_only=False,
-                close_on_trigger=False
-            )
-            order = json.loads(json.dumps(order, indent=4))["result"]
-            order = {"order_id": order["order_id"], "Pair": order["symbol"], "side": order["side"],
-                     "order_type": order["order_type"], "price": order["price"],
-                     "qty": order["qty"], "order_status": order["order_status"],
-                     "TP": order["take_profit"], "SL": order["stop_loss"],
-                     "created_time": pd.to_datetime(order["created_time"])
-                     }
-            LOGGER.info(f"Sell order has been placed: {order}")
-            Thread(target=handle_recovery_order, args=[order]).start()
-            return render(request, 'trades.html', {"account_balance": account_balance, "settings": settings, "order": order})
         elif "updatesettings" in str(request.POST):
             print(f'REQUEST METHOD: {request.method}, DATA: {request.POST}')
-            settings = get_settings()["Settings"]
+            settings = settings.to_dict()
             # Remove Pairs
             [settings["Pairs"].remove(p) for p in settings["Pairs"] if request.POST[p] == ""]
             if request.POST["AddPair"] != "":
@@ -515,24 +94,20 @@ def trades(request):
             settings["Leverage"] = float(request.POST["Leverage"])
             update_settings(settings=settings)
             return render(request, 'trades.html', {"account_balance": account_balance, "settings": settings})
-        # Get trades data
+        # Get trades data: one page of the local fill store, which the engine keeps in sync
         elif "gettrades" in request.POST:
             pair = request.POST["Pair"]
             print(f'REQUEST METHOD: {request.method}, DATA: {request.POST}')
-            user_trades = client.user_trade_records(symbol=pair)
-            user_trades = json.loads(json.dumps(user_trades, indent=4))["result"]["data"]
-            user_trades = [
-                {"Order No": i, "Order ID": trade["order_id"], "Pair": trade["symbol"], "Side": trade["side"],
-                 "Order Type": trade["order_type"], "Price": trade["price"], "Quantity": trade["order_qty"],
-                 "Trade Time": pd.to_datetime(trade["trade_time_ms"], unit="ms")
-                 } for i, trade in enumerate(user_trades)]
+            trades_filter = {"Pair": pair, "From": request.POST.get("From", ""), "To": request.POST.get("To", "")}
+            user_trades, page = fills_page(pair, trades_filter["From"], trades_filter["To"], request.POST.get("Page", 1))
             # LOGGER.info(f'User trades {pair}: {user_trades}')
-            return render(request, "trades.html", context={"account_balance": account_balance, "settings": settings, "trades": user_trades})
+            return render(request, "trades.html", context={"account_balance": account_balance, "settings": settings, "trades": user_trades,
+                                                           "trades_page": page, "trades_filter": trades_filter})
         # Get active orders
         elif "getorders" in request.POST:
             pair = request.POST["Pair"]
             print(f'REQUEST METHOD: {request.method}, DATA: {request.POST}')
-            user_orders = client.query_active_order(symbol=pair)
+            user_orders = engine.call("query_active_order", symbol=pair)
             print(f'ORDERS: {user_orders}')
             if user_orders["result"]:
                 user_orders = json.loads(json.dumps(user_orders, indent=4))["result"]
@@ -549,24 +124,17 @@ def trades(request):
         elif "cancelorders" in request.POST:
             pair = request.POST["Pair"]
             print(f'REQUEST METHOD: {request.method}, DATA: {request.POST}')
-            user_orders = client.query_active_order(symbol=pair)
-            if user_orders["result"]:
-                print(f'Cancelling active orders')
-                client.cancel_all_active_orders(symbol=pair)
-                client.cancel_all_conditional_orders(symbol=pair)
-                if client.my_position(symbol=pair):
-                    try:
-                        LOGGER.info(f'Closing Open Position: {pair}')
-                        client.close_position(symbol=pair)
-                    except:
-                        pass
-                return render(request, "trades.html", context={"account_balance": account_balance, "settings": settings})
+            engine.call("cancel_orders", pair=pair)
+            return render(request, "trades.html", context={"account_balance": account_balance, "settings": settings})
+        elif "flattenall" in request.POST:
+            results = engine.call("flatten")
+            LOGGER.info(f'Flattened all pairs: {results}')
             return render(request, "trades.html", context={"account_balance": account_balance, "settings": settings})
         elif "getpositions" in request.POST:
             pair = request.POST["Pair"]
             print(f'REQUEST METHOD: {request.method}, DATA: {request.POST}')
-            positions = client.my_position(symbol=pair)
-            positions = json.loads(json.dumps(positions, indent=4))["result"]
+            # Served from the engine's position cache
+            positions = engine.call("my_position", symbol=pair)["result"]
             positions = [
                 {"No": i, "Pair": order["symbol"], "Side": order["side"],
                  "Size": order["size"], "Position Value": order["position_value"], "Entry Price": order["entry_price"],
@@ -579,29 +147,98 @@ def trades(request):
     return render(request, 'trades.html', context={"account_balance": account_balance, "settings": settings})
 
 
+# Webhook for TradingView alerts: {"ID", "Pair", "Side", "UnitPrice"?, "StartUnits"?, "Secret"?}.
+# The body is validated here and handed to the engine's signal queue; the order is placed there, so
+# the response only waits for one local round trip. A signal ID seen before is acknowledged again
+# without a second order.
+@csrf_exempt
+def signal_webhook(request):
+    if request.method != 'POST':
+        return JsonResponse({"error": "POST a JSON signal"}, status=405)
+    try:
+        alert = parse_signal(request.body, SETTINGS.get())
+    except InvalidSignal as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    try:
+        status = engine.call("signal", signal=alert)
+    except (EngineUnavailable, EngineError) as e:
+        LOGGER.error(f'Signal {alert["ID"]} refused: {e}')
+        return JsonResponse({"id": alert["ID"], "status": "unavailable"}, status=503)
+    if status == FULL:
+        return JsonResponse({"id": alert["ID"], "status": status}, status=503)
+    return JsonResponse({"id": alert["ID"], "status": status}, status=202 if status == QUEUED else 200)
+
+
 # Create your views here.
 def index(request):
-    account_balance = client.get_wallet_balance(coin='USDT')["result"]["USDT"]["wallet_balance"]
+    account_balance = get_account_balance()
     # account_balance = 50000
     if request.method == 'POST' and "trades" in request.POST:
-        user_trades = client.user_trade_records(symbol='SOLUSDT')
-        # print(f'Trades: {trades}')
-        user_trades = json.loads(json.dumps(user_trades, indent=4))["result"]["data"]
-        user_trades = [
-            {"Order No": i, "Order ID": trade["order_id"], "Pair": trade["symbol"], "Side": trade["side"],
-             "Order Type": trade["order_type"], "Price": trade["price"], "Quantity": trade["order_qty"],
-             "Trade Time": pd.to_datetime(trade["trade_time_ms"], unit="ms")
-             } for i, trade in enumerate(user_trades)]
+        user_trades, page = fills_page('SOLUSDT')
         # print(f'User trades {symbol}: {user_trades}')
         return render(request, "index.html", context={"account_balance": account_balance, "trades": user_trades})
     return render(request, "index.html", context={"account_balance": account_balance})
 
 
+# Armed recovery sequences and tick-to-order latency of the recovery engine
+def recovery(request):
+    try:
+        return JsonResponse(engine.call("recovery_status"))
+    except EngineUnavailable as e:
+        return JsonResponse({"error": str(e)}, status=503)
+
+
+# Engine latency histograms in the Prometheus text format
+def metrics(request):
+    try:
+        text = engine.call("metrics")
+    except EngineUnavailable as e:
+        return HttpResponse(f'# {e}\n', content_type="text/plain; version=0.0.4", status=503)
+    return HttpResponse(text, content_type="text/plain; version=0.0.4")
+
+
+# Seconds a dashboard stream stays open; EventSource reconnects by itself and resumes from Last-Event-ID
+STREAM_SECONDS = 60
+
+
+# Server-sent events of the engine's live state (see dashboard.py): balance, prices, positions,
+# working orders and armed recovery legs. The first event has every section, the following ones
+# only the sections that changed. The stream long-polls the engine on its own connection, so an
+# open dashboard costs no exchange call.
+def dashboard_stream(request):
+    try:
+        since = int(request.headers.get("Last-Event-ID") or 0)
+    except ValueError:
+        since = 0
+
+    def events():
+        client = EngineClient("%s:%d" % engine.address, timeout=20)
+        deadline = time.monotonic() + STREAM_SECONDS
+        version = since
+        yield "retry: 1000\n\n"
+        try:
+            while (remaining := deadline - time.monotonic()) > 0:
+                update = client.call("dashboard", since=version, wait=min(15.0, remaining))
+                if update["version"] == version:
+                    yield ": keepalive\n\n"
+                    continue
+                version = update["version"]
+                yield f'id: {version}\nevent: update\ndata: {json.dumps(update["sections"], default=str)}\n\n'
+        except (EngineUnavailable, EngineError) as e:
+            yield f'retry: 5000\nevent: unavailable\ndata: {json.dumps(str(e))}\n\n'
+        finally:
+            client.close()
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+# Persisted recovery sequences, most recent first
 def db(request):
-    greeting = Greeting()
-    greeting.save()
-    greetings = Greeting.objects.all()
-    return render(request, "db.html", {"greetings": greetings})
+    sequences = RecoverySequence.objects.prefetch_related("legs").order_by("-created")[:100]
+    return render(request, "db.html", {"sequences": sequences})
 
 # git commit -m "Updated RecoveryZone Orders Handling"
 
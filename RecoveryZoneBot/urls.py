@@ -19,5 +19,9 @@ urlpatterns = [
     path("db/", Bot.views.db, name="db"),
     path("admin/", admin.site.urls),
     path("trades/", Bot.views.trades, name="trades"),
+    path("trades/stream", Bot.views.dashboard_stream, name="dashboard_stream"),
+    path("signal/", Bot.views.signal_webhook, name="signal"),
+    path("recovery/", Bot.views.recovery, name="recovery"),
+    path("metrics", Bot.views.metrics, name="metrics"),
     # path("cc/", Bot.views.cc, name="cc"),
 ]